@@ -1,4 +1,4 @@
-import React, { useState, useEffect, useCallback } from 'react';
+import React, { useState, useEffect, useCallback, useRef } from 'react';
 import { LogOut } from 'lucide-react';
 import { useAuth } from './hooks/useAuth';
 import { API_BASE_URL } from './config';
@@ -15,8 +15,13 @@ function App() {
     const [portfolioData, setPortfolioData] = useState(null);
     const [news, setNews] = useState([]);
     const [leaderboard, setLeaderboard] = useState([]);
+    const [userRank, setUserRank] = useState(null);
     const [tradeModal, setTradeModal] = useState({ isOpen: false, asset: null });
 
+    // The price poll below is set up once; it reads the signed-in user through this ref
+    const userRef = useRef(user);
+    userRef.current = user;
+
     const loadUserData = useCallback(async () => {
         if (!user) return;
 
@@ -62,7 +67,9 @@ function App() {
 
     const refreshPrices = async () => {
         try {
-            const response = await fetch(`${API_BASE_URL}/prices`);
+            // Quote tokens are issued per user, so only signed-in polls receive them
+            const query = userRef.current ? `?user_id=${userRef.current.userId}` : '';
+            const response = await fetch(`${API_BASE_URL}/prices${query}`);
             const result = await response.json();
 
             if (result.success) {
@@ -88,11 +95,13 @@ function App() {
 
     const refreshLeaderboard = async () => {
         try {
-            const response = await fetch(`${API_BASE_URL}/leaderboard`);
+            const query = user ? `?user_id=${user.userId}` : '';
+            const response = await fetch(`${API_BASE_URL}/leaderboard${query}`);
             const result = await response.json();
 
             if (result.success) {
                 setLeaderboard(result.data.leaderboard);
+                setUserRank(result.data.user_rank);
             }
         } catch (error) {
             console.error('Error fetching leaderboard:', error);
@@ -101,7 +110,9 @@ function App() {
 
     const handleTrade = (symbol, price) => {
         if (!user) return;
-        setTradeModal({ isOpen: true, asset: { symbol, price } });
+        // Keep the signed quote for the price shown, so the trade executes at that price
+        const quoteToken = prices[symbol]?.quote_token;
+        setTradeModal({ isOpen: true, asset: { symbol, price, quoteToken } });
     };
 
     const handleExecuteTrade = async (symbol, action, quantity) => {
@@ -117,7 +128,8 @@ function App() {
                 user_id: user.userId,
                 symbol: symbol,
                 action: action,
-                quantity: quantity
+                quantity: quantity,
+                quote_token: tradeModal.asset?.symbol === symbol ? tradeModal.asset.quoteToken : undefined
             })
         });
 
@@ -216,7 +228,7 @@ function App() {
 
                 <div className="grid grid-cols-1 gap-6">
                     <News articles={news} />
-                    <Leaderboard leaderboard={leaderboard} />
+                    <Leaderboard leaderboard={leaderboard} userRank={userRank} />
                 </div>
             </main>
 
@@ -1,7 +1,7 @@
 import React from 'react';
 import { Trophy } from 'lucide-react';
 
-const Leaderboard = ({ leaderboard }) => {
+const Leaderboard = ({ leaderboard, userRank }) => {
     if (!leaderboard || leaderboard.length === 0) {
         return (
             <div className="bg-gray-800 rounded-xl shadow-lg p-6">
@@ -33,6 +33,11 @@ const Leaderboard = ({ leaderboard }) => {
                 <Trophy className="w-6 h-6 mr-2" />
                 Leaderboard
             </h2>
+            {userRank && (
+                <p className="text-gray-300 mb-4">
+                    Your rank: <span className="text-white font-semibold">#{userRank.rank}</span> of {userRank.total_users}
+                </p>
+            )}
             <div className="overflow-x-auto">
                 <table className="w-full">
                     <thead>
@@ -2,9 +2,14 @@ import json
 import os
 import boto3
 from decimal import Decimal
-import time
-import uuid
 import base64
+from price_oracle import price_at
+from sim_cache import WindowUnavailable, get_current_oracle
+from quote_signing import quote_claim_item, verify_quote
+from order_book import OrderError, cancel_order, place_order
+from trade_ledger import (
+    MAX_BATCH_ORDERS, TradeAborted, TradeConflict, TradeRejected, execute_batch, execute_buy, execute_sell
+)
 
 dynamodb = boto3.resource('dynamodb')
 s3_client = boto3.client('s3')
@@ -12,6 +17,8 @@ s3_client = boto3.client('s3')
 def lambda_handler(event, context):
     """
     API endpoint to execute buy/sell trades.
+    Balance/share checks and the trade journal write are one conditional transaction
+    (see trade_ledger), so concurrent trades from the same user cannot lose updates.
     """
     users_table_name = os.environ['USERS_TABLE']
     trades_table_name = os.environ['TRADES_TABLE']
@@ -50,6 +57,15 @@ def lambda_handler(event, context):
 
         # Parse request body
         body = json.loads(event.get('body', '{}'))
+
+        # {"user_id": ..., "orders": [{"symbol", "action", "quantity"}, ...]} is a batch
+        if 'orders' in body:
+            return execute_batch_orders(body, username, users_table, trades_table, market_data_bucket)
+
+        # {"user_id": ..., "action": "cancel", "order_id": ...} cancels a resting limit/stop order
+        if body.get('action') == 'cancel':
+            return cancel_resting_order(body)
+
         user_id = body.get('user_id')
         symbol = body.get('symbol')
         action = body.get('action')  # 'buy' or 'sell'
@@ -65,126 +81,51 @@ def lambda_handler(event, context):
         if quantity <= 0:
             return error_response(400, 'Quantity must be positive')
 
-        # Get current price
-        try:
-            response = s3_client.get_object(
-                Bucket=market_data_bucket,
-                Key='simulated_data/latest_simulated_1sec.json'
-            )
-            simulated_data = json.loads(response['Body'].read().decode('utf-8'))
-
-            # Calculate current second within the 10-minute period (0-599)
-            from datetime import datetime
-            current_time = datetime.utcnow()
-            current_second = ((current_time.minute % 10) * 60) + current_time.second  # 0-599
-
-            if symbol not in simulated_data['assets'] or simulated_data['assets'][symbol] is None:
-                return error_response(404, f'Symbol {symbol} not found or unavailable')
-
-            asset_data = simulated_data['assets'][symbol]
+        # Limit and stop orders rest until a simulated window crosses their price
+        order_type = body.get('order_type', 'market')
+        if order_type != 'market':
+            return place_resting_order(body, user_id, symbol, action, quantity, order_type, market_data_bucket)
+
+        # A valid quote token from /prices fixes the price the user saw, no S3 read needed;
+        # the trade claims it, so each quote trades once
+        quote = verify_quote(body.get('quote_token'), symbol, user_id)
+        claims = []
+        if quote:
+            current_price = Decimal(quote['price'])
+            claims.append(quote_claim_item(trades_table, quote))
+        else:
+            try:
+                current_price = lookup_prices([symbol], market_data_bucket)[0].get(symbol)
+            except WindowUnavailable as e:
+                return error_response(503, f'Trading is paused until prices are simulated: {str(e)}')
+            except Exception as e:
+                return error_response(500, f'Error fetching price data: {str(e)}')
 
-            # Get the price for the current second
-            if 'seconds' in asset_data and current_second < len(asset_data['seconds']):
-                current_price = Decimal(str(asset_data['seconds'][current_second]['price']))
-            else:
-                # Fallback to last available price
-                current_price = Decimal(str(asset_data['seconds'][-1]['price']))
-        except Exception as e:
-            return error_response(500, f'Error fetching price data: {str(e)}')
+            if current_price is None:
+                return error_response(404, f'Symbol {symbol} not found or unavailable')
 
-        # Get user data
+        # Update the user and record the trade in one conditional transaction
         try:
-            user_response = users_table.get_item(Key={'user_id': user_id})
-
-            if 'Item' not in user_response:
-                # Create new user with initial balance
-                user_data = {
-                    'user_id': user_id,
-                    'username': username if username else user_id[:8],  # Use extracted username or truncated ID
-                    'balance': Decimal('100000'),  # Initial balance
-                    'portfolio': {},
-                    'total_trades': 0,
-                    'total_profit_loss': Decimal('0')
-                }
-                users_table.put_item(Item=user_data)
-            else:
-                user_data = user_response['Item']
-                # Update username if not set and we have one from token
-                if username and 'username' not in user_data:
-                    user_data['username'] = username
-
-        except Exception as e:
-            return error_response(500, f'Error fetching user data: {str(e)}')
-
-        # Calculate trade value
-        trade_value = current_price * Decimal(str(quantity))
-
-        # Execute trade logic
-        if action == 'buy':
-            # Check if user has enough balance
-            if user_data['balance'] < trade_value:
-                return error_response(400, f'Insufficient balance. Required: ${float(trade_value):.2f}, Available: ${float(user_data["balance"]):.2f}')
-
-            # Deduct balance
-            user_data['balance'] -= trade_value
-
-            # Add to portfolio
-            portfolio = user_data.get('portfolio', {})
-            if symbol in portfolio:
-                portfolio[symbol] = {
-                    'quantity': int(portfolio[symbol].get('quantity', 0)) + quantity,
-                    'avg_price': ((Decimal(str(portfolio[symbol].get('avg_price', 0))) * Decimal(str(portfolio[symbol].get('quantity', 0))) + trade_value) /
-                                  (Decimal(str(portfolio[symbol].get('quantity', 0))) + Decimal(str(quantity))))
-                }
+            if action == 'buy':
+                trade_record, new_balance = execute_buy(
+                    users_table, trades_table, user_id, symbol, quantity, current_price, username,
+                    extra_items=claims
+                )
             else:
-                portfolio[symbol] = {
-                    'quantity': quantity,
-                    'avg_price': current_price
-                }
-            user_data['portfolio'] = portfolio
-
-        elif action == 'sell':
-            # Check if user has enough shares
-            portfolio = user_data.get('portfolio', {})
-            if symbol not in portfolio or portfolio[symbol]['quantity'] < quantity:
-                available = portfolio.get(symbol, {}).get('quantity', 0)
-                return error_response(400, f'Insufficient shares. Required: {quantity}, Available: {available}')
-
-            # Add to balance
-            user_data['balance'] += trade_value
-
-            # Remove from portfolio
-            portfolio[symbol]['quantity'] -= quantity
-            if portfolio[symbol]['quantity'] == 0:
-                del portfolio[symbol]
-
-            user_data['portfolio'] = portfolio
-
-        # Update trade count
-        user_data['total_trades'] = int(user_data.get('total_trades', 0)) + 1
-
-        # Save updated user data
-        try:
-            users_table.put_item(Item=user_data)
+                trade_record, new_balance = execute_sell(
+                    users_table, trades_table, user_id, symbol, quantity, current_price, username,
+                    extra_items=claims
+                )
+        except TradeRejected as e:
+            return error_response(400, str(e))
+        except TradeConflict as e:
+            return error_response(409, str(e))
+        except TradeAborted:
+            return error_response(409, 'This quote was already used, refresh prices and retry')
         except Exception as e:
-            return error_response(500, f'Error updating user data: {str(e)}')
-
-        # Record trade in trades table
-        trade_record = {
-            'trade_id': str(uuid.uuid4()),
-            'user_id': user_id,
-            'timestamp': int(time.time()),
-            'symbol': symbol,
-            'action': action,
-            'quantity': quantity,
-            'price': current_price,
-            'total_value': trade_value
-        }
+            return error_response(500, f'Error executing trade: {str(e)}')
 
-        try:
-            trades_table.put_item(Item=trade_record)
-        except Exception as e:
-            print(f"Warning: Failed to record trade: {str(e)}")
+        trade_value = trade_record['total_value']
 
         return {
             'statusCode': 200,
@@ -204,7 +145,8 @@ def lambda_handler(event, context):
                     'quantity': quantity,
                     'price': float(current_price),
                     'total_value': float(trade_value),
-                    'new_balance': float(user_data['balance'])
+                    # Sells are blind updates, so only buys know the resulting balance
+                    'new_balance': float(new_balance)
                 }
             }, default=decimal_default)
         }
@@ -214,6 +156,205 @@ def lambda_handler(event, context):
         return error_response(500, f'Internal server error: {str(e)}')
 
 
+def place_resting_order(body, user_id, symbol, action, quantity, order_type, market_data_bucket):
+    """
+    Store a limit order (limit_price) or stop order (stop_price). It is filled by the
+    simulator's settlement at the first simulated second that crosses the price.
+    """
+    orders_table_name = os.environ.get('ORDERS_TABLE')
+    if not orders_table_name:
+        return error_response(400, 'Limit and stop orders are not enabled')
+
+    trigger_price = body.get('limit_price' if order_type == 'limit' else 'stop_price')
+    if trigger_price is None:
+        return error_response(400, 'Limit orders need limit_price, stop orders need stop_price')
+
+    try:
+        if symbol not in lookup_prices([symbol], market_data_bucket)[0]:
+            return error_response(404, f'Symbol {symbol} not found or unavailable')
+    except WindowUnavailable as e:
+        return error_response(503, f'Trading is paused until prices are simulated: {str(e)}')
+    except Exception as e:
+        return error_response(500, f'Error fetching price data: {str(e)}')
+
+    try:
+        order = place_order(
+            dynamodb.Table(orders_table_name), user_id, symbol, action, quantity, order_type, trigger_price
+        )
+    except OrderError as e:
+        return error_response(400, str(e))
+    except Exception as e:
+        return error_response(500, f'Error placing order: {str(e)}')
+
+    return {
+        'statusCode': 200,
+        'headers': {
+            'Content-Type': 'application/json',
+            'Access-Control-Allow-Origin': '*',
+            'Access-Control-Allow-Headers': '*',
+            'Access-Control-Allow-Methods': 'POST, OPTIONS'
+        },
+        'body': json.dumps({
+            'success': True,
+            'message': f'{order_type.capitalize()} order placed: {action.upper()} {quantity} shares of {symbol} at ${float(order["trigger_price"]):.2f}',
+            'order': order
+        }, default=decimal_default)
+    }
+
+
+def cancel_resting_order(body):
+    """Cancel one of the user's open limit/stop orders"""
+    orders_table_name = os.environ.get('ORDERS_TABLE')
+    user_id = body.get('user_id')
+    order_id = body.get('order_id')
+
+    if not user_id or not order_id:
+        return error_response(400, 'Missing required fields: user_id, order_id')
+
+    if not orders_table_name:
+        return error_response(400, 'Limit and stop orders are not enabled')
+
+    try:
+        cancel_order(dynamodb.Table(orders_table_name), order_id, user_id)
+    except OrderError as e:
+        return error_response(404, str(e))
+    except Exception as e:
+        return error_response(500, f'Error cancelling order: {str(e)}')
+
+    return {
+        'statusCode': 200,
+        'headers': {
+            'Content-Type': 'application/json',
+            'Access-Control-Allow-Origin': '*',
+            'Access-Control-Allow-Headers': '*',
+            'Access-Control-Allow-Methods': 'POST, OPTIONS'
+        },
+        'body': json.dumps({
+            'success': True,
+            'message': f'Order {order_id} cancelled'
+        })
+    }
+
+
+def lookup_prices(symbols, market_data_bucket):
+    """
+    Current prices from the oracle for the window whose [start, end) contains now
+    (WindowUnavailable if it is not published). Only the oracle parameters are needed,
+    not the price arrays.
+    Returns ({symbol: Decimal} for the available symbols, current_second).
+    """
+    oracle, current_second = get_current_oracle(s3_client, market_data_bucket)
+
+    prices = {}
+    for symbol in symbols:
+        if symbol in oracle['assets'] and symbol not in prices:
+            # Get the price for the current second
+            prices[symbol] = Decimal(str(price_at(oracle, symbol, current_second)))
+    return prices, current_second
+
+
+def execute_batch_orders(body, username, users_table, trades_table, market_data_bucket):
+    """
+    Execute several orders for one user, all priced at the same second of the same
+    window and committed in a single transaction (all legs or none).
+    Each order may carry the quote_token /prices returned for its symbol.
+    """
+    user_id = body.get('user_id')
+    raw_orders = body.get('orders')
+
+    # Validate input
+    if not user_id or not isinstance(raw_orders, list) or not raw_orders:
+        return error_response(400, 'Missing required fields: user_id, orders')
+
+    if len(raw_orders) > MAX_BATCH_ORDERS:
+        return error_response(400, f'A batch can contain at most {MAX_BATCH_ORDERS} orders')
+
+    orders = []
+    for index, order in enumerate(raw_orders, start=1):
+        try:
+            symbol = order.get('symbol')
+            action = order.get('action')
+            quantity = int(order.get('quantity', 0))
+        except (AttributeError, TypeError, ValueError):
+            return error_response(400, f'Order {index}: symbol, action and quantity are required')
+
+        if not all([symbol, action, quantity]):
+            return error_response(400, f'Order {index}: symbol, action and quantity are required')
+
+        if action not in ['buy', 'sell']:
+            return error_response(400, f'Order {index}: Action must be either "buy" or "sell"')
+
+        if quantity <= 0:
+            return error_response(400, f'Order {index}: Quantity must be positive')
+
+        orders.append((symbol, action, quantity))
+
+    # Price every leg at one second of one window: the quotes the user saw if every
+    # leg carries a valid token from the same snapshot, otherwise a fresh lookup
+    quotes = [verify_quote(order.get('quote_token'), symbol, user_id)
+              for order, (symbol, _, _) in zip(raw_orders, orders)]
+    snapshots = {(quote['window'], quote['second']) for quote in quotes if quote}
+
+    claims = []
+    if all(quotes) and len(snapshots) == 1:
+        prices = {quote['symbol']: Decimal(quote['price']) for quote in quotes}
+        current_second = snapshots.pop()[1]
+        # Claim each quote once, so none of them can be traded on again
+        claims = [quote_claim_item(trades_table, quote)
+                  for quote in {quote['id']: quote for quote in quotes}.values()]
+    else:
+        try:
+            prices, current_second = lookup_prices([symbol for symbol, _, _ in orders], market_data_bucket)
+        except WindowUnavailable as e:
+            return error_response(503, f'Trading is paused until prices are simulated: {str(e)}')
+        except Exception as e:
+            return error_response(500, f'Error fetching price data: {str(e)}')
+
+        for symbol, _, _ in orders:
+            if symbol not in prices:
+                return error_response(404, f'Symbol {symbol} not found or unavailable')
+
+    try:
+        trade_records, new_balance = execute_batch(
+            users_table, trades_table, user_id, orders, prices, username, extra_items=claims
+        )
+    except TradeRejected as e:
+        return error_response(400, str(e))
+    except TradeConflict as e:
+        return error_response(409, str(e))
+    except TradeAborted:
+        return error_response(409, 'A quote in this batch was already used, refresh prices and retry')
+    except Exception as e:
+        return error_response(500, f'Error executing trades: {str(e)}')
+
+    return {
+        'statusCode': 200,
+        'headers': {
+            'Content-Type': 'application/json',
+            'Access-Control-Allow-Origin': '*',
+            'Access-Control-Allow-Headers': '*',
+            'Access-Control-Allow-Methods': 'POST, OPTIONS'
+        },
+        'body': json.dumps({
+            'success': True,
+            'message': f'Batch executed successfully: {len(trade_records)} orders',
+            'trades': [
+                {
+                    'trade_id': record['trade_id'],
+                    'symbol': record['symbol'],
+                    'action': record['action'],
+                    'quantity': record['quantity'],
+                    'price': float(record['price']),
+                    'total_value': float(record['total_value'])
+                }
+                for record in trade_records
+            ],
+            'second': current_second,
+            'new_balance': float(new_balance)
+        }, default=decimal_default)
+    }
+
+
 def error_response(status_code, message):
     """Helper function to return error responses"""
     return {
@@ -1,95 +1,72 @@
 import json
 import os
 import boto3
-from decimal import Decimal
+from leaderboard_store import ALL_TIME, PERIODS, read_top
+from leaderboard_overlay import load_overlay, live_users, merge_live
+from rank_index import lookup_rank
 
 dynamodb = boto3.resource('dynamodb')
 s3_client = boto3.client('s3')
 
+# Number of ranks returned
+LEADERBOARD_SIZE = int(os.environ.get('LEADERBOARD_SIZE', '100'))
+
+# Neighbours returned on each side of the requesting user by default
+AROUND_SIZE = 5
+
 def lambda_handler(event, context):
     """
     API endpoint to get leaderboard rankings based on total profit/loss.
+    Serves the latest snapshot published by leaderboard_ranker.
+    ?period=all_time (default), daily or hourly picks P/L since the account was
+    opened, or since the start of the current UTC day or hour.
+    With ?user_id=..., also returns that user's rank and the users around them
+    (?around=K on each side).
     """
-    users_table_name = os.environ['USERS_TABLE']
     leaderboard_table_name = os.environ['LEADERBOARD_TABLE']
-    market_data_bucket = os.environ.get('MARKET_DATA_BUCKET')
-
-    users_table = dynamodb.Table(users_table_name)
+    market_data_bucket = os.environ['MARKET_DATA_BUCKET']
     leaderboard_table = dynamodb.Table(leaderboard_table_name)
+    params = event.get('queryStringParameters') or {}
 
-    try:
-        # Get current prices for portfolio valuation
-        try:
-            response = s3_client.get_object(
-                Bucket=market_data_bucket,
-                Key='simulated_data/latest_simulated_1sec.json'
-            )
-            simulated_data = json.loads(response['Body'].read().decode('utf-8'))
-
-            # Calculate current second within the 10-minute period (0-599)
-            from datetime import datetime
-            current_time = datetime.utcnow()
-            current_second = ((current_time.minute % 10) * 60) + current_time.second  # 0-599
-        except Exception:
-            # If no price data available, proceed without it
-            simulated_data = None
-            current_second = 0
-
-        # Scan all users and calculate their total values
-        users_response = users_table.scan()
-        users = users_response.get('Items', [])
-
-        leaderboard_entries = []
-        initial_investment = Decimal('100000')
-
-        for user in users:
-            user_id = user['user_id']
-            username = user.get('username', user_id[:8])  # Use username or truncated user_id as fallback
-            balance = user.get('balance', Decimal('100000'))
-            portfolio = user.get('portfolio', {})
-            total_trades = user.get('total_trades', 0)
-
-            # Calculate portfolio value
-            portfolio_value = Decimal('0')
-            if simulated_data:
-                for symbol, holding in portfolio.items():
-                    if symbol in simulated_data['assets'] and simulated_data['assets'][symbol]:
-                        asset_data = simulated_data['assets'][symbol]
-
-                        # Get the price for the current second
-                        if 'seconds' in asset_data and current_second < len(asset_data['seconds']):
-                            current_price = Decimal(str(asset_data['seconds'][current_second]['price']))
-                        else:
-                            # Fallback to last available price
-                            current_price = Decimal(str(asset_data['seconds'][-1]['price']))
-
-                        quantity = Decimal(str(holding['quantity']))
-                        portfolio_value += current_price * quantity
-
-            total_value = balance + portfolio_value
-            profit_loss = total_value - initial_investment
-            profit_loss_percent = (profit_loss / initial_investment * 100) if initial_investment > 0 else Decimal('0')
+    period = params.get('period', ALL_TIME)
+    if period not in PERIODS:
+        return error_response(400, f'period must be one of: {", ".join(PERIODS)}')
 
-            leaderboard_entries.append({
-                'user_id': user_id,
-                'username': username,
-                'total_value': float(total_value),
-                'profit_loss': float(profit_loss),
-                'profit_loss_percent': float(profit_loss_percent),
-                'total_trades': int(total_trades),
-                'balance': float(balance),
-                'portfolio_value': float(portfolio_value)
-            })
-
-        # Sort by profit_loss descending
-        leaderboard_entries.sort(key=lambda x: x['profit_loss'], reverse=True)
-
-        # Add rank
-        for i, entry in enumerate(leaderboard_entries):
-            entry['rank'] = i + 1
-
-        # Limit to top 100
-        leaderboard_entries = leaderboard_entries[:100]
+    try:
+        # Rankings are precomputed by leaderboard_ranker; only the top N is read here,
+        # plus enough extra ranks to backfill users whose trades since moved them down
+        # (windowed periods are as fresh as the last full re-mark)
+        overlay = load_overlay(leaderboard_table, ALL_TIME) if period == ALL_TIME else None
+        extra = len((overlay or {}).get('users', {}))
+        pointer, items = read_top(leaderboard_table, period, LEADERBOARD_SIZE + extra)
+
+        leaderboard_entries = [
+            {
+                'rank': int(item['rank']),
+                'user_id': item['user_id'],
+                'username': item['username'],
+                'total_value': float(item['total_value']),
+                'profit_loss': float(item['profit_loss']),
+                'profit_loss_percent': float(item['profit_loss_percent']),
+                'total_trades': int(item['total_trades']),
+                'balance': float(item['balance']),
+                'portfolio_value': float(item['portfolio_value'])
+            }
+            for item in items
+        ]
+
+        # Apply trades made since the last full mark
+        live = live_users(overlay, int(pointer.get('marked_at', 0))) if pointer else {}
+        leaderboard_entries = merge_live(leaderboard_entries, live, LEADERBOARD_SIZE)
+        total_users = int(pointer['total_users']) + sum(1 for change in live.values() if change['new']) if pointer else 0
+
+        user_rank = None
+        if params.get('user_id'):
+            try:
+                around = int(params.get('around', AROUND_SIZE))
+            except ValueError:
+                return error_response(400, 'around must be an integer')
+            user_rank = lookup_rank(s3_client, market_data_bucket, period, params['user_id'], neighbours=around)
 
         return {
             'statusCode': 200,
@@ -102,23 +79,32 @@ def lambda_handler(event, context):
             'body': json.dumps({
                 'success': True,
                 'data': {
+                    'period': period,
+                    'period_start': int(pointer['period_start']) if pointer and 'period_start' in pointer else None,
                     'leaderboard': leaderboard_entries,
-                    'total_users': len(users)
+                    'total_users': total_users,
+                    'generated_at': pointer['generated_at'] if pointer else None,
+                    'user_rank': user_rank
                 },
-                'message': 'Leaderboard fetched successfully'
+                'message': 'Leaderboard fetched successfully' if pointer else 'Leaderboard not ranked yet'
             })
         }
 
     except Exception as e:
         print(f"Error: {str(e)}")
-        return {
-            'statusCode': 500,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps({
-                'success': False,
-                'message': f'Internal server error: {str(e)}'
-            })
-        }
+        return error_response(500, f'Internal server error: {str(e)}')
+
+
+def error_response(status_code, message):
+    """Helper function to return error responses"""
+    return {
+        'statusCode': status_code,
+        'headers': {
+            'Content-Type': 'application/json',
+            'Access-Control-Allow-Origin': '*'
+        },
+        'body': json.dumps({
+            'success': False,
+            'message': message
+        })
+    }
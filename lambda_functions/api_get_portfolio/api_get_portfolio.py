@@ -2,6 +2,10 @@ import json
 import os
 import boto3
 from decimal import Decimal
+from sim_cache import WindowUnavailable, get_current_window
+from leaderboard_store import ALL_TIME
+from rank_index import cached_rank
+from trade_ledger import INITIAL_BALANCE
 
 dynamodb = boto3.resource('dynamodb')
 s3_client = boto3.client('s3')
@@ -40,10 +44,10 @@ def lambda_handler(event, context):
                         'success': True,
                         'data': {
                             'user_id': user_id,
-                            'balance': 100000.0,
+                            'balance': float(INITIAL_BALANCE),
                             'portfolio': {},
                             'portfolio_value': 0.0,
-                            'total_value': 100000.0,
+                            'total_value': float(INITIAL_BALANCE),
                             'total_profit_loss': 0.0,
                             'total_profit_loss_percent': 0.0,
                             'positions': []
@@ -59,36 +63,28 @@ def lambda_handler(event, context):
 
         # Get current prices for portfolio valuation
         try:
-            response = s3_client.get_object(
-                Bucket=market_data_bucket,
-                Key='simulated_data/latest_simulated_1sec.json'
-            )
-            simulated_data = json.loads(response['Body'].read().decode('utf-8'))
-
-            # Calculate current second within the 10-minute period (0-599)
-            from datetime import datetime
-            current_time = datetime.utcnow()
-            current_second = ((current_time.minute % 10) * 60) + current_time.second  # 0-599
+            # Window whose [start, end) contains now, and the second within it (0-599)
+            window, current_second = get_current_window(s3_client, market_data_bucket)
 
+        except WindowUnavailable as e:
+            return error_response(503, f'No price data available yet: {str(e)}')
         except Exception as e:
             return error_response(500, f'Error fetching price data: {str(e)}')
 
         # Calculate portfolio value and positions
-        portfolio = user_data.get('portfolio', {})
+        # (positions emptied before sells removed them sit at quantity 0, so skip those)
+        portfolio = {
+            symbol: holding for symbol, holding in user_data.get('portfolio', {}).items()
+            if int(holding.get('quantity', 0)) > 0
+        }
         positions = []
         total_portfolio_value = Decimal('0')
         total_cost_basis = Decimal('0')
 
         for symbol, holding in portfolio.items():
-            if symbol in simulated_data['assets'] and simulated_data['assets'][symbol]:
-                asset_data = simulated_data['assets'][symbol]
-
-                # Get the price for the current second
-                if 'seconds' in asset_data and current_second < len(asset_data['seconds']):
-                    current_price = Decimal(str(asset_data['seconds'][current_second]['price']))
-                else:
-                    # Fallback to last available price
-                    current_price = Decimal(str(asset_data['seconds'][-1]['price']))
+            if window.asset(symbol) and window.has_prices(symbol):
+                # Get the price for the current second (falls back to last available price)
+                current_price = Decimal(str(window.price_at(symbol, current_second)))
                 quantity = Decimal(str(holding['quantity']))
                 avg_price = Decimal(str(holding['avg_price']))
 
@@ -112,11 +108,11 @@ def lambda_handler(event, context):
                 total_cost_basis += cost_basis
 
         # Calculate total account value
-        balance = user_data.get('balance', Decimal('100000'))
+        balance = user_data.get('balance', INITIAL_BALANCE)
         total_value = balance + total_portfolio_value
 
-        # Calculate overall P/L (assuming initial balance was 100000)
-        initial_investment = Decimal('100000')
+        # Calculate overall P/L against the balance every account starts with
+        initial_investment = INITIAL_BALANCE
         total_profit_loss = total_value - initial_investment
         total_profit_loss_percent = (total_profit_loss / initial_investment * 100) if initial_investment > 0 else Decimal('0')
 
@@ -128,9 +124,23 @@ def lambda_handler(event, context):
             'total_profit_loss': float(total_profit_loss),
             'total_profit_loss_percent': float(total_profit_loss_percent),
             'total_trades': int(user_data.get('total_trades', 0)),
-            'positions': sorted(positions, key=lambda x: x['market_value'], reverse=True)
+            'positions': sorted(positions, key=lambda x: x['market_value'], reverse=True),
+            'leaderboard_rank': None
         }
 
+        # Leaderboard standing from the ranker's last run (not available until it has ranked this user);
+        # cached per index version, as this endpoint is polled every second
+        try:
+            standing = cached_rank(s3_client, market_data_bucket, ALL_TIME, user_id)
+            if standing:
+                portfolio_data['leaderboard_rank'] = {
+                    'rank': standing['rank'],
+                    'total_users': standing['total_users'],
+                    'generated_at': standing['generated_at']
+                }
+        except Exception as e:
+            print(f"Error looking up leaderboard rank: {str(e)}")
+
         return {
             'statusCode': 200,
             'headers': {
@@ -2,34 +2,46 @@ import json
 import os
 import boto3
 from datetime import datetime
+from sim_cache import WindowUnavailable, get_current_window
+from quote_signing import sign_quote
+from activity import record_heartbeat, wake_pipeline
 
 s3_client = boto3.client('s3')
+lambda_client = boto3.client('lambda')
+
+# Functions started right away when the first player shows up after an idle spell
+WAKE_FUNCTIONS = [name for name in os.environ.get('PIPELINE_WAKE_FUNCTIONS', '').split(',') if name]
 
 def lambda_handler(event, context):
     """
     API endpoint to get current second's simulated prices for all assets.
     Returns the appropriate price from the pre-generated 600-price batch
-    based on the current second within the 10-minute period.
+    based on the current second within the window that contains now.
+    Doubles as the activity heartbeat that keeps the simulation pipeline running.
+    With ?user_id=, each current price carries a quote token that user can trade on.
     """
     market_data_bucket = os.environ['MARKET_DATA_BUCKET']
+    user_id = (event.get('queryStringParameters') or {}).get('user_id')
 
     try:
-        # Get latest simulated data (600 prices per asset, 10-minute period)
-        response = s3_client.get_object(
-            Bucket=market_data_bucket,
-            Key='simulated_data/latest_simulated_1sec.json'
-        )
-        simulated_data = json.loads(response['Body'].read().decode('utf-8'))
+        if record_heartbeat(s3_client, market_data_bucket):
+            wake_pipeline(lambda_client, WAKE_FUNCTIONS)
+    except Exception as e:
+        # Never fail a price request over the activity signal
+        print(f"Error recording heartbeat: {str(e)}")
 
-        # Calculate current second within the 10-minute period (0-599)
+    try:
+        # Get the simulated window (600 prices per asset) whose [start, end) contains now,
+        # and the current second within it (0-599)
         current_time = datetime.utcnow()
-        current_second = ((current_time.minute % 10) * 60) + current_time.second  # 0-599
+        window, current_second = get_current_window(s3_client, market_data_bucket)
+        simulated_data = window.header
 
         # Build response with current second's prices for all assets
         prices = {}
 
-        for symbol, asset_data in simulated_data['assets'].items():
-            if asset_data is None or 'seconds' not in asset_data:
+        for symbol, asset_data in window.assets.items():
+            if asset_data is None or not window.has_prices(symbol):
                 prices[symbol] = {
                     'error': 'No data available',
                     'current': None
@@ -37,34 +49,30 @@ def lambda_handler(event, context):
                 continue
 
             # Get the price for the current second
-            if current_second < len(asset_data['seconds']):
-                second_data = asset_data['seconds'][current_second]
-                prices[symbol] = {
-                    'current': second_data['price'],
-                    'timestamp': second_data['timestamp'],
-                    'datetime': second_data['datetime'],
-                    'second': second_data['second'],
-                    'period_high': asset_data.get('period_high', asset_data.get('hour_high')),
-                    'period_low': asset_data.get('period_low', asset_data.get('hour_low')),
-                    'hour_start': asset_data['start_price'],
-                    'hour_projected_end': asset_data['end_price'],
-                    'period_change_percent': asset_data.get('period_change_percent', asset_data.get('hour_change_percent'))
-                }
-            else:
-                # Fallback to last available price if current second is out of range
-                second_data = asset_data['seconds'][-1]
-                prices[symbol] = {
-                    'current': second_data['price'],
-                    'timestamp': second_data['timestamp'],
-                    'datetime': second_data['datetime'],
-                    'second': second_data['second'],
-                    'period_high': asset_data.get('period_high', asset_data.get('hour_high')),
-                    'period_low': asset_data.get('period_low', asset_data.get('hour_low')),
-                    'hour_start': asset_data['start_price'],
-                    'hour_projected_end': asset_data['end_price'],
-                    'period_change_percent': asset_data.get('period_change_percent', asset_data.get('hour_change_percent')),
-                    'note': 'Using last available second (simulation may be outdated)'
-                }
+            # (falls back to the last available second if out of range)
+            second_data = window.point(symbol, current_second)
+            prices[symbol] = {
+                'current': second_data['price'],
+                'timestamp': second_data['timestamp'],
+                'datetime': second_data['datetime'],
+                'second': second_data['second'],
+                'period_high': asset_data.get('period_high', asset_data.get('hour_high')),
+                'period_low': asset_data.get('period_low', asset_data.get('hour_low')),
+                'hour_start': asset_data['start_price'],
+                'hour_projected_end': asset_data['end_price'],
+                'period_change_percent': asset_data.get('period_change_percent', asset_data.get('hour_change_percent'))
+            }
+
+            if current_second >= window.num_seconds:
+                prices[symbol]['note'] = 'Using last available second (simulation may be outdated)'
+            elif user_id:
+                # Short-lived signed quote so the user's trade can execute at exactly this price
+                # (never for a stale price past the window's end)
+                quote_token = sign_quote(
+                    symbol, second_data['price'], window.start_timestamp, second_data['second'], user_id
+                )
+                if quote_token:
+                    prices[symbol]['quote_token'] = quote_token
 
         return {
             'statusCode': 200,
@@ -90,9 +98,9 @@ def lambda_handler(event, context):
             })
         }
 
-    except s3_client.exceptions.NoSuchKey:
+    except WindowUnavailable:
         return {
-            'statusCode': 404,
+            'statusCode': 503,
             'headers': {
                 'Content-Type': 'application/json',
                 'Access-Control-Allow-Origin': '*'
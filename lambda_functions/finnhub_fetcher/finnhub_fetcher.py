@@ -2,15 +2,150 @@ import json
 import os
 import boto3
 import requests
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 import time
 
 s3_client = boto3.client('s3')
 
+FINNHUB_BASE_URL = os.environ.get('FINNHUB_BASE_URL', 'https://finnhub.io/api/v1')
+
+# Finnhub free tier allows 60 calls/minute. A bucket of BURST tokens refilled at
+# (budget - burst) per minute never exceeds the budget in any 60-second window.
+CALLS_PER_MINUTE = int(os.environ.get('FINNHUB_CALLS_PER_MINUTE', '60'))
+BURST = int(os.environ.get('FINNHUB_BURST', '10'))
+MAX_WORKERS = int(os.environ.get('FINNHUB_MAX_WORKERS', '4'))
+MAX_RETRIES = 3
+
+# Incremental mode: only request bars newer than the stored history
+LATEST_CANDLES_KEY = 'raw_data/latest_candles_1min.json'
+INCREMENTAL = os.environ.get('FINNHUB_INCREMENTAL', 'true').lower() == 'true'
+RETENTION_MINUTES = int(os.environ.get('CANDLE_RETENTION_MINUTES', '60'))
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket rate limiter.
+    Holds up to `capacity` tokens, refilled continuously at `rate` tokens per second.
+    On HTTP 429 call backoff(): every caller is paused and the refill rate is halved,
+    then it recovers gradually with each successful call.
+    """
+
+    def __init__(self, capacity, rate, clock=time.monotonic, sleep=time.sleep):
+        self.capacity = capacity
+        self.base_rate = rate
+        self.rate = rate
+        self.tokens = float(capacity)
+        self.blocked_until = 0.0
+        self._clock = clock
+        self._sleep = sleep
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        # No tokens accrue while paused, so calls resume at the reduced rate rather than in a burst
+        elapsed = now - max(self._updated, self.blocked_until)
+        if elapsed > 0:
+            self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+        self._updated = now
+
+    def acquire(self):
+        """Block until a token is available, then take it"""
+        while True:
+            with self._lock:
+                now = self._clock()
+                self._refill(now)
+                if now >= self.blocked_until and self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = max(self.blocked_until - now, (1 - self.tokens) / self.rate)
+            self._sleep(wait)
+
+    def backoff(self, seconds):
+        """Pause all callers for `seconds` and halve the refill rate"""
+        with self._lock:
+            now = self._clock()
+            self._refill(now)
+            self.tokens = 0.0
+            self.blocked_until = max(self.blocked_until, now + seconds)
+            self.rate = max(self.base_rate / 8, self.rate / 2)
+
+    def record_success(self):
+        """Recover the refill rate after a backoff"""
+        with self._lock:
+            if self.rate < self.base_rate:
+                self._refill(self._clock())
+                self.rate = min(self.base_rate, self.rate * 1.1)
+
+
+def fetch_candles(session, limiter, symbol, from_time, to_time, api_key):
+    """
+    Fetch 1-minute candles for one symbol under the shared rate limiter.
+    Retries on HTTP 429, honouring Retry-After. Returns the parsed Finnhub response.
+    """
+    # Finnhub candle endpoint
+    # resolution: 1, 5, 15, 30, 60, D, W, M
+    url = f"{FINNHUB_BASE_URL}/stock/candle"
+    params = {'symbol': symbol, 'resolution': 1, 'from': from_time, 'to': to_time, 'token': api_key}
+
+    for attempt in range(MAX_RETRIES + 1):
+        limiter.acquire()
+        response = session.get(url, params=params, timeout=15)
+
+        if response.status_code == 429 and attempt < MAX_RETRIES:
+            retry_after = response.headers.get('Retry-After')
+            delay = float(retry_after) if retry_after and retry_after.isdigit() else 2 ** attempt
+            print(f"Rate limited on {symbol}, backing off {delay:.0f}s")
+            limiter.backoff(delay)
+            continue
+
+        response.raise_for_status()
+        limiter.record_success()
+        return response.json()
+
+
+def merge_candles(stored, new, from_time):
+    """
+    Merge newly fetched candles into stored ones.
+    Deduplicates by timestamp (newer fetch wins, so a partial last bar is replaced),
+    drops bars older than from_time and returns them sorted by time.
+    """
+    merged = {c['timestamp']: c for c in stored}
+    for candle in new:
+        merged[candle['timestamp']] = candle
+    return [merged[t] for t in sorted(merged) if t >= from_time]
+
+
+def summarize_candles(candles):
+    """Window statistics stored alongside the candles (None if there are none)"""
+    if not candles:
+        return None
+
+    first_close = candles[0]['close']
+    last_close = candles[-1]['close']
+    hour_change = last_close - first_close
+    hour_change_pct = (hour_change / first_close * 100) if first_close != 0 else 0
+
+    return {
+        'data': candles,
+        'count': len(candles),
+        'first_price': first_close,
+        'last_price': last_close,
+        'hour_high': max(c['high'] for c in candles),
+        'hour_low': min(c['low'] for c in candles),
+        'hour_change': hour_change,
+        'hour_change_percent': hour_change_pct,
+        'avg_volume': sum(c['volume'] for c in candles) / len(candles)
+    }
+
+
 def lambda_handler(event, context):
     """
     Fetches 1-minute candle data for the last hour from Finnhub API.
-    Returns 60 data points (1 per minute) for each asset.
+    Only bars newer than the stored history are requested and merged into a
+    rolling window of CANDLE_RETENTION_MINUTES (60 data points by default).
+    Pass {"full_refresh": true} to re-download the whole window.
     This function is triggered by EventBridge every hour.
     """
     finnhub_api_key = os.environ['FINNHUB_API_KEY']
@@ -18,12 +153,25 @@ def lambda_handler(event, context):
     assets_to_track = json.loads(os.environ['ASSETS_TO_TRACK'])
 
     current_time = int(time.time())
-    # Get last hour (60 minutes)
-    from_time = current_time - (60 * 60)
+    # Keep a rolling window (default: last hour, 60 minutes)
+    from_time = current_time - (RETENTION_MINUTES * 60)
 
     date_str = datetime.utcnow().strftime('%Y-%m-%d')
     time_str = datetime.utcnow().strftime('%H-%M-%S')
 
+    # Load stored history so only bars newer than the last stored one are requested
+    stored_candles = {}
+    full_refresh = bool((event or {}).get('full_refresh')) or not INCREMENTAL
+    if not full_refresh:
+        try:
+            response = s3_client.get_object(Bucket=market_data_bucket, Key=LATEST_CANDLES_KEY)
+            stored_candles = json.loads(response['Body'].read().decode('utf-8')).get('candles', {})
+            print(f"Loaded stored candles for {len(stored_candles)} assets")
+        except s3_client.exceptions.NoSuchKey:
+            print("No stored candles found, fetching full window")
+        except Exception as e:
+            print(f"Error loading stored candles, fetching full window: {str(e)}")
+
     market_data = {
         'timestamp': current_time,
         'datetime': datetime.utcnow().isoformat(),
@@ -32,100 +180,102 @@ def lambda_handler(event, context):
         'resolution': '1',  # 1-minute bars
         'candles': {}
     }
+    new_bars = {}
+
+    # Ask each symbol only for bars from its last stored one (refreshing a possibly partial bar)
+    fetch_from = {}
+    for symbol in assets_to_track:
+        stored = (stored_candles.get(symbol) or {}).get('data') or []
+        last_timestamp = max((c['timestamp'] for c in stored), default=None)
+        fetch_from[symbol] = from_time if last_timestamp is None else max(from_time, last_timestamp)
 
     print(f"Fetching 1-minute candles for {len(assets_to_track)} assets...")
     print(f"Time range: {datetime.fromtimestamp(from_time).strftime('%H:%M')} - {datetime.fromtimestamp(current_time).strftime('%H:%M')}")
 
-    for symbol in assets_to_track:
+    limiter = TokenBucket(capacity=BURST, rate=max(CALLS_PER_MINUTE - BURST, 1) / 60)
+    session = requests.Session()
+
+    def fetch_one(symbol):
         try:
-            # Finnhub candle endpoint
-            # resolution: 1, 5, 15, 30, 60, D, W, M
-            url = f"https://finnhub.io/api/v1/stock/candle?symbol={symbol}&resolution=1&from={from_time}&to={current_time}&token={finnhub_api_key}"
-
-            response = requests.get(url, timeout=15)
-            response.raise_for_status()
-
-            data = response.json()
-
-            # Finnhub candle response: {s: "ok", c: [close], h: [high], l: [low], o: [open], v: [volume], t: [timestamp]}
-            if data.get('s') == 'ok' and 't' in data:
-                candles = []
-                for i in range(len(data['t'])):
-                    candle = {
-                        'timestamp': data['t'][i],
-                        'datetime': datetime.fromtimestamp(data['t'][i]).isoformat(),
-                        'open': data['o'][i],
-                        'high': data['h'][i],
-                        'low': data['l'][i],
-                        'close': data['c'][i],
-                        'volume': data['v'][i] if i < len(data.get('v', [])) else 0
-                    }
-                    candles.append(candle)
-
-                # Calculate statistics from the hour
-                if candles:
-                    closes = [c['close'] for c in candles]
-                    first_close = candles[0]['close']
-                    last_close = candles[-1]['close']
-                    hour_change = last_close - first_close
-                    hour_change_pct = (hour_change / first_close * 100) if first_close != 0 else 0
-
-                    market_data['candles'][symbol] = {
-                        'data': candles,
-                        'count': len(candles),
-                        'first_price': first_close,
-                        'last_price': last_close,
-                        'hour_high': max(c['high'] for c in candles),
-                        'hour_low': min(c['low'] for c in candles),
-                        'hour_change': hour_change,
-                        'hour_change_percent': hour_change_pct,
-                        'avg_volume': sum(c['volume'] for c in candles) / len(candles)
-                    }
-
-                    print(f"✓ {symbol}: {len(candles)} candles, ${last_close:.2f} ({hour_change_pct:+.2f}%)")
+            return symbol, fetch_candles(session, limiter, symbol, fetch_from[symbol], current_time, finnhub_api_key), None
+        except requests.exceptions.RequestException as e:
+            return symbol, None, f"Error fetching {symbol}: {str(e)}"
+        except Exception as e:
+            return symbol, None, f"Unexpected error for {symbol}: {str(e)}"
+
+    with ThreadPoolExecutor(max_workers=max(1, MAX_WORKERS)) as executor:
+        results = list(executor.map(fetch_one, assets_to_track))
+
+    for symbol, data, error in results:
+        stored = (stored_candles.get(symbol) or {}).get('data') or []
+        candles = []
+
+        if error:
+            print(error)
+        else:
+            try:
+                # Finnhub candle response: {s: "ok", c: [close], h: [high], l: [low], o: [open], v: [volume], t: [timestamp]}
+                if data.get('s') == 'ok' and 't' in data:
+                    for i in range(len(data['t'])):
+                        candle = {
+                            'timestamp': data['t'][i],
+                            'datetime': datetime.fromtimestamp(data['t'][i]).isoformat(),
+                            'open': data['o'][i],
+                            'high': data['h'][i],
+                            'low': data['l'][i],
+                            'close': data['c'][i],
+                            'volume': data['v'][i] if i < len(data.get('v', [])) else 0
+                        }
+                        candles.append(candle)
+                elif data.get('s') == 'no_data':
+                    print(f"✗ {symbol}: No new data available (market closed or invalid symbol)")
                 else:
-                    print(f"✗ {symbol}: No candles in response")
-                    market_data['candles'][symbol] = None
+                    print(f"✗ {symbol}: Unexpected response: {data.get('s', 'unknown')}")
+            except Exception as e:
+                print(f"Unexpected error for {symbol}: {str(e)}")
 
-            elif data.get('s') == 'no_data':
-                print(f"✗ {symbol}: No data available (market closed or invalid symbol)")
-                market_data['candles'][symbol] = None
-            else:
-                print(f"✗ {symbol}: Unexpected response: {data.get('s', 'unknown')}")
-                market_data['candles'][symbol] = None
+        new_bars[symbol] = candles
+        merged = merge_candles(stored, candles, from_time)
 
-            # Rate limiting - Finnhub free tier allows 60 calls/minute
-            time.sleep(1.1)
+        # Calculate statistics from the retained window
+        market_data['candles'][symbol] = summarize_candles(merged)
 
-        except requests.exceptions.RequestException as e:
-            print(f"Error fetching {symbol}: {str(e)}")
-            market_data['candles'][symbol] = None
-        except Exception as e:
-            print(f"Unexpected error for {symbol}: {str(e)}")
-            market_data['candles'][symbol] = None
+        if merged:
+            summary = market_data['candles'][symbol]
+            print(f"✓ {symbol}: {len(candles)} new / {len(merged)} candles, ${summary['last_price']:.2f} ({summary['hour_change_percent']:+.2f}%)")
+        else:
+            print(f"✗ {symbol}: No candles in window")
 
-    # Store raw market data in S3
+    # Store only the newly fetched bars in the dated archive
     s3_key = f"raw_data/{date_str}/{time_str}_candles_1min.json"
+    archive_data = {
+        'timestamp': current_time,
+        'datetime': market_data['datetime'],
+        'to_timestamp': current_time,
+        'resolution': '1',
+        'incremental': not full_refresh,
+        'candles': new_bars
+    }
 
     try:
         s3_client.put_object(
             Bucket=market_data_bucket,
             Key=s3_key,
-            Body=json.dumps(market_data, indent=2),
+            Body=json.dumps(archive_data, separators=(',', ':')),
             ContentType='application/json'
         )
-        print(f"Candle data saved to s3://{market_data_bucket}/{s3_key}")
+        print(f"New candles saved to s3://{market_data_bucket}/{s3_key}")
     except Exception as e:
         print(f"Error saving to S3: {str(e)}")
         raise
 
-    # Also store as "latest" for easy access
-    latest_key = "raw_data/latest_candles_1min.json"
+    # Also store the merged window as "latest" for easy access
+    latest_key = LATEST_CANDLES_KEY
     try:
         s3_client.put_object(
             Bucket=market_data_bucket,
             Key=latest_key,
-            Body=json.dumps(market_data, indent=2),
+            Body=json.dumps(market_data, separators=(',', ':')),
             ContentType='application/json'
         )
         print(f"Latest candle data updated at s3://{market_data_bucket}/{latest_key}")
@@ -133,6 +283,7 @@ def lambda_handler(event, context):
         print(f"Error updating latest data: {str(e)}")
 
     successful_fetches = len([c for c in market_data['candles'].values() if c is not None])
+    new_bar_count = sum(len(c) for c in new_bars.values())
 
     return {
         'statusCode': 200,
@@ -141,6 +292,7 @@ def lambda_handler(event, context):
             's3_key': s3_key,
             'assets_fetched': successful_fetches,
             'total_assets': len(assets_to_track),
+            'new_candles': new_bar_count,
             'time_range': f"{datetime.fromtimestamp(from_time).strftime('%H:%M')} - {datetime.fromtimestamp(current_time).strftime('%H:%M')}"
         })
     }
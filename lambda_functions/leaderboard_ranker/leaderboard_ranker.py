@@ -0,0 +1,139 @@
+import json
+import os
+import boto3
+import time
+from sim_cache import get_current_window
+from leaderboard_store import ALL_TIME, PERIODS, publish_snapshot
+from parallel_scan import parallel_scan
+from rank_index import write_rank_index
+from leaderboard_ranking import INITIAL_BALANCE, rank_valuation, value_users
+from equity_snapshots import baseline_equity, has_equity, load_equity, period_start, write_equity
+from activity import pipeline_idle
+
+dynamodb = boto3.resource('dynamodb')
+s3_client = boto3.client('s3')
+
+# How many ranks each snapshot stores (the API serves the top of these)
+SNAPSHOT_SIZE = int(os.environ.get('LEADERBOARD_SNAPSHOT_SIZE', '1000'))
+
+# Only what ranking needs is read from each user item
+USER_ATTRIBUTES = ['user_id', 'username', 'balance', 'portfolio', 'total_trades']
+
+
+def period_baseline(bucket, start, valuation):
+    """
+    Every user's equity at the start of a period. The first re-mark of a period
+    takes the snapshot (so everyone starts the period at 0 P/L); valuation must
+    include holdings at simulated prices.
+    """
+    records = load_equity(s3_client, bucket, start)
+    if records is None:
+        if write_equity(s3_client, bucket, start, valuation.user_ids, valuation.total_values):
+            return valuation.total_values
+        records = load_equity(s3_client, bucket, start)
+    return baseline_equity(records, valuation.user_ids, INITIAL_BALANCE)
+
+
+def take_baselines(users_table, bucket, pending, window, current_second):
+    """Only write the equity snapshots of newly started periods (nobody is online)"""
+    if window is None:
+        print("No active players and no price data - period baselines wait for prices")
+        return {
+            'statusCode': 200,
+            'body': json.dumps({'message': 'Leaderboard re-mark skipped: no price data', 'ranked_users': 0})
+        }
+
+    valuation = value_users(parallel_scan(users_table, USER_ATTRIBUTES), window, current_second)
+    for period, start in pending.items():
+        write_equity(s3_client, bucket, start, valuation.user_ids, valuation.total_values)
+    print(f"No active players - took the {', '.join(pending)} baseline(s) for {len(valuation)} users")
+
+    return {
+        'statusCode': 200,
+        'body': json.dumps({'message': 'Leaderboard re-mark skipped: no active players', 'ranked_users': 0,
+                            'baselines': list(pending)})
+    }
+
+
+def lambda_handler(event, context):
+    """
+    Ranks every user by profit/loss at the current simulated second, all-time and
+    since the start of the current day and hour, and publishes the top
+    LEADERBOARD_SNAPSHOT_SIZE of each as a new leaderboard snapshot, plus a rank
+    index of every user for rank-around-me lookups.
+    Triggered at every simulation window boundary by EventBridge; trades in between
+    are applied incrementally by leaderboard_updater. While nobody is online only
+    the equity snapshot of a newly started hour or day is taken.
+    """
+    users_table = dynamodb.Table(os.environ['USERS_TABLE'])
+    leaderboard_table = dynamodb.Table(os.environ['LEADERBOARD_TABLE'])
+    market_data_bucket = os.environ['MARKET_DATA_BUCKET']
+
+    started = time.time()
+    period_starts = {period: period_start(period, started) for period in PERIODS if period != ALL_TIME}
+
+    # Nobody is looking at the leaderboard: skip the full re-mark until someone is back,
+    # but still take the baseline of a period that just started
+    idle = pipeline_idle(s3_client, market_data_bucket)
+    pending = {}
+    if idle:
+        pending = {
+            period: start for period, start in period_starts.items()
+            if not has_equity(s3_client, market_data_bucket, start)
+        }
+        if not pending:
+            print("No active players - leaderboard re-mark skipped")
+            return {
+                'statusCode': 200,
+                'body': json.dumps({'message': 'Leaderboard re-mark skipped: no active players', 'ranked_users': 0})
+            }
+
+    try:
+        # Window whose [start, end) contains now, and the second within it (0-599)
+        window, current_second = get_current_window(s3_client, market_data_bucket)
+    except Exception as e:
+        # If no price data available, rank all-time on cash balances only
+        print(f"No price data available, ranking without portfolio values: {str(e)}")
+        window, current_second = None, 0
+
+    if idle:
+        return take_baselines(users_table, market_data_bucket, pending, window, current_second)
+
+    try:
+        valuation = value_users(parallel_scan(users_table, USER_ATTRIBUTES), window, current_second)
+
+        versions = {}
+        for period in PERIODS:
+            fields = None
+            baseline = None
+            if period != ALL_TIME:
+                if window is None:
+                    # A cash-only valuation would fix a wrong baseline for the whole period
+                    print(f"Skipping {period} ranking until prices are available")
+                    continue
+                # P/L since the period started, against the equity snapshot taken then
+                start = period_starts[period]
+                baseline = period_baseline(market_data_bucket, start, valuation)
+                fields = {'period_start': start}
+
+            entries, ranked = rank_valuation(valuation, SNAPSHOT_SIZE, baseline)
+            version = publish_snapshot(leaderboard_table, period, entries, len(ranked),
+                                       marked_at=started, fields=fields)
+
+            # Every user's rank, for rank lookups beyond the snapshot
+            write_rank_index(s3_client, market_data_bucket, period, version, ranked)
+            versions[period] = version
+    except Exception as e:
+        print(f"Error ranking users: {str(e)}")
+        raise
+
+    print(f"✅ Ranked {len(valuation)} users for {', '.join(versions)} in {time.time() - started:.2f}s")
+
+    return {
+        'statusCode': 200,
+        'body': json.dumps({
+            'message': 'Leaderboard ranked successfully',
+            'versions': versions,
+            'ranked_users': len(valuation)
+        })
+    }
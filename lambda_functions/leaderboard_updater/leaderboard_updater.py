@@ -0,0 +1,73 @@
+import json
+import os
+import boto3
+from boto3.dynamodb.types import TypeDeserializer
+from sim_cache import get_current_window
+from leaderboard_store import ALL_TIME
+from leaderboard_overlay import update_overlay
+from leaderboard_ranking import rank_users
+
+dynamodb = boto3.resource('dynamodb')
+s3_client = boto3.client('s3')
+deserializer = TypeDeserializer()
+
+
+def changed_users(records):
+    """{user_id: (user item, change time, created)} for the latest image of each changed user"""
+    users = {}
+    for record in records:
+        if record.get('eventName') not in ('INSERT', 'MODIFY'):
+            continue
+        image = record['dynamodb'].get('NewImage')
+        if not image:
+            continue
+
+        user = {name: deserializer.deserialize(value) for name, value in image.items()}
+        changed_at = float(record['dynamodb'].get('ApproximateCreationDateTime', 0))
+        created = record['eventName'] == 'INSERT' or (user['user_id'] in users and users[user['user_id']][2])
+        users[user['user_id']] = (user, changed_at, created)
+    return users
+
+
+def lambda_handler(event, context):
+    """
+    Applies trades to the live leaderboard between full re-marks.
+    Triggered by the users table stream: every trade (or order fill) rewrites the
+    user's balance and holdings, so only those users are revalued at the current
+    simulated second and written to their live leaderboard items.
+    """
+    leaderboard_table = dynamodb.Table(os.environ['LEADERBOARD_TABLE'])
+    market_data_bucket = os.environ['MARKET_DATA_BUCKET']
+
+    users = changed_users(event.get('Records', []))
+    if not users:
+        return {'statusCode': 200, 'body': json.dumps({'message': 'No user changes', 'users_updated': 0})}
+
+    try:
+        # Window whose [start, end) contains now, and the second within it (0-599)
+        window, current_second = get_current_window(s3_client, market_data_bucket)
+    except Exception as e:
+        # If no price data available, rank on cash balances only
+        print(f"No price data available, ranking without portfolio values: {str(e)}")
+        window, current_second = None, 0
+
+    entries, _ = rank_users((user for user, _, _ in users.values()), window, current_second, len(users))
+    changes = {
+        entry['user_id']: {
+            'entry': entry,
+            'updated_at': users[entry['user_id']][1],
+            'new': users[entry['user_id']][2]
+        }
+        for entry in entries
+    }
+
+    written = update_overlay(leaderboard_table, ALL_TIME, changes)
+    print(f"✅ Updated {written} users ({len(changes) - written} already had a newer change)")
+
+    return {
+        'statusCode': 200,
+        'body': json.dumps({
+            'message': 'Leaderboard updated successfully',
+            'users_updated': written
+        })
+    }
@@ -1,310 +1,473 @@
 import json
+import math
 import os
+import re
 import boto3
 from datetime import datetime
 import time
 import random
+from concurrent.futures import ThreadPoolExecutor
 from huggingface_hub import InferenceClient
+from sim_cache import get_current_window
+from price_history import load_history
+from article_pool import load_pool, draw_articles, add_articles, pool_shortfall
+from activity import pipeline_idle
 
 s3_client = boto3.client('s3')
 
-def generate_ai_news_with_huggingface(api_key, prompt):
+MODEL = "meta-llama/Llama-3.2-1B-Instruct"
+
+# Overall time budget for all model calls of one run (seconds)
+GENERATION_DEADLINE_SECONDS = float(os.environ.get('NEWS_GENERATION_DEADLINE_SECONDS', '20'))
+
+# Time kept back from the Lambda timeout for storing the news
+SAVE_MARGIN_SECONDS = 10
+
+GENERATION_WORKERS = 8
+
+# Most articles one pool refill generates, and the refill's time budget (seconds)
+REFILL_MAX_ARTICLES = int(os.environ.get('NEWS_REFILL_MAX_ARTICLES', '96'))
+REFILL_DEADLINE_SECONDS = float(os.environ.get('NEWS_REFILL_DEADLINE_SECONDS', '240'))
+
+_inference_clients = {}
+
+def get_inference_client(api_key, timeout=GENERATION_DEADLINE_SECONDS):
     """
-    Generate AI news using Hugging Face InferenceClient.
+    Hugging Face InferenceClient whose requests give up after timeout seconds (rounded
+    up), shared by every call with that timeout and kept across warm invocations,
+    so connections are reused instead of one client per call.
+    """
+    timeout = max(1, math.ceil(timeout))
+    client = _inference_clients.get((api_key, timeout))
+    if client is None:
+        client = InferenceClient(token=api_key, timeout=timeout)
+        _inference_clients[(api_key, timeout)] = client
+    return client
+
+
+def news_prompt(plan):
+    """One prompt asking for both the headline and the article as a JSON object"""
+    return (
+        f"Write a short, neutral {plan['headline_style']} (max 10 words) and a brief, neutral "
+        f"{plan['article_style']} (2-3 sentences) about {plan['topic']}. "
+        "Do not include specific numbers or percentages. "
+        'Reply with only a JSON object of the form {"headline": "...", "article": "..."}.'
+    )
+
+
+def generate_ai_news_with_huggingface(client, plan):
+    """
+    Generate the headline and article of one planned article in a single call.
     Uses Llama 3.2 1B Instruct model for fast, quality text generation.
+    Returns (headline, article); either is None if the model did not produce it.
     """
     try:
-        # Initialize client with API key (same as your working local code)
-        client = InferenceClient(token=api_key)
-
-        # Create chat messages - system prompt + user prompt for better quality
         messages = [
-            {"role": "user", "content": f"Write a brief, neutral financial news article (2-3 sentences) about: {prompt}. Do not include specific numbers or percentages."}
+            {"role": "user", "content": news_prompt(plan)}
         ]
 
         # Generate text using chat completion
         response = client.chat_completion(
             messages=messages,
-            model="meta-llama/Llama-3.2-1B-Instruct",
-            max_tokens=100,
+            model=MODEL,
+            max_tokens=160,
             temperature=0.7
         )
 
-        generated_text = response.choices[0].message.content.strip()
-
-        # Clean up - ensure it's concise (2-3 sentences)
-        sentences = generated_text.split('.')[:3]
-        clean_text = '. '.join(s.strip() for s in sentences if s.strip())
-        if clean_text and not clean_text.endswith('.'):
-            clean_text += '.'
-
-        return clean_text if clean_text else None
+        return parse_generated_news(response.choices[0].message.content)
 
     except Exception as e:
         print(f"Error calling Hugging Face API: {str(e)}")
-        return None
+        return None, None
 
 
-def generate_market_wide_news(movements, timestamp, api_key):
-    """
-    Generate market-wide news using Hugging Face AI, connected to a specific asset prediction.
-    """
-    # Currency pair mappings for better context
-    currency_info = {
-        'EURUSD=X': ('Euro', 'US Dollar', 'European Central Bank', 'Federal Reserve'),
-        'GBPUSD=X': ('British Pound', 'US Dollar', 'Bank of England', 'Federal Reserve'),
-        'USDJPY=X': ('US Dollar', 'Japanese Yen', 'Federal Reserve', 'Bank of Japan'),
-        'AUDUSD=X': ('Australian Dollar', 'US Dollar', 'Reserve Bank of Australia', 'Federal Reserve'),
-        'USDCAD=X': ('US Dollar', 'Canadian Dollar', 'Federal Reserve', 'Bank of Canada'),
-        'EURJPY=X': ('Euro', 'Japanese Yen', 'European Central Bank', 'Bank of Japan')
-    }
+# "headline": "..." pairs, tolerating a missing closing quote or brace
+FIELD_PATTERN = r'"?{field}"?\s*:\s*"((?:[^"\\]|\\.)*)"?'
 
-    # Pick a random asset to feature in the news
-    if movements:
-        featured_asset = random.choice(movements)
-        symbol = featured_asset['symbol']
-        predicted_change = featured_asset['future_change_percent']
-
-        if symbol in currency_info:
-            base_curr, quote_curr, base_bank, quote_bank = currency_info[symbol]
-
-            if predicted_change > 0:
-                topics = [
-                    f"how {base_bank} policy decisions could strengthen the {base_curr} against the {quote_curr}",
-                    f"economic factors that may boost the {base_curr} relative to the {quote_curr}",
-                    f"why market analysts expect the {base_curr} to gain ground against the {quote_curr}",
-                    f"developments suggesting upward momentum for the {base_curr} versus the {quote_curr}"
-                ]
-            else:
-                topics = [
-                    f"how {quote_bank} policy decisions could strengthen the {quote_curr} against the {base_curr}",
-                    f"economic factors that may weaken the {base_curr} relative to the {quote_curr}",
-                    f"why market analysts expect the {base_curr} to lose ground against the {quote_curr}",
-                    f"developments suggesting downward pressure on the {base_curr} versus the {quote_curr}"
-                ]
-        else:
-            topics = [
-                "central bank monetary policy and its impact on currency markets",
-                "global economic growth trends affecting forex trading"
-            ]
-    else:
-        topics = [
-            "central bank monetary policy and its impact on currency markets",
-            "global economic growth trends affecting forex trading"
-        ]
-
-    topic = random.choice(topics)
-    prompt = f"Write a brief, neutral financial news article (2-3 sentences) about {topic}. Do not include specific numbers or percentages."
+# Headline: ... / Article: ... sections
+SECTION_PATTERN = r'(?im)^\W*{field}\W*:\s*(.+?)(?=^\W*(?:headline|article|body)\W*:|\Z)'
 
-    article = generate_ai_news_with_huggingface(api_key, prompt)
 
-    if not article:
-        # Fallback to template if API fails
-        article = "Currency markets continue responding to evolving economic conditions. Traders are monitoring central bank policies and economic indicators for guidance on future exchange rate movements."
+def _clean_headline(text):
+    if not text:
+        return None
+    headline = text.strip().splitlines()[0].strip().strip('"\'*#').strip()
+    return headline if headline and len(headline) <= 100 else None
 
-    # Generate headline using AI
-    headline_prompt = f"Write a short, neutral news headline (max 10 words) about: {topic}"
-    headline = generate_ai_news_with_huggingface(api_key, headline_prompt)
 
-    if not headline or len(headline) > 100:
-        headline = "Currency Markets React to Economic Developments"
+def _clean_article(text):
+    if not text:
+        return None
+    # Clean up - ensure it's concise (2-3 sentences)
+    sentences = ' '.join(text.split()).split('.')[:3]
+    clean_text = '. '.join(s.strip() for s in sentences if s.strip())
+    if clean_text and not clean_text.endswith('.'):
+        clean_text += '.'
+    return clean_text if clean_text else None
+
+
+def _field(text, field, names=()):
+    """A field's raw value from JSON-like or "Field: value" output, or None"""
+    match = re.search(FIELD_PATTERN.format(field=field), text)
+    if match:
+        try:
+            return json.loads(f'"{match.group(1)}"')
+        except ValueError:
+            return match.group(1)
+    if '{' in text:
+        # JSON that lacks this field: its other fields are not sections
+        return None
 
-    return {
-        'headline': headline.strip(),
-        'article': article.strip(),
-        'category': 'market_wide',
-        'sentiment': 'neutral'
-    }
+    for name in (field,) + tuple(names):
+        match = re.search(SECTION_PATTERN.format(field=name), text, re.DOTALL)
+        if match:
+            return match.group(1)
+    return None
 
 
-def generate_sector_news(movements, timestamp, api_key):
+def parse_generated_news(text):
     """
-    Generate forex sector news using Hugging Face AI, connected to a specific asset prediction.
+    (headline, article) from model output. Well-formed JSON is used directly; otherwise
+    each field is recovered on its own from JSON-like or sectioned text, so a bad
+    headline does not cost the article (or the reverse). Missing fields are None.
     """
-    # Currency pair mappings
-    currency_info = {
-        'EURUSD=X': ('EUR/USD', 'Euro', 'US Dollar'),
-        'GBPUSD=X': ('GBP/USD', 'British Pound', 'US Dollar'),
-        'USDJPY=X': ('USD/JPY', 'US Dollar', 'Japanese Yen'),
-        'AUDUSD=X': ('AUD/USD', 'Australian Dollar', 'US Dollar'),
-        'USDCAD=X': ('USD/CAD', 'US Dollar', 'Canadian Dollar'),
-        'EURJPY=X': ('EUR/JPY', 'Euro', 'Japanese Yen')
-    }
-
-    # Pick a random asset to feature in the news
-    if movements:
-        featured_asset = random.choice(movements)
-        symbol = featured_asset['symbol']
-        predicted_change = featured_asset['future_change_percent']
-
-        if symbol in currency_info:
-            pair_name, base_curr, quote_curr = currency_info[symbol]
-            trend = "bullish" if predicted_change > 0 else "bearish"
-            direction = "rise" if predicted_change > 0 else "decline"
-
-            topics = [
-                f"why {pair_name} is showing {trend} signals as the {base_curr} prepares to {direction} against the {quote_curr}",
-                f"technical factors suggesting the {base_curr} could {direction} versus the {quote_curr}",
-                f"market sentiment turning {trend} on {pair_name} as traders anticipate {base_curr} movement",
-                f"trading patterns in {pair_name} indicating potential {direction} in the {base_curr}"
-            ]
-        else:
-            topics = [
-                "major currency pair trading activity in forex markets",
-                "emerging market currencies and their recent movements"
-            ]
-    else:
-        topics = [
-            "major currency pair trading activity in forex markets",
-            "emerging market currencies and their recent movements"
-        ]
+    text = (text or '').strip()
+    if not text:
+        return None, None
+
+    headline = article = None
+    start, end = text.find('{'), text.rfind('}')
+    if start != -1 and end > start:
+        try:
+            parsed = json.loads(text[start:end + 1])
+            if isinstance(parsed, dict):
+                headline = parsed.get('headline') if isinstance(parsed.get('headline'), str) else None
+                article = parsed.get('article') if isinstance(parsed.get('article'), str) else None
+        except ValueError:
+            pass
+
+    if headline is None:
+        headline = _field(text, 'headline', ('title',))
+    if article is None:
+        article = _field(text, 'article', ('body',))
+        if article is None and '{' not in text and headline is None:
+            # Plain prose: use it as the article
+            article = text
+
+    return _clean_headline(headline), _clean_article(article)
+
+
+def generate_texts(plans, api_key, deadline_seconds):
+    """
+    Run one headline-plus-article call per plan, concurrently. Each call's request
+    times out when the deadline passes, and calls still queued then are not made,
+    so every worker has finished (about) deadline_seconds later and none outlives
+    the invocation. Returns (headline, article) per plan; either is None if the
+    call failed, missed the deadline or lacked the field.
+    """
+    deadline = time.monotonic() + deadline_seconds
 
-    topic = random.choice(topics)
-    prompt = f"Write a brief, neutral forex market update (2-3 sentences) about {topic}. Do not include specific numbers or percentages."
+    def generate(plan):
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return None
+        return generate_ai_news_with_huggingface(get_inference_client(api_key, remaining), plan)
 
-    article = generate_ai_news_with_huggingface(api_key, prompt)
+    with ThreadPoolExecutor(max_workers=max(1, min(GENERATION_WORKERS, len(plans)))) as executor:
+        results = list(executor.map(generate, plans))
 
-    if not article:
-        article = "Currency pairs showed varying activity as traders assessed economic data. Major currencies continue responding to shifts in monetary policy expectations."
+    skipped = sum(1 for result in results if result is None)
+    if skipped:
+        print(f"{skipped} generation calls were not made before the {deadline_seconds:.1f}s deadline")
 
-    headline_prompt = f"Write a short, neutral forex news headline (max 10 words) about: {topic}"
-    headline = generate_ai_news_with_huggingface(api_key, headline_prompt)
+    return [result or (None, None) for result in results]
 
-    if not headline or len(headline) > 100:
-        headline = "Forex Markets Show Mixed Trading Patterns"
 
+def news_item(plan, headline, article):
+    """Article for publishing, with the plan's template text for any missing field"""
     return {
-        'headline': headline.strip(),
-        'article': article.strip(),
-        'category': 'sector',
-        'sentiment': 'neutral'
+        'headline': (headline or plan['headline_fallback']).strip(),
+        'article': (article or plan['article_fallback']).strip(),
+        'category': plan['category'],
+        'sentiment': plan['sentiment']
     }
 
 
-def generate_geopolitical_news(movements, timestamp, api_key):
+def generate_articles(plans, api_key, deadline_seconds):
     """
-    Generate geopolitical news using Hugging Face AI, connected to a specific asset prediction.
+    Generate the articles of plans under a deadline, falling back to each plan's
+    template text (per field) if the API fails or misses the deadline.
     """
-    # Currency pair mappings
-    currency_info = {
-        'EURUSD=X': ('EUR/USD', 'Euro', 'US Dollar', 'Eurozone', 'United States'),
-        'GBPUSD=X': ('GBP/USD', 'British Pound', 'US Dollar', 'United Kingdom', 'United States'),
-        'USDJPY=X': ('USD/JPY', 'US Dollar', 'Japanese Yen', 'United States', 'Japan'),
-        'AUDUSD=X': ('AUD/USD', 'Australian Dollar', 'US Dollar', 'Australia', 'United States'),
-        'USDCAD=X': ('USD/CAD', 'US Dollar', 'Canadian Dollar', 'United States', 'Canada'),
-        'EURJPY=X': ('EUR/JPY', 'Euro', 'Japanese Yen', 'Eurozone', 'Japan')
+    texts = generate_texts(plans, api_key, deadline_seconds)
+    return [news_item(plan, headline, article) for plan, (headline, article) in zip(plans, texts)]
+
+
+# Text style of the model's output and template text of each news category
+NEWS_STYLES = {
+    'market_wide': {
+        'article_style': 'financial news article',
+        'headline_style': 'news headline',
+        'article_fallback': "Currency markets continue responding to evolving economic conditions. Traders are monitoring central bank policies and economic indicators for guidance on future exchange rate movements.",
+        'headline_fallback': "Currency Markets React to Economic Developments"
+    },
+    'sector': {
+        'article_style': 'forex market update',
+        'headline_style': 'forex news headline',
+        'article_fallback': "Currency pairs showed varying activity as traders assessed economic data. Major currencies continue responding to shifts in monetary policy expectations.",
+        'headline_fallback': "Forex Markets Show Mixed Trading Patterns"
+    },
+    'geopolitical': {
+        'article_style': 'financial news update',
+        'headline_style': 'news headline',
+        'article_fallback': "Global markets continue monitoring geopolitical developments. Traders are evaluating how international events may influence currency valuations and trading strategies.",
+        'headline_fallback': "Global Events Shape Market Outlook"
+    },
+    'economic': {
+        'article_style': 'economic news update',
+        'headline_style': 'news headline',
+        'article_fallback': "Economic indicators continue drawing attention from market participants. Analysts are evaluating recent data releases for insights into future economic trends.",
+        'headline_fallback': "Economic Data Continues to Guide Markets"
     }
-
-    # Pick a random asset to feature in the news
-    if movements:
-        featured_asset = random.choice(movements)
-        symbol = featured_asset['symbol']
-        predicted_change = featured_asset['future_change_percent']
-
-        if symbol in currency_info:
-            pair_name, base_curr, quote_curr, base_region, quote_region = currency_info[symbol]
-            impact = "support" if predicted_change > 0 else "pressure"
-
-            topics = [
-                f"how trade relations between {base_region} and {quote_region} could {impact} the {base_curr} versus the {quote_curr}",
-                f"geopolitical developments in {base_region} that may impact the {base_curr} against the {quote_curr}",
-                f"diplomatic tensions affecting the {base_curr}/{quote_curr} exchange rate",
-                f"international events creating {impact} on {pair_name}"
+}
+
+
+# Assets news can feature. Forex pairs name both currencies with their central
+# banks, regions and economies; equities name the company and what drives it.
+NEWS_ASSETS = {
+    'EURUSD=X': {
+        'asset_class': 'forex', 'pair_name': 'EUR/USD', 'base_curr': 'Euro', 'quote_curr': 'US Dollar',
+        'base_bank': 'European Central Bank', 'quote_bank': 'Federal Reserve',
+        'base_region': 'Eurozone', 'quote_region': 'United States', 'base_econ': 'Eurozone', 'quote_econ': 'US'
+    },
+    'GBPUSD=X': {
+        'asset_class': 'forex', 'pair_name': 'GBP/USD', 'base_curr': 'British Pound', 'quote_curr': 'US Dollar',
+        'base_bank': 'Bank of England', 'quote_bank': 'Federal Reserve',
+        'base_region': 'United Kingdom', 'quote_region': 'United States', 'base_econ': 'UK', 'quote_econ': 'US'
+    },
+    'USDJPY=X': {
+        'asset_class': 'forex', 'pair_name': 'USD/JPY', 'base_curr': 'US Dollar', 'quote_curr': 'Japanese Yen',
+        'base_bank': 'Federal Reserve', 'quote_bank': 'Bank of Japan',
+        'base_region': 'United States', 'quote_region': 'Japan', 'base_econ': 'US', 'quote_econ': 'Japanese'
+    },
+    'AUDUSD=X': {
+        'asset_class': 'forex', 'pair_name': 'AUD/USD', 'base_curr': 'Australian Dollar', 'quote_curr': 'US Dollar',
+        'base_bank': 'Reserve Bank of Australia', 'quote_bank': 'Federal Reserve',
+        'base_region': 'Australia', 'quote_region': 'United States', 'base_econ': 'Australian', 'quote_econ': 'US'
+    },
+    'USDCAD=X': {
+        'asset_class': 'forex', 'pair_name': 'USD/CAD', 'base_curr': 'US Dollar', 'quote_curr': 'Canadian Dollar',
+        'base_bank': 'Federal Reserve', 'quote_bank': 'Bank of Canada',
+        'base_region': 'United States', 'quote_region': 'Canada', 'base_econ': 'US', 'quote_econ': 'Canadian'
+    },
+    'EURJPY=X': {
+        'asset_class': 'forex', 'pair_name': 'EUR/JPY', 'base_curr': 'Euro', 'quote_curr': 'Japanese Yen',
+        'base_bank': 'European Central Bank', 'quote_bank': 'Bank of Japan',
+        'base_region': 'Eurozone', 'quote_region': 'Japan', 'base_econ': 'Eurozone', 'quote_econ': 'Japanese'
+    },
+    'AAPL': {
+        'asset_class': 'equity', 'company': 'Apple', 'business': 'consumer technology',
+        'drivers': {
+            'up': ['strong iPhone sales', 'services revenue growth', 'ecosystem expansion', 'supply chain improvements'],
+            'down': ['supply constraints', 'China market concerns', 'regulatory headwinds', 'margin pressure']
+        }
+    },
+    'GOOGL': {
+        'asset_class': 'equity', 'company': 'Alphabet', 'business': 'digital advertising',
+        'drivers': {
+            'up': ['advertising revenue strength', 'cloud growth', 'AI initiatives', 'search dominance'],
+            'down': ['ad spending weakness', 'regulatory challenges', 'competition concerns', 'cost pressures']
+        }
+    },
+    'MSFT': {
+        'asset_class': 'equity', 'company': 'Microsoft', 'business': 'enterprise software',
+        'drivers': {
+            'up': ['Azure cloud growth', 'enterprise demand', 'AI integration', 'productivity suite strength'],
+            'down': ['cloud competition', 'licensing concerns', 'economic headwinds', 'valuation concerns']
+        }
+    }
+}
+
+# Words for an asset's predicted direction
+DIRECTION_WORDS = {
+    'up': {'trend': 'bullish', 'direction': 'rise', 'impact': 'support', 'effect': 'boost'},
+    'down': {'trend': 'bearish', 'direction': 'decline', 'impact': 'pressure', 'effect': 'weigh on'}
+}
+
+# Topic templates: category -> asset class -> direction -> templates. Fields come
+# from the asset's NEWS_ASSETS entry and DIRECTION_WORDS; {driver} renders one
+# topic per driver of the direction. 'general' topics are used when no known
+# asset is featured.
+TOPIC_TEMPLATES = {
+    'market_wide': {
+        'general': [
+            "central bank monetary policy and its impact on currency markets",
+            "global economic growth trends affecting forex trading"
+        ],
+        'forex': {
+            'up': [
+                "how {base_bank} policy decisions could strengthen the {base_curr} against the {quote_curr}",
+                "economic factors that may boost the {base_curr} relative to the {quote_curr}",
+                "why market analysts expect the {base_curr} to gain ground against the {quote_curr}",
+                "developments suggesting upward momentum for the {base_curr} versus the {quote_curr}"
+            ],
+            'down': [
+                "how {quote_bank} policy decisions could strengthen the {quote_curr} against the {base_curr}",
+                "economic factors that may weaken the {base_curr} relative to the {quote_curr}",
+                "why market analysts expect the {base_curr} to lose ground against the {quote_curr}",
+                "developments suggesting downward pressure on the {base_curr} versus the {quote_curr}"
             ]
-        else:
-            topics = [
-                "international trade relations and currency impacts",
-                "geopolitical developments affecting global markets"
+        },
+        'equity': {
+            'up': [
+                "how {driver} could lift {company} shares",
+                "why market analysts expect {company} to gain ground in {business}"
+            ],
+            'down': [
+                "how {driver} could weigh on {company} shares",
+                "why market analysts expect {company} to lose ground in {business}"
+            ]
+        }
+    },
+    'sector': {
+        'general': [
+            "major currency pair trading activity in forex markets",
+            "emerging market currencies and their recent movements"
+        ],
+        'forex': {
+            'any': [
+                "why {pair_name} is showing {trend} signals as the {base_curr} prepares to {direction} against the {quote_curr}",
+                "technical factors suggesting the {base_curr} could {direction} versus the {quote_curr}",
+                "market sentiment turning {trend} on {pair_name} as traders anticipate {base_curr} movement",
+                "trading patterns in {pair_name} indicating potential {direction} in the {base_curr}"
+            ]
+        },
+        'equity': {
+            'any': [
+                "technical factors suggesting {company} shares could {direction}",
+                "market sentiment turning {trend} on {company} as traders weigh {driver}",
+                "{business} stocks under scrutiny as {company} shows {trend} signals"
             ]
-    else:
-        topics = [
+        }
+    },
+    'geopolitical': {
+        'general': [
             "international trade relations and currency impacts",
             "geopolitical developments affecting global markets"
-        ]
+        ],
+        'forex': {
+            'any': [
+                "how trade relations between {base_region} and {quote_region} could {impact} the {base_curr} versus the {quote_curr}",
+                "geopolitical developments in {base_region} that may impact the {base_curr} against the {quote_curr}",
+                "diplomatic tensions affecting the {base_curr}/{quote_curr} exchange rate",
+                "international events creating {impact} on {pair_name}"
+            ]
+        },
+        'equity': {
+            'any': [
+                "how international trade policy could {impact} {company} shares",
+                "global regulatory developments affecting {company} and the {business} industry"
+            ]
+        }
+    },
+    'economic': {
+        'general': [
+            "employment data and labor market conditions",
+            "inflation indicators and price stability"
+        ],
+        'forex': {
+            'any': [
+                "how {base_econ} employment data could {effect} the {base_curr} against the {quote_curr}",
+                "{base_econ} inflation indicators that may impact the {base_curr} versus the {quote_curr}",
+                "economic growth figures from {base_econ} affecting {pair_name}",
+                "{base_econ} data releases with potential to move the {base_curr} relative to the {quote_curr}"
+            ]
+        },
+        'equity': {
+            'any': [
+                "how consumer spending data could {effect} {company} shares",
+                "interest rate expectations and their impact on {business} stocks like {company}"
+            ]
+        }
+    }
+}
 
-    topic = random.choice(topics)
-    prompt = f"Write a brief, neutral financial news update (2-3 sentences) about {topic}. Do not include specific numbers or percentages."
 
-    article = generate_ai_news_with_huggingface(api_key, prompt)
+def _render_topics(templates, fields):
+    """Distinct topics from templates, one per driver for templates that use {driver}"""
+    topics = []
+    for template in templates:
+        drivers = fields['driver'] if '{driver}' in template else [None]
+        for driver in drivers:
+            topic = template.format(**dict(fields, driver=driver))
+            if topic not in topics:
+                topics.append(topic)
+    return tuple(topics)
 
-    if not article:
-        article = "Global markets continue monitoring geopolitical developments. Traders are evaluating how international events may influence currency valuations and trading strategies."
 
-    headline_prompt = f"Write a short, neutral news headline (max 10 words) about: {topic}"
-    headline = generate_ai_news_with_huggingface(api_key, headline_prompt)
+def build_topic_table():
+    """{(category, symbol, direction): topics}, with symbol None for the general topics"""
+    table = {}
+    for category, by_class in TOPIC_TEMPLATES.items():
+        for direction in DIRECTION_WORDS:
+            table[category, None, direction] = tuple(by_class['general'])
 
-    if not headline or len(headline) > 100:
-        headline = "Global Events Shape Market Outlook"
+        for symbol, asset in NEWS_ASSETS.items():
+            templates = by_class.get(asset['asset_class'])
+            if not templates:
+                continue
+            for direction, words in DIRECTION_WORDS.items():
+                fields = dict(asset, **words, driver=asset.get('drivers', {}).get(direction, []))
+                table[category, symbol, direction] = _render_topics(
+                    templates.get(direction, templates.get('any', [])), fields
+                )
+    return table
 
-    return {
-        'headline': headline.strip(),
-        'article': article.strip(),
-        'category': 'geopolitical',
-        'sentiment': 'neutral'
-    }
 
+# Rendered once per container; planning an article is then a lookup
+TOPIC_TABLE = build_topic_table()
 
-def generate_economic_data_news(movements, timestamp, api_key):
-    """
-    Generate economic data news using Hugging Face AI, connected to a specific asset prediction.
-    """
-    # Currency pair mappings
-    currency_info = {
-        'EURUSD=X': ('EUR/USD', 'Euro', 'US Dollar', 'Eurozone', 'US'),
-        'GBPUSD=X': ('GBP/USD', 'British Pound', 'US Dollar', 'UK', 'US'),
-        'USDJPY=X': ('USD/JPY', 'US Dollar', 'Japanese Yen', 'US', 'Japanese'),
-        'AUDUSD=X': ('AUD/USD', 'Australian Dollar', 'US Dollar', 'Australian', 'US'),
-        'USDCAD=X': ('USD/CAD', 'US Dollar', 'Canadian Dollar', 'US', 'Canadian'),
-        'EURJPY=X': ('EUR/JPY', 'Euro', 'Japanese Yen', 'Eurozone', 'Japanese')
-    }
+NEWS_CATEGORIES = list(TOPIC_TEMPLATES)
 
-    # Pick a random asset to feature in the news
-    if movements:
-        featured_asset = random.choice(movements)
-        symbol = featured_asset['symbol']
-        predicted_change = featured_asset['future_change_percent']
-
-        if symbol in currency_info:
-            pair_name, base_curr, quote_curr, base_econ, quote_econ = currency_info[symbol]
-            effect = "boost" if predicted_change > 0 else "weigh on"
-
-            topics = [
-                f"how {base_econ} employment data could {effect} the {base_curr} against the {quote_curr}",
-                f"{base_econ} inflation indicators that may impact the {base_curr} versus the {quote_curr}",
-                f"economic growth figures from {base_econ} affecting {pair_name}",
-                f"{base_econ} data releases with potential to move the {base_curr} relative to the {quote_curr}"
-            ]
-        else:
-            topics = [
-                "employment data and labor market conditions",
-                "inflation indicators and price stability"
-            ]
-    else:
-        topics = [
-            "employment data and labor market conditions",
-            "inflation indicators and price stability"
-        ]
 
-    topic = random.choice(topics)
-    prompt = f"Write a brief, neutral economic news update (2-3 sentences) about {topic}. Do not include specific numbers or percentages."
+def news_plan(category, topic):
+    """Plan of one article: topic, output styles and template fallbacks"""
+    return dict(NEWS_STYLES[category], category=category, sentiment='neutral', topic=topic)
+
 
-    article = generate_ai_news_with_huggingface(api_key, prompt)
+def topics_for(category, symbol, predicted_change):
+    """Topics of a category about an asset's predicted move (general topics for assets without any)"""
+    direction = 'up' if predicted_change > 0 else 'down'
+    return TOPIC_TABLE.get((category, symbol, direction)) or TOPIC_TABLE[category, None, direction]
 
-    if not article:
-        article = "Economic indicators continue drawing attention from market participants. Analysts are evaluating recent data releases for insights into future economic trends."
 
-    headline_prompt = f"Write a short, neutral news headline (max 10 words) about: {topic}"
-    headline = generate_ai_news_with_huggingface(api_key, headline_prompt)
+def plan_news(categories, movements):
+    """
+    Plan one article per category, each connected to a randomly picked asset prediction.
+    """
+    plans = []
+    for category in categories:
+        # Pick a random asset to feature in the news
+        if movements:
+            featured_asset = random.choice(movements)
+            topics = topics_for(category, featured_asset['symbol'], featured_asset['future_change_percent'])
+        else:
+            topics = topics_for(category, None, 0)
+        plans.append(news_plan(category, random.choice(topics)))
+    return plans
 
-    if not headline or len(headline) > 100:
-        headline = "Economic Data Continues to Guide Markets"
 
-    return {
-        'headline': headline.strip(),
-        'article': article.strip(),
-        'category': 'economic',
-        'sentiment': 'neutral'
-    }
+def all_topics(symbols):
+    """Every (category, topic) news can be planned with for these symbols, in either direction"""
+    seen = set()
+    topics = []
+    for category in NEWS_CATEGORIES:
+        for symbol in [None] + list(symbols):
+            for predicted_change in (1, -1):
+                for topic in topics_for(category, symbol, predicted_change):
+                    if (category, topic) not in seen:
+                        seen.add((category, topic))
+                        topics.append((category, topic))
+    return topics
 
 
 def create_asset_specific_news(symbol, past_change_pct, future_change_pct, current_price, sentiment):
@@ -315,28 +478,13 @@ def create_asset_specific_news(symbol, past_change_pct, future_change_pct, curre
     future_direction = "rally" if future_change_pct > 0 else "decline"
 
     # Company-specific reasons
-    reasons = {
-        'AAPL': {
-            'positive': ['strong iPhone sales', 'services revenue growth', 'ecosystem expansion', 'supply chain improvements'],
-            'negative': ['supply constraints', 'China market concerns', 'regulatory headwinds', 'margin pressure']
-        },
-        'GOOGL': {
-            'positive': ['advertising revenue strength', 'cloud growth', 'AI initiatives', 'search dominance'],
-            'negative': ['ad spending weakness', 'regulatory challenges', 'competition concerns', 'cost pressures']
-        },
-        'MSFT': {
-            'positive': ['Azure cloud growth', 'enterprise demand', 'AI integration', 'productivity suite strength'],
-            'negative': ['cloud competition', 'licensing concerns', 'economic headwinds', 'valuation concerns']
-        }
-    }
-
     default_reasons = {
-        'positive': ['strong earnings', 'analyst upgrades', 'positive guidance', 'market share gains'],
-        'negative': ['earnings miss', 'analyst downgrades', 'weak guidance', 'competitive pressure']
+        'up': ['strong earnings', 'analyst upgrades', 'positive guidance', 'market share gains'],
+        'down': ['earnings miss', 'analyst downgrades', 'weak guidance', 'competitive pressure']
     }
 
-    company_reasons = reasons.get(symbol, default_reasons)
-    past_reason = random.choice(company_reasons['positive' if past_change_pct > 0 else 'negative'])
+    company_reasons = NEWS_ASSETS.get(symbol, {}).get('drivers', default_reasons)
+    past_reason = random.choice(company_reasons['up' if past_change_pct > 0 else 'down'])
 
     headline = f"{symbol} {past_direction.capitalize()} {abs(past_change_pct):.1f}% on {past_reason.capitalize()}"
 
@@ -356,27 +504,84 @@ def create_asset_specific_news(symbol, past_change_pct, future_change_pct, curre
     }
 
 
+def time_budget(limit_seconds, context):
+    """limit_seconds, cut to what the invocation has left before the news must be saved"""
+    deadline = limit_seconds
+    if context is not None:
+        deadline = min(deadline, context.get_remaining_time_in_millis() / 1000 - SAVE_MARGIN_SECONDS)
+    return max(deadline, 1)
+
+
+def refill_pool(market_data_bucket, news_bucket, api_key, deadline_seconds):
+    """
+    Top up the article pool for every topic the collected assets can produce,
+    emptiest topics first. Only complete model output is pooled, never templates.
+    """
+    try:
+        symbols = list(load_history(s3_client, market_data_bucket)['assets'].keys())
+    except Exception as e:
+        print(f"Error loading price history, refilling general topics only: {str(e)}")
+        symbols = []
+
+    pool, _ = load_pool(s3_client, news_bucket)
+    wanted = pool_shortfall(pool, all_topics(symbols), time.time())[:REFILL_MAX_ARTICLES]
+
+    generated = []
+    if wanted:
+        print(f"Refilling article pool: generating {len(wanted)} articles (deadline {deadline_seconds:.1f}s)...")
+        plans = [news_plan(category, topic) for category, topic in wanted]
+        texts = generate_texts(plans, api_key, deadline_seconds)
+        generated = [
+            (plan['category'], plan['topic'], headline.strip(), article.strip())
+            for plan, (headline, article) in zip(plans, texts)
+            if headline and article
+        ]
+
+    added = add_articles(s3_client, news_bucket, generated) if generated else 0
+    print(f"✅ Added {added} articles to the pool ({len(wanted) - len(generated)} calls failed or missed the deadline)")
+
+    return {
+        'statusCode': 200,
+        'body': json.dumps({
+            'message': f'Refilled article pool with {added} articles',
+            'articles_requested': len(wanted),
+            'articles_added': added
+        })
+    }
+
+
 def lambda_handler(event, context):
     """
     Generates 2-3 diverse news articles that are immediately available.
     Runs every 5 minutes to provide fresh, timely news.
     News types: market-wide, sector, geopolitical, economic, asset-specific
+    Articles are drawn from the pre-generated pool when it has one for the planned
+    topic; the model is only called for the rest.
+    Invoked with {"mode": "refill"} it tops up the article pool instead.
+    Both are skipped while nobody is online (pass {"force": true} to run anyway).
     """
     huggingface_api_key = os.environ.get('HUGGINGFACE_API_KEY', '')
     market_data_bucket = os.environ['MARKET_DATA_BUCKET']
     news_bucket = os.environ['NEWS_BUCKET']
 
+    if not (event or {}).get('force') and pipeline_idle(s3_client, market_data_bucket):
+        print("No active players - news generation skipped")
+        return {
+            'statusCode': 200,
+            'body': json.dumps({'message': 'News generation skipped: no active players', 'new_articles_count': 0})
+        }
+
+    if (event or {}).get('mode') == 'refill':
+        return refill_pool(market_data_bucket, news_bucket, huggingface_api_key,
+                           time_budget(REFILL_DEADLINE_SECONDS, context))
+
     timestamp = int(time.time())
     date_str = datetime.utcnow().strftime('%Y-%m-%d')
     time_str = datetime.utcnow().strftime('%H-%M-%S')
 
     # Get collected price history
     try:
-        response = s3_client.get_object(
-            Bucket=market_data_bucket,
-            Key='collected_prices/rolling_history_60min.json'
-        )
-        history_data = json.loads(response['Body'].read().decode('utf-8'))
+        history_data = load_history(s3_client, market_data_bucket)
         print(f"Loaded price history for {len(history_data['assets'])} assets")
     except Exception as e:
         print(f"Error loading price history: {str(e)}")
@@ -384,11 +589,8 @@ def lambda_handler(event, context):
 
     # Get simulated future data
     try:
-        response = s3_client.get_object(
-            Bucket=market_data_bucket,
-            Key='simulated_data/latest_simulated_1sec.json'
-        )
-        simulated_data = json.loads(response['Body'].read().decode('utf-8'))
+        window, _ = get_current_window(s3_client, market_data_bucket)
+        simulated_data = window.header
         print(f"Loaded simulated data for {len(simulated_data['assets'])} assets")
     except Exception as e:
         print(f"Error loading simulated data: {str(e)}")
@@ -423,23 +625,29 @@ def lambda_handler(event, context):
     movements.sort(key=lambda x: x['volatility'], reverse=True)
 
     # Generate 2-3 diverse AI-powered news articles
-    news_articles = []
-
     # Randomly select article types to generate variety
-    article_types = ['market', 'sector', 'geopolitical', 'economic']
-    selected_types = random.sample(article_types, k=random.randint(2, 3))
-
-    print(f"Generating {len(selected_types)} AI news articles using Hugging Face...")
-
-    for article_type in selected_types:
-        if article_type == 'market':
-            news_articles.append(generate_market_wide_news(movements, timestamp, huggingface_api_key))
-        elif article_type == 'sector':
-            news_articles.append(generate_sector_news(movements, timestamp, huggingface_api_key))
-        elif article_type == 'geopolitical':
-            news_articles.append(generate_geopolitical_news(movements, timestamp, huggingface_api_key))
-        elif article_type == 'economic':
-            news_articles.append(generate_economic_data_news(movements, timestamp, huggingface_api_key))
+    selected_types = random.sample(NEWS_CATEGORIES, k=random.randint(2, 3))
+    plans = plan_news(selected_types, movements)
+
+    try:
+        pooled = draw_articles(s3_client, news_bucket, [(plan['category'], plan['topic']) for plan in plans])
+    except Exception as e:
+        print(f"Error drawing from the article pool: {str(e)}")
+        pooled = [None] * len(plans)
+    print(f"Drew {sum(1 for drawn in pooled if drawn)} of {len(plans)} articles from the pool")
+
+    live_plans = [plan for plan, drawn in zip(plans, pooled) if drawn is None]
+    generated = []
+    if live_plans:
+        deadline = time_budget(GENERATION_DEADLINE_SECONDS, context)
+        print(f"Generating {len(live_plans)} AI news articles using Hugging Face (deadline {deadline:.1f}s)...")
+        generated = generate_articles(live_plans, huggingface_api_key, deadline)
+
+    live_articles = iter(generated)
+    news_articles = [
+        news_item(plan, drawn['headline'], drawn['article']) if drawn else next(live_articles)
+        for plan, drawn in zip(plans, pooled)
+    ]
 
     # All articles are immediately available (publish_at = current time)
     # This provides instant news every 5 minutes instead of staggered releases
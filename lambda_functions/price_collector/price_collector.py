@@ -2,15 +2,121 @@ import json
 import os
 import boto3
 import requests
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 import time
+from price_history import append_segment, compact, load_history
+from rolling_stats import RollingStats, build_stats, load_stats, save_stats
+from activity import pipeline_idle
 
 s3_client = boto3.client('s3')
 
+# Fold appended segments into a new history snapshot every N minutes
+COMPACT_EVERY_MINUTES = int(os.environ.get('HISTORY_COMPACT_EVERY_MINUTES', '10'))
+
+# Fetch stage tuning
+MAX_WORKERS = int(os.environ.get('COLLECTOR_MAX_WORKERS', '8'))
+REQUEST_TIMEOUT = float(os.environ.get('COLLECTOR_TIMEOUT_SECONDS', '10'))
+MAX_RETRIES = int(os.environ.get('COLLECTOR_MAX_RETRIES', '2'))
+RETRY_BACKOFF = 0.5  # seconds, doubled on every retry
+YAHOO_BASE_URL = os.environ.get('YAHOO_BASE_URL', 'https://query1.finance.yahoo.com')
+
+
+class YahooQuoteSource:
+    """
+    Quote source backed by the Yahoo Finance chart API (free, no authentication needed).
+    Uses one keep-alive session for every request. Any object with a
+    fetch(symbol) method returning a quote dict (or None) can replace it,
+    e.g. this class pointed at a local fake server through base_url.
+    """
+
+    def __init__(self, base_url=YAHOO_BASE_URL, timeout=REQUEST_TIMEOUT, max_retries=MAX_RETRIES, pool_size=MAX_WORKERS):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.session = requests.Session()
+        self.session.headers['User-Agent'] = 'Mozilla/5.0'
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def _get(self, url):
+        """GET with bounded retries on timeouts, connection errors, 429 and 5xx"""
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = self.session.get(url, timeout=self.timeout)
+                if response.status_code == 429 or response.status_code >= 500:
+                    response.raise_for_status()
+                return response
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout, requests.exceptions.HTTPError):
+                if attempt == self.max_retries:
+                    raise
+                time.sleep(RETRY_BACKOFF * (2 ** attempt))
+
+    def fetch(self, symbol):
+        """
+        Fetch the current quote for a symbol.
+        Returns a dict with price, high, low, open and previous_close, or None if no valid price.
+        Raises ValueError on an unexpected response structure.
+        """
+        # Yahoo Finance query API (lightweight, no library needed)
+        url = f"{self.base_url}/v8/finance/chart/{symbol}?interval=1m&range=1d"
+
+        response = self._get(url)
+        response.raise_for_status()
+
+        data = response.json()
+
+        # Extract price data from response
+        if not ('chart' in data and data['chart'].get('result')):
+            raise ValueError('Invalid response structure')
+
+        meta = data['chart']['result'][0].get('meta', {})
+        current_price = meta.get('regularMarketPrice')
+
+        if not current_price or current_price <= 0:
+            return None
+
+        return {
+            'price': float(current_price),
+            'high': float(meta.get('regularMarketDayHigh', current_price)),
+            'low': float(meta.get('regularMarketDayLow', current_price)),
+            'open': float(meta.get('regularMarketOpen', current_price)),
+            'previous_close': float(meta.get('previousClose', current_price))
+        }
+
+
+# Created once per container so warm invocations reuse pooled connections
+quote_source = YahooQuoteSource()
+
+
+def fetch_quotes(source, symbols, max_workers=MAX_WORKERS):
+    """
+    Fetch quotes for all symbols concurrently, at most max_workers in flight.
+    Returns {symbol: (quote or None, error message or None)}.
+    """
+    def fetch_one(symbol):
+        try:
+            return symbol, (source.fetch(symbol), None)
+        except requests.exceptions.RequestException as e:
+            return symbol, (None, f"Error fetching {symbol}: {str(e)}")
+        except ValueError as e:
+            return symbol, (None, f"✗ {symbol}: {str(e)}")
+        except Exception as e:
+            return symbol, (None, f"Unexpected error for {symbol}: {str(e)}")
+
+    if not symbols:
+        return {}
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(symbols)))) as executor:
+        return dict(executor.map(fetch_one, symbols))
+
 def lambda_handler(event, context):
     """
     Collects current prices using Yahoo Finance query API every minute.
-    Maintains a rolling 60-minute (1 hour) history for each asset (60 datapoints x 1min).
+    Maintains a rolling 60-minute (1 hour) history for each asset (60 datapoints x 1min)
+    as append-only segments plus a periodically compacted snapshot (see price_history).
     This data is used by price_simulator to generate 600 simulated prices (1 per second for 10 min).
     """
     market_data_bucket = os.environ['MARKET_DATA_BUCKET']
@@ -19,124 +125,92 @@ def lambda_handler(event, context):
     current_timestamp = int(time.time())
     current_datetime = datetime.utcnow()
 
-    # Try to load existing history
-    try:
-        response = s3_client.get_object(
-            Bucket=market_data_bucket,
-            Key='collected_prices/rolling_history_60min.json'
-        )
-        history_data = json.loads(response['Body'].read().decode('utf-8'))
-        print(f"Loaded existing history with {len(history_data.get('assets', {}))} assets")
-    except s3_client.exceptions.NoSuchKey:
-        print("No existing history found, creating new")
-        history_data = {
-            'created_at': current_datetime.isoformat(),
-            'assets': {}
-        }
+    # Fetch current prices for every symbol concurrently over one pooled session
+    quotes = fetch_quotes(quote_source, assets_to_track)
 
-    # Fetch current prices using Yahoo Finance query API (lightweight, no library needed)
-    newly_fetched = 0
+    points = {}
     for symbol in assets_to_track:
-        try:
-            # Yahoo Finance query API - free, no authentication needed
-            url = f"https://query1.finance.yahoo.com/v8/finance/chart/{symbol}?interval=1m&range=1d"
-            headers = {'User-Agent': 'Mozilla/5.0'}
-
-            response = requests.get(url, headers=headers, timeout=10)
-            response.raise_for_status()
-
-            data = response.json()
-
-            # Extract price data from response
-            if 'chart' in data and 'result' in data['chart'] and len(data['chart']['result']) > 0:
-                result = data['chart']['result'][0]
-                meta = result.get('meta', {})
-
-                current_price = meta.get('regularMarketPrice')
-
-                if current_price and current_price > 0:
-                    # Get additional price info
-                    high = meta.get('regularMarketDayHigh', current_price)
-                    low = meta.get('regularMarketDayLow', current_price)
-                    open_price = meta.get('regularMarketOpen', current_price)
-                    previous_close = meta.get('previousClose', current_price)
-
-                    # Initialize asset history if not exists
-                    if symbol not in history_data['assets']:
-                        history_data['assets'][symbol] = {
-                            'symbol': symbol,
-                            'data_points': []
-                        }
-
-                    # Add new data point
-                    data_point = {
-                        'timestamp': current_timestamp,
-                        'datetime': current_datetime.isoformat(),
-                        'price': float(current_price),
-                        'high': float(high),
-                        'low': float(low),
-                        'open': float(open_price),
-                        'previous_close': float(previous_close)
-                    }
-
-                    history_data['assets'][symbol]['data_points'].append(data_point)
-
-                    # Keep only last 60 data points (60 x 1min = 60 minutes = 1 hour)
-                    if len(history_data['assets'][symbol]['data_points']) > 60:
-                        history_data['assets'][symbol]['data_points'] = \
-                            history_data['assets'][symbol]['data_points'][-60:]
-
-                    count = len(history_data['assets'][symbol]['data_points'])
-                    print(f"✓ {symbol}: ${current_price:.2f} (collected {count}/60 data points)")
-                    newly_fetched += 1
-                else:
-                    print(f"✗ {symbol}: No valid price data")
-            else:
-                print(f"✗ {symbol}: Invalid response structure")
+        quote, error = quotes[symbol]
 
-        except requests.exceptions.RequestException as e:
-            print(f"Error fetching {symbol}: {str(e)}")
-        except Exception as e:
-            print(f"Unexpected error for {symbol}: {str(e)}")
-
-    # Update metadata
-    history_data['last_updated'] = current_datetime.isoformat()
-    history_data['last_updated_timestamp'] = current_timestamp
-
-    # Calculate completeness stats
-    assets_with_full_hour = 0
-    for symbol, asset_data in history_data['assets'].items():
-        if len(asset_data['data_points']) >= 60:
-            assets_with_full_hour += 1
-
-    history_data['stats'] = {
-        'total_assets': len(history_data['assets']),
-        'assets_with_full_hour': assets_with_full_hour,
-        'ready_for_simulation': assets_with_full_hour >= len(assets_to_track) * 0.8  # 80% threshold
-    }
+        if error:
+            print(error)
+            continue
+
+        if quote is None:
+            print(f"✗ {symbol}: No valid price data")
+            continue
+
+        # New data point for this minute
+        points[symbol] = {
+            'timestamp': current_timestamp,
+            'datetime': current_datetime.isoformat(),
+            **quote
+        }
+        print(f"✓ {symbol}: ${quote['price']:.2f}")
+
+    newly_fetched = len(points)
 
-    # Save updated history
-    s3_key = 'collected_prices/rolling_history_60min.json'
+    # Append this run as its own segment instead of rewriting the whole history
     try:
-        s3_client.put_object(
-            Bucket=market_data_bucket,
-            Key=s3_key,
-            Body=json.dumps(history_data, indent=2),
-            ContentType='application/json'
-        )
-        print(f"\n✅ History saved: {assets_with_full_hour}/{len(assets_to_track)} assets have full 60min data")
-        print(f"   Ready for simulation: {history_data['stats']['ready_for_simulation']}")
+        s3_key = append_segment(s3_client, market_data_bucket, current_timestamp, points)
+        print(f"\n✅ Segment saved: s3://{market_data_bucket}/{s3_key}")
     except Exception as e:
-        print(f"Error saving history to S3: {str(e)}")
+        print(f"Error saving history segment to S3: {str(e)}")
         raise
 
+    # Periodically fold the tail segments into a new snapshot
+    stats = None
+    if (current_timestamp // 60) % COMPACT_EVERY_MINUTES == 0:
+        try:
+            manifest = compact(s3_client, market_data_bucket, len(assets_to_track))
+            if manifest:
+                stats = manifest['stats']
+                print(f"✅ History compacted through {manifest['through_timestamp']}: "
+                      f"{stats['assets_with_full_hour']}/{len(assets_to_track)} assets have full 60min data")
+                print(f"   Ready for simulation: {stats['ready_for_simulation']}")
+            else:
+                print("Compaction skipped (nothing new or another run compacted first)")
+        except Exception as e:
+            # Readers still see every segment, so a failed compaction only costs read time
+            print(f"Error compacting history: {str(e)}")
+
+    # Keep the published rolling statistics in step with the new segment. Collection
+    # itself never pauses (the simulator needs a full hour on wake-up), but nobody
+    # simulates from the stats while no players are online.
+    idle = pipeline_idle(s3_client, market_data_bucket)
+    if idle:
+        print("No active players - rolling stats update skipped")
+    else:
+        try:
+            rolling, etag = load_stats(s3_client, market_data_bucket)
+            stale = rolling is not None and max(
+                (asset_stats.last_timestamp or 0 for asset_stats in rolling.values()), default=0
+            ) < current_timestamp - 2 * 60
+            if rolling is None or stats is not None or stale:
+                # First run, just compacted or back from idle: rebuild exactly from the history
+                rolling = build_stats(load_history(s3_client, market_data_bucket, len(assets_to_track))['assets'])
+            else:
+                for symbol, point in points.items():
+                    rolling.setdefault(symbol, RollingStats()).push(point['timestamp'], point['price'])
+
+            if save_stats(s3_client, market_data_bucket, rolling, etag):
+                print(f"✅ Rolling stats updated for {len(rolling)} assets")
+            else:
+                print("Rolling stats changed concurrently; the next resync will catch up")
+        except Exception as e:
+            # The simulator falls back to computing stats from the history
+            print(f"Error updating rolling stats: {str(e)}")
+
     return {
         'statusCode': 200,
         'body': json.dumps({
             'message': f'Collected prices for {newly_fetched} assets',
-            'assets_with_full_hour': assets_with_full_hour,
+            'segment_key': s3_key,
             'total_assets': len(assets_to_track),
-            'ready_for_simulation': history_data['stats']['ready_for_simulation'],
+            'compacted': stats is not None,
+            'assets_with_full_hour': stats['assets_with_full_hour'] if stats else None,
+            'ready_for_simulation': stats['ready_for_simulation'] if stats else None,
+            'idle': idle,
             'timestamp': current_timestamp
         })
     }
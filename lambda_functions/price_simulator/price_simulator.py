@@ -1,12 +1,39 @@
 import json
 import os
 import boto3
-import random
 import math
+import numpy as np
 from datetime import datetime, timedelta
 import time
+from sim_format import write_window
+from sim_ring import (
+    RING_MANIFEST_KEY, WINDOW_SECONDS, load_ring, publish_entries, slot_for, slot_keys, window_start
+)
+from price_history import load_history
+from rolling_stats import load_stats, window_stats
+from order_settlement import settle_elapsed_windows
+from activity import pipeline_idle
+from price_oracle import (
+    CHECKPOINT_INTERVAL, GOLDEN_GAMMA, MAX_FACTOR, MIN_FACTOR, NORMAL_DRAWS,
+    PRICE_FLOOR_RATIO, SQRT_DT, UNIFORM_SCALE, stream_key
+)
 
 s3_client = boto3.client('s3')
+dynamodb = boto3.resource('dynamodb')
+
+# Bytes per stored price: 8 (float64) or 4 (float32, ~7 significant digits)
+PRICE_ITEMSIZE = int(os.environ.get('SIMULATION_PRICE_ITEMSIZE', '8'))
+
+# Published rolling stats older than this are ignored in favour of the raw history
+STATS_MAX_AGE_SECONDS = int(os.environ.get('ROLLING_STATS_MAX_AGE_SECONDS', '180'))
+
+# Windows published ahead of the current one; the ring keeps two more slots so the
+# current and just-finished windows are never overwritten
+WINDOWS_AHEAD = int(os.environ.get('SIMULATION_WINDOWS_AHEAD', '2'))
+RING_SLOTS = WINDOWS_AHEAD + 2
+
+# Readiness is measured against every tracked asset, not just those with history
+TRACKED_ASSETS = len(json.loads(os.environ.get('ASSETS_TO_TRACK', '[]'))) or None
 
 def calculate_statistics(candles):
     """
@@ -38,185 +65,379 @@ def calculate_statistics(candles):
     return mean_return, volatility, trend
 
 
-def generate_second_prices(start_price, mean_return, volatility, trend, num_seconds=600):
+def counter_shocks(keys, num_seconds):
     """
-    Generate simulated prices for the next 10 minutes using GBM with historical statistics.
-    Returns list of 600 prices (one per second).
+    Vectorized price_oracle.shock for every (asset, second).
+    Returns an (assets x num_seconds) array identical to the scalar oracle's draws.
     """
-    prices = []
-    current_price = start_price
+    keys = np.asarray(keys, dtype=np.uint64)
+    counters = np.arange(1, num_seconds * NORMAL_DRAWS + 1, dtype=np.uint64)
 
-    # Adjust drift to include trend component
-    drift = mean_return + (trend / num_seconds)  # Distribute trend over the 10-minute period
+    # splitmix64 over (key + counter * gamma), wrapping at 64 bits like the scalar version
+    x = keys[:, None] + counters[None, :] * np.uint64(GOLDEN_GAMMA)
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    x = x ^ (x >> np.uint64(31))
 
-    for second in range(num_seconds):
-        # Geometric Brownian Motion
-        # dS = μ * S * dt + σ * S * dW
-        dt = 1 / (24 * 60 * 60)  # 1 second in terms of days
-        dW = random.gauss(0, math.sqrt(dt))
+    uniforms = (x >> np.uint64(11)).astype(np.float64) * UNIFORM_SCALE
+    uniforms = uniforms.reshape(len(keys), num_seconds, NORMAL_DRAWS)
 
-        price_change = drift * current_price + volatility * current_price * dW
-        new_price = current_price + price_change
+    # Accumulate draws in the same order as the scalar loop so sums match bit for bit
+    total = np.zeros((len(keys), num_seconds))
+    for draw in range(NORMAL_DRAWS):
+        total = total + uniforms[:, :, draw]
+    return total - 6.0
 
-        # Ensure price stays reasonable (max 5% change per second)
-        max_change = current_price * 0.05
-        new_price = max(new_price, current_price - max_change)
-        new_price = min(new_price, current_price + max_change)
 
-        # Ensure price doesn't go negative
-        new_price = max(new_price, start_price * 0.5)
+def generate_price_matrix(start_prices, drifts, volatilities, keys, num_seconds=600,
+                          checkpoint_interval=CHECKPOINT_INTERVAL):
+    """
+    Generate simulated prices for a batch of assets in one pass using GBM with historical statistics.
+    Draws the whole assets x seconds shock matrix at once from the counter-based oracle and
+    applies drift, volatility and the per-second/floor clamps as array operations.
+    Returns (prices, checkpoints): an (assets x num_seconds) price array and the price before
+    every checkpoint_interval-th second, from which price_oracle.price_at can replay any second.
+    """
+    start_prices = np.asarray(start_prices, dtype=np.float64)
+    drifts = np.asarray(drifts, dtype=np.float64)
+    volatilities = np.asarray(volatilities, dtype=np.float64)
 
-        prices.append(round(new_price, 4))
-        current_price = new_price
+    # Geometric Brownian Motion
+    # dS = μ * S * dt + σ * S * dW, as a per-second factor clamped to a max 5% move
+    shocks = counter_shocks(keys, num_seconds)
+    factors = 1.0 + drifts[:, None] + volatilities[:, None] * (shocks * SQRT_DT)
+    factors = np.clip(factors, MIN_FACTOR, MAX_FACTOR)
 
-    return prices
+    # Ensure price doesn't drop below the floor
+    floors = start_prices * PRICE_FLOOR_RATIO
 
+    prices = np.empty_like(factors)
+    price = start_prices
+    for second in range(num_seconds):
+        price = np.maximum(price * factors[:, second], floors)
+        prices[:, second] = price
 
-def lambda_handler(event, context):
+    checkpoint_seconds = range(checkpoint_interval, num_seconds, checkpoint_interval)
+    checkpoints = np.column_stack([start_prices] + [prices[:, s - 1] for s in checkpoint_seconds])
+
+    return prices, checkpoints
+
+
+def generate_second_prices(start_price, mean_return, volatility, trend, num_seconds=600, key=0):
     """
-    Generates 600 simulated prices (1 per second) for the NEXT 10 minutes
-    based on statistical distribution from the PAST 60 minutes collected price data.
+    Generate simulated prices for the next 10 minutes for a single asset.
+    Returns list of 600 prices (one per second).
     """
-    market_data_bucket = os.environ['MARKET_DATA_BUCKET']
-
-    timestamp = int(time.time())
-    date_str = datetime.utcnow().strftime('%Y-%m-%d')
-    time_str = datetime.utcnow().strftime('%H-%M-%S')
+    # Adjust drift to include trend component
+    drift = mean_return + (trend / num_seconds)  # Distribute trend over the 10-minute period
 
-    # Get the collected price history (past hour - 60 minutes of data)
-    try:
-        response = s3_client.get_object(
-            Bucket=market_data_bucket,
-            Key='collected_prices/rolling_history_60min.json'
-        )
-        history_data = json.loads(response['Body'].read().decode('utf-8'))
-        print(f"Loaded price history for {len(history_data['assets'])} assets")
+    prices, _ = generate_price_matrix([start_price], [drift], [volatility], [key], num_seconds=num_seconds)
 
-        # Check if we have enough data
-        if not history_data.get('stats', {}).get('ready_for_simulation', False):
-            print(f"⚠️  Warning: Only {history_data['stats']['assets_with_full_hour']} assets have full 60min data")
-    except Exception as e:
-        print(f"Error loading price history: {str(e)}")
-        raise
+    return [round(float(price), 4) for price in prices[0]]
 
-    # Start time for the simulated 10-minute period (current time, rounded to the second)
-    current_dt = datetime.utcnow()
-    start_timestamp = int(current_dt.replace(microsecond=0).timestamp())
 
+def simulate_window(asset_inputs, start_prices, start_timestamp, seed, generated_at):
+    """
+    Simulate one aligned 10-minute window for every asset in a single batch.
+    asset_inputs: {symbol: (last_price, mean_return, volatility, trend) or None}
+    start_prices: {symbol: price} to start from instead of last_price (previous window's end)
+    Returns (simulated_data, prices_by_symbol, oracle_data).
+    """
+    num_seconds = WINDOW_SECONDS
     simulated_data = {
-        'timestamp': timestamp,
-        'datetime': current_dt.isoformat(),
+        'timestamp': generated_at,
+        'datetime': datetime.utcfromtimestamp(start_timestamp).isoformat(),
         'start_timestamp': start_timestamp,
-        'end_timestamp': start_timestamp + 600,
+        'end_timestamp': start_timestamp + num_seconds,
         'resolution': '1sec',
+        'seed': seed,
+        'checkpoint_interval': CHECKPOINT_INTERVAL,
         'assets': {}
     }
 
-    for symbol, asset_history in history_data['assets'].items():
-        if asset_history is None or not asset_history.get('data_points'):
+    # Calculate statistics for every asset first, then simulate them all in one batch
+    batch = []
+    for symbol, inputs in asset_inputs.items():
+        if inputs is None:
             print(f"Skipping {symbol} - no price data available")
             simulated_data['assets'][symbol] = None
             continue
 
-        try:
-            data_points = asset_history['data_points']
-
-            # Convert collected prices to candle format for calculate_statistics
-            candles = []
-            for point in data_points:
-                candles.append({
-                    'close': point['price'],
-                    'timestamp': point['timestamp']
-                })
-
-            last_price = data_points[-1]['price']  # Most recent price
+        last_price, mean_return, volatility, trend = inputs
+        print(f"📊 {symbol}: mean_return={mean_return:.6f}, volatility={volatility:.4f}, trend={trend:+.2%}")
 
-            # Calculate statistics from historical data
-            mean_return, volatility, trend = calculate_statistics(candles)
+        batch.append((symbol, start_prices.get(symbol, last_price), last_price, mean_return, volatility, trend))
 
-            print(f"📊 {symbol}: mean_return={mean_return:.6f}, volatility={volatility:.4f}, trend={trend:+.2%}")
+    # Adjust drift to include trend component, distributed over the 10-minute period
+    drifts = [mean_return + (trend / num_seconds) for _, _, _, mean_return, _, trend in batch]
+    volatilities = [volatility * 2 for _, _, _, _, volatility, _ in batch]  # Amplify for more interesting simulation
 
-            # Generate 600 simulated prices for next 10 minutes
-            random.seed(int(timestamp) + hash(symbol) % 10000)
-            simulated_prices = generate_second_prices(
-                start_price=last_price,
-                mean_return=mean_return,
-                volatility=volatility * 2,  # Amplify for more interesting simulation
-                trend=trend,
-                num_seconds=600
+    # Generate 600 simulated prices for the window, for all assets at once
+    price_matrix = None
+    if batch:
+        try:
+            price_matrix, checkpoint_matrix = generate_price_matrix(
+                start_prices=[b[1] for b in batch],
+                drifts=drifts,
+                volatilities=volatilities,
+                keys=[stream_key(seed, b[0]) for b in batch],
+                num_seconds=num_seconds
             )
+        except Exception as e:
+            print(f"Error running batch simulation: {str(e)}")
+            for symbol, *_ in batch:
+                simulated_data['assets'][symbol] = None
+            batch = []
+
+    simulated_prices_by_symbol = {}
+    for row, (symbol, start_price, last_price, mean_return, volatility, trend) in enumerate(batch):
+        simulated_prices = [round(float(price), 4) for price in price_matrix[row]]
+        simulated_prices_by_symbol[symbol] = simulated_prices
+
+        # Calculate summary statistics for the simulated 10-minute period
+        # (per-second timestamps are derived from start_timestamp by readers)
+        simulated_data['assets'][symbol] = {
+            'count': len(simulated_prices),
+            'start_price': simulated_prices[0],
+            'end_price': simulated_prices[-1],
+            'period_high': max(simulated_prices),
+            'period_low': min(simulated_prices),
+            'period_change': simulated_prices[-1] - simulated_prices[0],
+            'period_change_percent': ((simulated_prices[-1] - simulated_prices[0]) / simulated_prices[0] * 100),
+            'based_on': {
+                'historical_mean_return': mean_return,
+                'historical_volatility': volatility,
+                'historical_trend': trend,
+                'historical_last_price': last_price
+            },
+            # Parameters price_oracle.price_at needs to regenerate any second of the path
+            'oracle': {
+                'drift': drifts[row],
+                'volatility': volatilities[row],
+                'floor': start_price * PRICE_FLOOR_RATIO,
+                'checkpoints': [float(price) for price in checkpoint_matrix[row]]
+            }
+        }
 
-            # Create timestamped price data
-            second_data = []
-            for i, price in enumerate(simulated_prices):
-                second_timestamp = start_timestamp + i
-                second_data.append({
-                    'second': i,
-                    'timestamp': second_timestamp,
-                    'datetime': datetime.fromtimestamp(second_timestamp).isoformat(),
-                    'price': price
-                })
+        change_pct = simulated_data['assets'][symbol]['period_change_percent']
+        print(f"✓ {symbol}: Generated 600 prices, ${simulated_prices[0]:.2f} → ${simulated_prices[-1]:.2f} ({change_pct:+.2f}%)")
 
-            # Calculate summary statistics for the simulated 10-minute period
-            simulated_data['assets'][symbol] = {
-                'seconds': second_data,
-                'count': len(second_data),
-                'start_price': simulated_prices[0],
-                'end_price': simulated_prices[-1],
-                'period_high': max(simulated_prices),
-                'period_low': min(simulated_prices),
-                'period_change': simulated_prices[-1] - simulated_prices[0],
-                'period_change_percent': ((simulated_prices[-1] - simulated_prices[0]) / simulated_prices[0] * 100),
-                'based_on': {
-                    'historical_mean_return': mean_return,
-                    'historical_volatility': volatility,
-                    'historical_trend': trend,
-                    'historical_last_price': last_price
-                }
-            }
+    # Oracle parameters on their own so readers can price any second
+    # without downloading the price arrays
+    oracle_data = {
+        'start_timestamp': start_timestamp,
+        'end_timestamp': start_timestamp + num_seconds,
+        'num_seconds': num_seconds,
+        'seed': seed,
+        'checkpoint_interval': CHECKPOINT_INTERVAL,
+        'assets': {
+            symbol: asset['oracle']
+            for symbol, asset in simulated_data['assets'].items() if asset is not None
+        }
+    }
 
-            change_pct = simulated_data['assets'][symbol]['period_change_percent']
-            print(f"✓ {symbol}: Generated 600 prices, ${simulated_prices[0]:.2f} → ${simulated_prices[-1]:.2f} ({change_pct:+.2f}%)")
+    return simulated_data, simulated_prices_by_symbol, oracle_data
 
-        except Exception as e:
-            print(f"Error simulating {symbol}: {str(e)}")
-            simulated_data['assets'][symbol] = None
 
-    # Store simulated data in S3
-    s3_key = f"simulated_data/{date_str}/{time_str}_simulated_1sec.json"
+def store_window(market_data_bucket, simulated_data, prices_by_symbol, oracle_data):
+    """
+    Write a window to the archive and to its ring slot. Returns its ring manifest entry;
+    the manifest itself is only updated once the slot objects are in place.
+    """
+    start_timestamp = simulated_data['start_timestamp']
+    window_metadata = {k: v for k, v in simulated_data.items() if k != 'assets'}
+    slot = slot_for(start_timestamp, RING_SLOTS)
+    window_key, oracle_key = slot_keys(slot)
+
+    # Archive copy, named after the window it covers
+    start_dt = datetime.utcfromtimestamp(start_timestamp)
+    archive_key = f"simulated_data/{start_dt.strftime('%Y-%m-%d')}/{start_dt.strftime('%H-%M-%S')}_simulated_1sec.bin"
 
     try:
+        size = write_window(
+            s3_client, market_data_bucket, archive_key,
+            window_metadata, simulated_data['assets'], prices_by_symbol,
+            itemsize=PRICE_ITEMSIZE
+        )
+        print(f"Simulated data saved to s3://{market_data_bucket}/{archive_key} ({size} bytes)")
+
+        write_window(
+            s3_client, market_data_bucket, window_key,
+            window_metadata, simulated_data['assets'], prices_by_symbol,
+            itemsize=PRICE_ITEMSIZE
+        )
         s3_client.put_object(
             Bucket=market_data_bucket,
-            Key=s3_key,
-            Body=json.dumps(simulated_data, indent=2),
+            Key=oracle_key,
+            Body=json.dumps(oracle_data),
             ContentType='application/json'
         )
-        print(f"Simulated data saved to s3://{market_data_bucket}/{s3_key}")
+        print(f"Window {start_dt.strftime('%H:%M')} published to slot {slot}")
     except Exception as e:
         print(f"Error saving simulated data to S3: {str(e)}")
         raise
 
-    # Update latest simulated data
-    latest_key = "simulated_data/latest_simulated_1sec.json"
+    return {
+        'start_timestamp': start_timestamp,
+        'end_timestamp': simulated_data['end_timestamp'],
+        'slot': slot,
+        'seed': simulated_data['seed'],
+        'window_key': window_key,
+        'oracle_key': oracle_key,
+        'archive_key': archive_key,
+        'published_at': datetime.utcnow().isoformat(),
+        'end_prices': {symbol: prices[-1] for symbol, prices in prices_by_symbol.items()}
+    }
+
+
+def settle_orders(market_data_bucket, timestamp):
+    """Settle resting limit/stop orders against windows that have now fully elapsed"""
+    if not os.environ.get('ORDERS_TABLE'):
+        return []
     try:
-        s3_client.put_object(
-            Bucket=market_data_bucket,
-            Key=latest_key,
-            Body=json.dumps(simulated_data, indent=2),
-            ContentType='application/json'
+        return settle_elapsed_windows(
+            s3_client, market_data_bucket,
+            dynamodb.Table(os.environ['USERS_TABLE']),
+            dynamodb.Table(os.environ['TRADES_TABLE']),
+            dynamodb.Table(os.environ['ORDERS_TABLE']),
+            timestamp
         )
-        print(f"Latest simulated data updated at s3://{market_data_bucket}/{latest_key}")
     except Exception as e:
-        print(f"Error updating latest simulated data: {str(e)}")
+        # Orders stay open and are settled on a later run
+        print(f"Error settling resting orders: {str(e)}")
+        return []
+
+
+def lambda_handler(event, context):
+    """
+    Generates 600 simulated prices (1 per second) for each clock-aligned 10-minute window,
+    publishing the current window and the next SIMULATION_WINDOWS_AHEAD ones into the ring,
+    based on statistical distribution from the PAST 60 minutes collected price data.
+    While nobody is online no windows are simulated (pass {"force": true} to run anyway;
+    it still only fills windows that are not published yet);
+    the first player back wakes the simulator up.
+    """
+    market_data_bucket = os.environ['MARKET_DATA_BUCKET']
+
+    timestamp = int(time.time())
+    force = bool((event or {}).get('force'))
+
+    if not force and pipeline_idle(s3_client, market_data_bucket):
+        print("No active players - simulation skipped")
+        # Windows published before the idle spell may still have orders to settle
+        settlements = settle_orders(market_data_bucket, timestamp)
+        return {
+            'statusCode': 200,
+            'body': json.dumps({
+                'message': 'Price simulation skipped: no active players',
+                'windows_published': 0,
+                'settlements': settlements,
+                'timestamp': timestamp
+            })
+        }
+
+    # Prefer the rolling statistics the collector publishes every minute
+    asset_inputs = None
+    try:
+        rolling, _ = load_stats(s3_client, market_data_bucket)
+        if rolling:
+            newest = max(stats.last_timestamp for stats in rolling.values())
+            if timestamp - newest <= STATS_MAX_AGE_SECONDS:
+                asset_inputs = {
+                    symbol: (stats.last_price, *stats.statistics()) for symbol, stats in rolling.items()
+                }
+                readiness = window_stats(rolling, TRACKED_ASSETS)
+                print(f"Loaded rolling stats for {len(asset_inputs)} assets")
+            else:
+                print(f"Rolling stats are {timestamp - newest}s old, recomputing from history")
+    except Exception as e:
+        print(f"Error loading rolling stats, recomputing from history: {str(e)}")
+
+    # Otherwise compute them from the collected price history (past hour - 60 minutes of data)
+    if asset_inputs is None:
+        try:
+            history_data = load_history(s3_client, market_data_bucket, TRACKED_ASSETS)
+            print(f"Loaded price history for {len(history_data['assets'])} assets")
+            readiness = history_data['stats']
+        except Exception as e:
+            print(f"Error loading price history: {str(e)}")
+            raise
+
+        asset_inputs = {}
+        for symbol, asset_history in history_data['assets'].items():
+            if asset_history is None or not asset_history.get('data_points'):
+                asset_inputs[symbol] = None
+                continue
+
+            data_points = asset_history['data_points']
+
+            # Convert collected prices to candle format for calculate_statistics
+            candles = []
+            for point in data_points:
+                candles.append({
+                    'close': point['price'],
+                    'timestamp': point['timestamp']
+                })
+
+            last_price = data_points[-1]['price']  # Most recent price
+            asset_inputs[symbol] = (last_price, *calculate_statistics(candles))
+
+    # Check if we have enough data
+    if not readiness['ready_for_simulation']:
+        print(f"⚠️  Warning: Only {readiness['assets_with_full_hour']} assets have full 60min data")
+
+    # Windows are aligned to the clock; publish the current one and the next few ahead
+    current_start = window_start(timestamp)
+    targets = [current_start + k * WINDOW_SECONDS for k in range(WINDOWS_AHEAD + 1)]
+
+    manifest, _ = load_ring(s3_client, market_data_bucket)
+    published = {entry['start_timestamp']: entry for entry in (manifest or {}).get('windows', [])}
+
+    entries = []
+    previous = published.get(current_start - WINDOW_SECONDS)
+    for start_timestamp in targets:
+        # Published windows are never replaced: quotes and order fills already used their prices
+        if start_timestamp in published:
+            previous = published[start_timestamp]
+            continue
+
+        # Seed each window so its paths can be replayed (pass {"seed": ...} to reproduce a run)
+        if 'seed' in (event or {}):
+            seed = int(event['seed']) + (start_timestamp - current_start)
+        else:
+            seed = start_timestamp
+
+        # Chain from the previous window's end so consecutive windows join up
+        start_prices = previous['end_prices'] if previous else {}
+
+        simulated_data, prices_by_symbol, oracle_data = simulate_window(
+            asset_inputs, start_prices, start_timestamp, seed, timestamp
+        )
+        entry = store_window(market_data_bucket, simulated_data, prices_by_symbol, oracle_data)
+        entries.append(entry)
+        previous = entry
+
+    if entries:
+        try:
+            publish_entries(s3_client, market_data_bucket, entries, RING_SLOTS)
+            print(f"Ring updated with {len(entries)} window(s) at s3://{market_data_bucket}/{RING_MANIFEST_KEY}")
+        except Exception as e:
+            print(f"Error updating ring manifest: {str(e)}")
+            raise
+    else:
+        print("All upcoming windows already published")
+
+    settlements = settle_orders(market_data_bucket, timestamp)
 
     return {
         'statusCode': 200,
         'body': json.dumps({
             'message': 'Price simulation completed successfully',
-            's3_key': s3_key,
-            'assets_simulated': len([a for a in simulated_data['assets'].values() if a is not None]),
+            's3_keys': [entry['archive_key'] for entry in entries],
+            'windows_published': len(entries),
+            'settlements': settlements,
+            'assets_simulated': len([a for a in asset_inputs.values() if a is not None]),
             'timestamp': timestamp,
-            'simulation_period': f"{datetime.fromtimestamp(start_timestamp).strftime('%H:%M')} - {datetime.fromtimestamp(start_timestamp + 600).strftime('%H:%M')}"
+            'simulation_period': f"{datetime.utcfromtimestamp(targets[0]).strftime('%H:%M')} - {datetime.utcfromtimestamp(targets[-1] + WINDOW_SECONDS).strftime('%H:%M')}"
         })
     }
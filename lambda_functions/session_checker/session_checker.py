@@ -2,14 +2,18 @@ import json
 import os
 import boto3
 import time
+from parallel_scan import parallel_count
+from activity import publish_sessions
 
 dynamodb = boto3.resource('dynamodb')
+s3_client = boto3.client('s3')
 
 def lambda_handler(event, context):
     """
     Checks for active user sessions.
-    This function is triggered every 15 minutes by EventBridge.
-    It verifies if any users are actively connected before releasing news.
+    This function is triggered every 5 minutes by EventBridge.
+    It verifies if any users are actively connected and publishes the count to the
+    activity signal the simulation pipeline and news generator are gated on.
     """
     sessions_table_name = os.environ['SESSIONS_TABLE']
     sessions_table = dynamodb.Table(sessions_table_name)
@@ -17,23 +21,24 @@ def lambda_handler(event, context):
     current_time = int(time.time())
 
     try:
-        # Scan for active sessions (sessions that haven't expired)
-        response = sessions_table.scan(
-            FilterExpression='expires_at > :current_time',
-            ExpressionAttributeValues={
+        # Count active sessions (sessions that haven't expired) with a parallel scan
+        active_count = parallel_count(
+            sessions_table,
+            filter_expression='expires_at > :current_time',
+            expression_values={
                 ':current_time': current_time
             }
         )
 
-        active_sessions = response.get('Items', [])
-        active_count = len(active_sessions)
-
         print(f"Found {active_count} active sessions")
 
+        try:
+            publish_sessions(s3_client, os.environ['MARKET_DATA_BUCKET'], active_count, current_time)
+        except Exception as e:
+            print(f"Error publishing activity: {str(e)}")
+
         if active_count > 0:
             print("Active users detected - news should be visible")
-            # In a more sophisticated implementation, you could trigger
-            # a notification or update mechanism here
             return {
                 'statusCode': 200,
                 'body': json.dumps({
@@ -0,0 +1,139 @@
+"""
+Whether anyone is using the game right now.
+
+Players poll the prices API every few seconds, so api_get_prices records a
+heartbeat (at most once per HEARTBEAT_INTERVAL_SECONDS per container), and
+session_checker adds the active session count. Both go into one small object:
+
+    activity/status.json
+        {last_active_at, active_sessions, sessions_checked_at, updated_at}
+
+The scheduled pipeline (collector, simulator, news generator, ranker) reads it
+and skips or throttles its heavy stages once nobody has been seen for
+IDLE_AFTER_SECONDS. The first heartbeat after an idle spell wakes the pipeline
+up straight away instead of waiting for the next schedule. Without any
+activity object yet, nothing counts as idle.
+"""
+import json
+import os
+import time
+from datetime import datetime
+
+from botocore.exceptions import ClientError
+
+ACTIVITY_KEY = 'activity/status.json'
+ACTIVITY_RETRIES = 3
+
+# No heartbeat or active session for this long counts as idle (seconds)
+IDLE_AFTER_SECONDS = int(os.environ.get('IDLE_AFTER_SECONDS', '900'))
+
+HEARTBEAT_INTERVAL_SECONDS = 60
+
+# Last heartbeat written by this container
+_last_heartbeat = 0.0
+
+
+def load_activity(s3_client, bucket):
+    """(activity, etag), or (None, None) if no activity was ever recorded"""
+    try:
+        response = s3_client.get_object(Bucket=bucket, Key=ACTIVITY_KEY)
+    except s3_client.exceptions.NoSuchKey:
+        return None, None
+    return json.loads(response['Body'].read().decode('utf-8')), response.get('ETag')
+
+
+def is_idle(activity, now=None):
+    """True if nobody was active within IDLE_AFTER_SECONDS (never for a missing signal)"""
+    if not activity:
+        return False
+    now = time.time() if now is None else now
+    return now - activity.get('last_active_at', 0) > IDLE_AFTER_SECONDS
+
+
+def pipeline_idle(s3_client, bucket):
+    """
+    is_idle for the stored activity. Errors reading it count as active, so a
+    broken signal never stops the pipeline.
+    """
+    try:
+        activity, _ = load_activity(s3_client, bucket)
+    except Exception as e:
+        print(f"Error loading activity, assuming active: {str(e)}")
+        return False
+    return is_idle(activity)
+
+
+def _update_activity(s3_client, bucket, change):
+    """
+    Apply change(activity) to the stored activity with a conditional PUT, re-reading
+    on conflict. Returns the activity as it was before the change (None if new).
+    """
+    for _ in range(ACTIVITY_RETRIES):
+        previous, etag = load_activity(s3_client, bucket)
+        activity = change(dict(previous or {}))
+        activity['updated_at'] = datetime.utcnow().isoformat()
+
+        condition = {'IfMatch': etag} if etag else {'IfNoneMatch': '*'}
+        try:
+            s3_client.put_object(
+                Bucket=bucket,
+                Key=ACTIVITY_KEY,
+                Body=json.dumps(activity),
+                ContentType='application/json',
+                **condition
+            )
+            return previous
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') not in ('PreconditionFailed', 'ConditionalRequestConflict'):
+                raise
+
+    raise RuntimeError('Activity kept changing; giving up after retries')
+
+
+def record_heartbeat(s3_client, bucket, now=None):
+    """
+    Mark the game as in use now. Throttled per container; returns True only when
+    this heartbeat ended an idle spell (the pipeline should catch up).
+    """
+    global _last_heartbeat
+    now = time.time() if now is None else now
+    if now - _last_heartbeat < HEARTBEAT_INTERVAL_SECONDS:
+        return False
+    _last_heartbeat = now
+
+    def beat(activity):
+        activity['last_active_at'] = max(activity.get('last_active_at', 0), int(now))
+        return activity
+
+    previous = _update_activity(s3_client, bucket, beat)
+    return previous is not None and is_idle(previous, now)
+
+
+def publish_sessions(s3_client, bucket, active_sessions, now=None):
+    """Record session_checker's count; any active session marks the game as in use"""
+    now = int(time.time() if now is None else now)
+
+    def publish(activity):
+        activity['active_sessions'] = active_sessions
+        activity['sessions_checked_at'] = now
+        if active_sessions > 0:
+            activity['last_active_at'] = max(activity.get('last_active_at', 0), now)
+        else:
+            activity.setdefault('last_active_at', 0)
+        return activity
+
+    return _update_activity(s3_client, bucket, publish)
+
+
+def wake_pipeline(lambda_client, function_names):
+    """Start each function asynchronously so idle-skipped work catches up now"""
+    for function_name in function_names:
+        try:
+            lambda_client.invoke(
+                FunctionName=function_name,
+                InvocationType='Event',
+                Payload=json.dumps({'source': 'activity.wake'}).encode('utf-8')
+            )
+            print(f"Woke {function_name} after an idle spell")
+        except Exception as e:
+            print(f"Error waking {function_name}: {str(e)}")
@@ -0,0 +1,163 @@
+"""
+Pool of pre-generated news articles, keyed by (category, topic).
+
+News topics come from a small, enumerable space (currency pair x direction x
+topic template per category), so articles can be generated ahead of time. The
+news generator's refill mode tops up every topic to POOL_DEPTH articles; the
+scheduled run then draws one pooled article per planned topic and only calls
+the model for topics the pool has run out of.
+
+The pool is one gzipped JSON object in the news bucket:
+
+    cache/article_pool.json.gz
+        {updated_at, topics: {"<category>|<topic>": {category, topic, last_used,
+                                                     articles: [{headline, article, generated_at}]}}}
+
+Articles expire POOL_TTL_SECONDS after generation. When more than
+POOL_MAX_TOPICS topics are held, the least recently used ones are evicted.
+Writers swap the object with a conditional PUT and re-apply their change on
+conflict.
+"""
+import gzip
+import json
+import os
+import time
+from datetime import datetime
+
+from botocore.exceptions import ClientError
+
+POOL_KEY = 'cache/article_pool.json.gz'
+POOL_RETRIES = 5
+
+# Ready articles kept per topic
+POOL_DEPTH = int(os.environ.get('NEWS_POOL_DEPTH', '2'))
+
+# Pooled articles older than this are no longer published (seconds)
+POOL_TTL_SECONDS = int(os.environ.get('NEWS_POOL_TTL_SECONDS', '21600'))
+
+POOL_MAX_TOPICS = int(os.environ.get('NEWS_POOL_MAX_TOPICS', '512'))
+
+
+def topic_key(category, topic):
+    return f"{category}|{topic}"
+
+
+def load_pool(s3_client, bucket):
+    """(pool, etag), or an empty pool and None if none was stored yet"""
+    try:
+        response = s3_client.get_object(Bucket=bucket, Key=POOL_KEY)
+    except s3_client.exceptions.NoSuchKey:
+        return {'topics': {}}, None
+    pool = json.loads(gzip.decompress(response['Body'].read()).decode('utf-8'))
+    return pool, response.get('ETag')
+
+
+def prune_pool(pool, now):
+    """Drop expired articles, then evict least recently used topics beyond POOL_MAX_TOPICS"""
+    topics = pool['topics']
+    for entry in topics.values():
+        entry['articles'] = [
+            article for article in entry['articles']
+            if article['generated_at'] > now - POOL_TTL_SECONDS
+        ]
+
+    if len(topics) > POOL_MAX_TOPICS:
+        by_use = sorted(topics, key=lambda key: topics[key]['last_used'], reverse=True)
+        for key in by_use[POOL_MAX_TOPICS:]:
+            del topics[key]
+
+
+def update_pool(s3_client, bucket, change):
+    """
+    Apply change(pool, now) to the stored pool (after pruning) and write it back.
+    Returns what change returned.
+    """
+    for _ in range(POOL_RETRIES):
+        pool, etag = load_pool(s3_client, bucket)
+        now = time.time()
+        prune_pool(pool, now)
+        result = change(pool, now)
+        pool['updated_at'] = datetime.utcnow().isoformat()
+
+        condition = {'IfMatch': etag} if etag else {'IfNoneMatch': '*'}
+        try:
+            s3_client.put_object(
+                Bucket=bucket,
+                Key=POOL_KEY,
+                Body=gzip.compress(json.dumps(pool, separators=(',', ':')).encode('utf-8')),
+                ContentType='application/json',
+                ContentEncoding='gzip',
+                **condition
+            )
+            return result
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') not in ('PreconditionFailed', 'ConditionalRequestConflict'):
+                raise
+
+    raise RuntimeError('Article pool kept changing; giving up after retries')
+
+
+def draw_articles(s3_client, bucket, topics):
+    """
+    Take one pooled article (oldest first) for each (category, topic); each article
+    is published once. Returns a list aligned with topics holding
+    {headline, article} or None where the pool had nothing for the topic.
+    """
+    def draw(pool, now):
+        drawn = []
+        for category, topic in topics:
+            entry = pool['topics'].get(topic_key(category, topic))
+            if entry and entry['articles']:
+                article = entry['articles'].pop(0)
+                entry['last_used'] = now
+                drawn.append({'headline': article['headline'], 'article': article['article']})
+            else:
+                drawn.append(None)
+        return drawn
+
+    return update_pool(s3_client, bucket, draw)
+
+
+def add_articles(s3_client, bucket, generated):
+    """
+    Pool generated articles: (category, topic, headline, article) tuples. Each topic
+    keeps at most POOL_DEPTH articles. Returns the number of articles added.
+    """
+    def add(pool, now):
+        added = 0
+        for category, topic, headline, article in generated:
+            entry = pool['topics'].setdefault(topic_key(category, topic), {
+                'category': category,
+                'topic': topic,
+                'last_used': now,
+                'articles': []
+            })
+            if len(entry['articles']) < POOL_DEPTH:
+                entry['articles'].append({'headline': headline, 'article': article, 'generated_at': now})
+                added += 1
+        return added
+
+    return update_pool(s3_client, bucket, add)
+
+
+def pool_shortfall(pool, topics, now):
+    """
+    (category, topic) for every article the pool lacks to hold POOL_DEPTH fresh
+    articles per topic, emptiest topics first.
+    """
+    needed = []
+    for category, topic in topics:
+        entry = pool['topics'].get(topic_key(category, topic))
+        fresh = sum(
+            1 for article in (entry['articles'] if entry else [])
+            if article['generated_at'] > now - POOL_TTL_SECONDS
+        )
+        needed.append((fresh, category, topic))
+
+    needed.sort(key=lambda item: item[0])
+    return [
+        (category, topic)
+        for depth in range(POOL_DEPTH)
+        for fresh, category, topic in needed
+        if fresh <= depth
+    ]
@@ -0,0 +1,104 @@
+"""
+Per-user equity snapshots taken at the start of each leaderboard period.
+
+Windowed leaderboards (hourly, daily) rank P/L since the period started, which
+is the difference between a user's equity now and in the snapshot taken when
+the period began; nothing is replayed from the trade journal. The ranker's
+first run of a period writes its snapshot, also while nobody is online, so a
+period starts within one ranker interval of its boundary. A snapshot is only
+ever taken from a valuation at simulated prices, never from cash alone:
+
+    leaderboard/equity/<period_start>.npy    user_ids (sorted) and their equity
+
+Hourly and daily periods share the snapshot at each day's first hour. Users
+created after the snapshot start from INITIAL_BALANCE.
+"""
+import io
+
+import numpy as np
+from botocore.exceptions import ClientError
+
+EQUITY_PREFIX = 'leaderboard/equity/'
+CONTENT_TYPE = 'application/octet-stream'
+
+PERIOD_SECONDS = {
+    'hourly': 3600,
+    'daily': 86400
+}
+
+
+def period_start(period, timestamp):
+    """Start of the (UTC-aligned) period containing timestamp"""
+    seconds = PERIOD_SECONDS[period]
+    return int(timestamp) - int(timestamp) % seconds
+
+
+def equity_key(start):
+    return f"{EQUITY_PREFIX}{start}.npy"
+
+
+def encode_equity(user_ids, equity):
+    """Snapshot bytes: a structured array of (user_id, equity) sorted by user_id"""
+    ids = np.array([user_id.encode('utf-8') for user_id in user_ids], dtype=bytes)
+    records = np.empty(len(ids), dtype=[('user_id', ids.dtype), ('equity', '<f8')])
+    records['user_id'] = ids
+    records['equity'] = equity
+    records.sort(order='user_id')
+
+    buffer = io.BytesIO()
+    np.save(buffer, records, allow_pickle=False)
+    return buffer.getvalue()
+
+
+def write_equity(s3_client, bucket, start, user_ids, equity):
+    """
+    Store the snapshot for a period start unless one exists already (the first
+    writer wins, so a period's baseline never moves). Returns True if written.
+    """
+    try:
+        s3_client.put_object(
+            Bucket=bucket,
+            Key=equity_key(start),
+            Body=encode_equity(user_ids, equity),
+            ContentType=CONTENT_TYPE,
+            IfNoneMatch='*'
+        )
+        return True
+    except ClientError as e:
+        if e.response.get('Error', {}).get('Code') in ('PreconditionFailed', 'ConditionalRequestConflict'):
+            return False
+        raise
+
+
+def has_equity(s3_client, bucket, start):
+    """True if the snapshot for a period start was taken"""
+    try:
+        s3_client.head_object(Bucket=bucket, Key=equity_key(start))
+        return True
+    except ClientError as e:
+        if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey'):
+            return False
+        raise
+
+
+def load_equity(s3_client, bucket, start):
+    """The snapshot records for a period start, or None if it was never taken"""
+    try:
+        response = s3_client.get_object(Bucket=bucket, Key=equity_key(start))
+    except s3_client.exceptions.NoSuchKey:
+        return None
+    return np.load(io.BytesIO(response['Body'].read()), allow_pickle=False)
+
+
+def baseline_equity(records, user_ids, default):
+    """Each user's equity in a snapshot (default for users it does not contain)"""
+    ids = np.array([user_id.encode('utf-8') for user_id in user_ids], dtype=bytes)
+    baseline = np.full(len(ids), float(default))
+    if len(records) == 0 or len(ids) == 0:
+        return baseline
+
+    positions = np.searchsorted(records['user_id'], ids)
+    found = positions < len(records)
+    found[found] = records['user_id'][positions[found]] == ids[found]
+    baseline[found] = records['equity'][positions[found]]
+    return baseline
@@ -0,0 +1,141 @@
+"""
+Live changes on top of the last full leaderboard mark.
+
+leaderboard_ranker re-marks every user to market once per simulation window.
+Between marks, leaderboard_updater consumes the users table stream and revalues
+only the users whose balance or holdings changed, recording their entries as
+one item per user in the leaderboard table:
+
+    period = '<period>#live', rank = user_key(user_id)
+        {user_id, entry, updated_at, created_at?, ttl}
+
+Every user's item is written on its own (a conditional update that never goes
+back in time), so concurrent stream batches never contend with each other.
+Readers query the live partition and merge it into the ranked snapshot.
+Changes older than the snapshot's marked_at are already part of it and are
+ignored; items expire OVERLAY_TTL_SECONDS after their last change.
+"""
+import hashlib
+import time
+from decimal import Decimal
+
+# Live items outlast several full marks, after which they are always covered
+OVERLAY_TTL_SECONDS = 3600
+
+# Entry fields kept as integers; every other number is a float
+INT_FIELDS = ('rank', 'total_trades')
+
+
+def overlay_period(period):
+    return f"{period}#live"
+
+
+def user_key(user_id):
+    """Numeric sort key of a user's live item (rank is the table's numeric range key)"""
+    return int.from_bytes(hashlib.sha256(user_id.encode('utf-8')).digest()[:7], 'big')
+
+
+def _to_item_value(value):
+    if isinstance(value, float):
+        return Decimal(str(value))
+    if isinstance(value, dict):
+        return {key: _to_item_value(item) for key, item in value.items()}
+    return value
+
+
+def _from_item_value(key, value):
+    if isinstance(value, Decimal):
+        return int(value) if key in INT_FIELDS else float(value)
+    if isinstance(value, dict):
+        return {name: _from_item_value(name, item) for name, item in value.items()}
+    return value
+
+
+def load_overlay(leaderboard_table, period, now=None):
+    """{'users': {user_id: {entry, updated_at, created_at}}} for a period's unexpired live items"""
+    now = int(time.time() if now is None else now)
+    request = {
+        'KeyConditionExpression': '#period = :period',
+        'FilterExpression': '#ttl > :now',
+        'ExpressionAttributeNames': {'#period': 'period', '#ttl': 'ttl'},
+        'ExpressionAttributeValues': {':period': overlay_period(period), ':now': now}
+    }
+
+    users = {}
+    while True:
+        response = leaderboard_table.query(**request)
+        for item in response.get('Items', []):
+            users[item['user_id']] = {
+                'entry': _from_item_value('entry', item['entry']),
+                'updated_at': float(item['updated_at']),
+                'created_at': float(item['created_at']) if 'created_at' in item else None
+            }
+        if 'LastEvaluatedKey' not in response:
+            return {'users': users}
+        request['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+
+def live_users(overlay, marked_at):
+    """
+    {user_id: {entry, updated_at, new}} for the overlay changes the snapshot marked
+    at marked_at does not include; new users were created since that mark.
+    """
+    return {
+        user_id: {
+            'entry': change['entry'],
+            'updated_at': change['updated_at'],
+            'new': change['created_at'] is not None and change['created_at'] >= marked_at
+        }
+        for user_id, change in (overlay or {}).get('users', {}).items()
+        if change['updated_at'] >= marked_at
+    }
+
+
+def update_overlay(leaderboard_table, period, changes):
+    """
+    Record {user_id: {entry, updated_at, new}} in a period's live items. A change
+    older than the one already stored for the user is dropped. Returns the number
+    of users written.
+    """
+    client = leaderboard_table.meta.client
+    written = 0
+    for user_id, change in changes.items():
+        assignments = ['user_id = :user_id', 'entry = :entry', 'updated_at = :updated_at', '#ttl = :ttl']
+        values = {
+            ':user_id': user_id,
+            ':entry': _to_item_value(change['entry']),
+            ':updated_at': _to_item_value(float(change['updated_at'])),
+            ':ttl': int(change['updated_at']) + OVERLAY_TTL_SECONDS
+        }
+        if change['new']:
+            # Counted as a new user until the next full mark includes them
+            assignments.append('created_at = :updated_at')
+
+        try:
+            leaderboard_table.update_item(
+                Key={'period': overlay_period(period), 'rank': user_key(user_id)},
+                UpdateExpression='SET ' + ', '.join(assignments),
+                ConditionExpression='attribute_not_exists(updated_at) OR updated_at <= :updated_at',
+                ExpressionAttributeNames={'#ttl': 'ttl'},
+                ExpressionAttributeValues=values
+            )
+            written += 1
+        except client.exceptions.ConditionalCheckFailedException:
+            # A newer change of this user was recorded first
+            continue
+    return written
+
+
+def merge_live(entries, live, limit):
+    """
+    Top `limit` entries after replacing snapshot entries (best first) with the live
+    entries of the users who changed since. Ranks are reassigned.
+    """
+    merged = [entry for entry in entries if entry['user_id'] not in live]
+    merged.extend(dict(change['entry']) for change in live.values())
+    merged.sort(key=lambda entry: entry['profit_loss'], reverse=True)
+
+    merged = merged[:limit]
+    for rank, entry in enumerate(merged, start=1):
+        entry['rank'] = rank
+    return merged
@@ -0,0 +1,95 @@
+"""
+Leaderboard entries from user items valued at one simulated second.
+
+Shared by the full re-mark (leaderboard_ranker, every user) and the incremental
+updates from trade events (leaderboard_updater, only the users who changed).
+Users are valued once; each leaderboard period then only differs in the
+baseline equity its P/L is measured from.
+"""
+import numpy as np
+
+from trade_ledger import INITIAL_BALANCE as _INITIAL_BALANCE
+from valuation import HoldingsMatrix, priced_symbols, window_prices
+
+INITIAL_BALANCE = float(_INITIAL_BALANCE)
+
+# Prices carry 4 decimals; rounding drops float noise from the sums
+MONEY_DECIMALS = 4
+
+
+class Valuation:
+    """Every valued user's account totals, one array element per user"""
+
+    def __init__(self, user_ids, usernames, total_trades, balances, portfolio_values):
+        self.user_ids = user_ids
+        self.usernames = usernames
+        self.total_trades = total_trades
+        self.balances = np.round(balances, MONEY_DECIMALS)
+        self.portfolio_values = np.round(portfolio_values, MONEY_DECIMALS)
+        self.total_values = np.round(self.balances + self.portfolio_values, MONEY_DECIMALS)
+
+    def __len__(self):
+        return len(self.user_ids)
+
+
+def value_users(users, window, current_second):
+    """Value every user item at the current second in one pass over the holdings matrix"""
+    usernames, total_trades = [], []
+
+    def collect(users):
+        # Keep the display fields the matrix does not hold
+        for user in users:
+            usernames.append(user.get('username', user['user_id'][:8]))  # Use username or truncated user_id as fallback
+            total_trades.append(int(user.get('total_trades', 0)))
+            yield user
+
+    symbols = priced_symbols(window)
+    holdings = HoldingsMatrix.from_users(collect(users), symbols, default_balance=INITIAL_BALANCE)
+    prices = window_prices(window, symbols, current_second) if symbols else np.zeros(0)
+
+    return Valuation(holdings.user_ids, usernames, total_trades, holdings.balances, holdings.portfolio_values(prices))
+
+
+def rank_valuation(valuation, limit, baseline=None):
+    """
+    (top entries, ranked) by P/L against baseline, each user's starting equity for
+    the period (INITIAL_BALANCE for all-time). ranked holds (user_id, username,
+    profit_loss, profit_loss_percent, total_value) for every user, best first (for
+    the rank index); full entries are built only for the best `limit`.
+    """
+    if baseline is None:
+        baseline = np.full(len(valuation), INITIAL_BALANCE)
+
+    total_values = valuation.total_values
+    profit_loss = np.round(total_values - baseline, MONEY_DECIMALS)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        profit_loss_percent = np.round(np.where(baseline > 0, profit_loss / baseline * 100, 0.0), MONEY_DECIMALS)
+
+    order = np.argsort(-profit_loss, kind='stable').tolist()
+    ranked = list(zip(
+        [valuation.user_ids[row] for row in order],
+        [valuation.usernames[row] for row in order],
+        profit_loss[order].tolist(),
+        profit_loss_percent[order].tolist(),
+        total_values[order].tolist()
+    ))
+
+    entries = []
+    for row in order[:limit]:
+        entries.append({
+            'user_id': valuation.user_ids[row],
+            'username': valuation.usernames[row],
+            'total_value': float(total_values[row]),
+            'profit_loss': float(profit_loss[row]),
+            'profit_loss_percent': float(profit_loss_percent[row]),
+            'total_trades': valuation.total_trades[row],
+            'balance': float(valuation.balances[row]),
+            'portfolio_value': float(valuation.portfolio_values[row])
+        })
+
+    return entries, ranked
+
+
+def rank_users(users, window, current_second, limit):
+    """All-time (top entries, ranked) for user items valued at the current second"""
+    return rank_valuation(value_users(users, window, current_second), limit)
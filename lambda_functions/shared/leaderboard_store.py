@@ -0,0 +1,98 @@
+"""
+Ranked leaderboard snapshots in the leaderboard table (period / rank keys).
+
+Each ranker run writes a new version under its own partition and then flips a
+pointer, so readers never see a half-written ranking:
+
+    period = '<period>#<version>', rank = 1..N   ranked entries (expire via ttl)
+    period = '<period>',           rank = 0      pointer: current version and totals
+
+Readers fetch the pointer and then query the first N ranks of that version.
+"""
+import time
+from datetime import datetime
+from decimal import Decimal
+
+POINTER_RANK = 0
+ALL_TIME = 'all_time'
+HOURLY = 'hourly'
+DAILY = 'daily'
+PERIODS = (ALL_TIME, DAILY, HOURLY)
+
+# Old versions are only read by requests already in flight when the pointer flips
+SNAPSHOT_TTL_SECONDS = 3600
+
+
+def snapshot_period(period, version):
+    return f"{period}#{version}"
+
+
+def _to_decimal(value):
+    return value if isinstance(value, Decimal) else Decimal(str(value))
+
+
+def publish_snapshot(leaderboard_table, period, entries, total_users, version=None, marked_at=None,
+                     fields=None, ttl_seconds=SNAPSHOT_TTL_SECONDS):
+    """
+    Write ranked entries (already sorted, best first) as a new version of a period
+    and point the period at it. marked_at is when the users were read (changes
+    after it are not in this snapshot); fields are extra pointer attributes.
+    Returns the version.
+    """
+    version = int(time.time() * 1000) if version is None else version
+    partition = snapshot_period(period, version)
+    expires_at = int(time.time()) + ttl_seconds
+
+    with leaderboard_table.batch_writer() as batch:
+        for rank, entry in enumerate(entries, start=1):
+            item = {
+                key: _to_decimal(value) if isinstance(value, float) else value
+                for key, value in entry.items()
+            }
+            item.update({
+                'period': partition,
+                'rank': rank,
+                'total_profit': _to_decimal(entry['profit_loss']),
+                'ttl': expires_at
+            })
+            batch.put_item(Item=item)
+
+    # Flip the pointer only once every ranked entry is in place
+    leaderboard_table.put_item(Item={
+        **(fields or {}),
+        'period': period,
+        'rank': POINTER_RANK,
+        'version': version,
+        'snapshot_period': partition,
+        'ranked_users': len(entries),
+        'total_users': total_users,
+        'marked_at': int(time.time() if marked_at is None else marked_at),
+        'generated_at': datetime.utcnow().isoformat()
+    })
+    return version
+
+
+def read_top(leaderboard_table, period, limit):
+    """(pointer, entries) for the first `limit` ranks of a period's current snapshot, or (None, [])"""
+    pointer = leaderboard_table.get_item(Key={'period': period, 'rank': POINTER_RANK}).get('Item')
+    if not pointer:
+        return None, []
+
+    request = {
+        'KeyConditionExpression': '#period = :period AND #rank BETWEEN :first AND :last',
+        'ExpressionAttributeNames': {'#period': 'period', '#rank': 'rank'},
+        'ExpressionAttributeValues': {
+            ':period': pointer['snapshot_period'],
+            ':first': 1,
+            ':last': limit
+        }
+    }
+
+    # A query returns at most 1 MB; follow the pages until every rank is read
+    items = []
+    while True:
+        response = leaderboard_table.query(**request)
+        items.extend(response.get('Items', []))
+        if 'LastEvaluatedKey' not in response:
+            return pointer, items
+        request['ExclusiveStartKey'] = response['LastEvaluatedKey']
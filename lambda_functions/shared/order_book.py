@@ -0,0 +1,150 @@
+"""
+Resting limit and stop orders.
+
+Orders live in the orders table until they fill, are rejected or cancelled.
+While an order is open it carries open_symbol, the hash key of the sparse
+OpenOrdersIndex, so settlement can query exactly the open orders for a symbol.
+
+Every order type reduces to a threshold and a crossing direction:
+
+    buy  limit  fills once the price is at or below limit_price   ('below')
+    sell limit  fills once the price is at or above limit_price   ('above')
+    buy  stop   triggers once the price is at or above stop_price ('above')
+    sell stop   triggers once the price is at or below stop_price ('below')
+
+Nothing polls for triggers: the simulator settles each elapsed window against
+its precomputed path (see order_settlement).
+"""
+import time
+import uuid
+from decimal import Decimal
+
+ORDER_TYPES = ('limit', 'stop')
+OPEN_ORDERS_INDEX = 'OpenOrdersIndex'
+
+STATUS_OPEN = 'open'
+STATUS_FILLED = 'filled'
+STATUS_REJECTED = 'rejected'
+STATUS_CANCELLED = 'cancelled'
+
+
+class OrderError(Exception):
+    """The order cannot be placed or cancelled"""
+
+
+def trigger_direction(action, order_type):
+    """'below' or 'above': which side of the threshold triggers the order"""
+    if order_type == 'limit':
+        return 'below' if action == 'buy' else 'above'
+    return 'above' if action == 'buy' else 'below'
+
+
+def new_order(user_id, symbol, action, quantity, order_type, trigger_price, created_at=None):
+    """Order item in the shape the orders table stores"""
+    return {
+        'order_id': str(uuid.uuid4()),
+        'user_id': user_id,
+        'symbol': symbol,
+        'open_symbol': symbol,
+        'action': action,
+        'quantity': quantity,
+        'order_type': order_type,
+        'trigger_price': trigger_price,
+        'direction': trigger_direction(action, order_type),
+        'status': STATUS_OPEN,
+        'created_at': int(time.time() if created_at is None else created_at)
+    }
+
+
+def place_order(orders_table, user_id, symbol, action, quantity, order_type, trigger_price):
+    """Store a resting order and return it. Funds and shares are checked when it fills."""
+    if order_type not in ORDER_TYPES:
+        raise OrderError(f'Order type must be one of: market, {", ".join(ORDER_TYPES)}')
+
+    try:
+        trigger_price = Decimal(str(trigger_price))
+    except ArithmeticError:
+        raise OrderError('Trigger price must be a number')
+    if not trigger_price.is_finite() or trigger_price <= 0:
+        raise OrderError('Trigger price must be positive')
+
+    order = new_order(user_id, symbol, action, quantity, order_type, trigger_price)
+    orders_table.put_item(Item=order, ConditionExpression='attribute_not_exists(order_id)')
+    return order
+
+
+def cancel_order(orders_table, order_id, user_id):
+    """Cancel one of the user's open orders"""
+    client = orders_table.meta.client
+    try:
+        orders_table.update_item(
+            Key={'order_id': order_id},
+            UpdateExpression='SET #status = :cancelled, closed_at = :now REMOVE open_symbol',
+            ConditionExpression='user_id = :user_id AND #status = :open',
+            ExpressionAttributeNames={'#status': 'status'},
+            ExpressionAttributeValues={
+                ':cancelled': STATUS_CANCELLED,
+                ':open': STATUS_OPEN,
+                ':user_id': user_id,
+                ':now': int(time.time())
+            }
+        )
+    except client.exceptions.ConditionalCheckFailedException:
+        raise OrderError('Order not found or no longer open')
+
+
+def close_order_item(orders_table, order_id, status, fields):
+    """
+    Transact item that closes an open order (for use alongside the fill's trade).
+    Fails the transaction if the order was cancelled or settled in the meantime.
+    """
+    names = {'#status': 'status'}
+    values = {':status': status, ':open': STATUS_OPEN}
+    assignments = ['#status = :status']
+    for i, (name, value) in enumerate(fields.items()):
+        names[f'#f{i}'] = name
+        values[f':f{i}'] = value
+        assignments.append(f'#f{i} = :f{i}')
+
+    return {
+        'Update': {
+            'TableName': orders_table.name,
+            'Key': {'order_id': order_id},
+            'UpdateExpression': 'SET ' + ', '.join(assignments) + ' REMOVE open_symbol',
+            'ConditionExpression': '#status = :open',
+            'ExpressionAttributeNames': names,
+            'ExpressionAttributeValues': values
+        }
+    }
+
+
+def load_open_orders(orders_table, symbol, created_before=None):
+    """All open orders for a symbol (optionally only those created before a timestamp)"""
+    request = {
+        'IndexName': OPEN_ORDERS_INDEX,
+        'KeyConditionExpression': 'open_symbol = :symbol',
+        'ExpressionAttributeValues': {':symbol': symbol}
+    }
+    if created_before is not None:
+        request['KeyConditionExpression'] += ' AND created_at < :before'
+        request['ExpressionAttributeValues'][':before'] = int(created_before)
+
+    orders = []
+    while True:
+        response = orders_table.query(**request)
+        orders.extend(response.get('Items', []))
+        if 'LastEvaluatedKey' not in response:
+            return orders
+        request['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+
+def close_order(orders_table, order_id, status, fields):
+    """Close an open order outside a transaction; returns False if it was no longer open"""
+    client = orders_table.meta.client
+    update = dict(close_order_item(orders_table, order_id, status, fields)['Update'])
+    del update['TableName']
+    try:
+        orders_table.update_item(**update)
+        return True
+    except client.exceptions.ConditionalCheckFailedException:
+        return False
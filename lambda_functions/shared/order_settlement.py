@@ -0,0 +1,223 @@
+"""
+Settle resting orders against elapsed simulation windows.
+
+The whole 10-minute path of every symbol is known once a window is published,
+so the fill second of every resting order is a first-crossing search, not a
+per-second check. Orders are grouped by the second they became eligible (0 for
+orders older than the window); each group needs one running min (or max) over
+the rest of the path, which is monotonic, so all of the group's thresholds are
+resolved with a single searchsorted.
+
+Fills are executed through trade_ledger at the path price of the trigger second,
+together with the order's status change in the same transaction. Users are
+settled in parallel; one user's fills are applied in time order.
+
+Orders skipped because their user kept changing are retried within the run. The
+settlement watermark only moves past a window once none of its orders is left
+skipped; otherwise the next run starts from that window again.
+"""
+import json
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from decimal import Decimal
+
+import numpy as np
+
+from order_book import STATUS_FILLED, STATUS_REJECTED, close_order, close_order_item, load_open_orders
+from sim_format import read_window
+from sim_ring import load_ring
+from trade_ledger import TradeAborted, TradeConflict, TradeRejected, execute_buy, execute_sell
+
+SETTLEMENT_KEY = 'simulated_data/settlement.json'
+SETTLE_WORKERS = 8
+
+# Passes over one window while some of its fills are skipped
+SETTLE_ROUNDS = 3
+
+
+def first_crossings(prices, thresholds, offsets, direction):
+    """
+    For each order, the first second >= its offset at which the price is at or below
+    ('below') or at or above ('above') its threshold; -1 if it never crosses.
+    """
+    prices = np.asarray(prices, dtype=np.float64)
+    thresholds = np.asarray(thresholds, dtype=np.float64)
+    offsets = np.asarray(offsets, dtype=np.int64)
+    result = np.full(len(thresholds), -1, dtype=np.int64)
+    if len(thresholds) == 0:
+        return result
+
+    order = np.argsort(offsets, kind='stable')
+    group_offsets, group_starts = np.unique(offsets[order], return_index=True)
+    group_ends = np.append(group_starts[1:], len(order))
+
+    for offset, start, end in zip(group_offsets, group_starts, group_ends):
+        if offset >= len(prices):
+            continue
+        members = order[start:end]
+        tail = prices[offset:]
+
+        if direction == 'below':
+            # Negated running minimum is non-decreasing, so it can be searched
+            running = -np.minimum.accumulate(tail)
+            index = np.searchsorted(running, -thresholds[members], side='left')
+        else:
+            running = np.maximum.accumulate(tail)
+            index = np.searchsorted(running, thresholds[members], side='left')
+
+        hit = index < len(tail)
+        result[members[hit]] = index[hit] + offset
+
+    return result
+
+
+def find_fills(window, orders):
+    """
+    Fill (order, second) pairs for one symbol's open orders within a window.
+    An order is eligible from the second it was placed (or 0 if placed earlier).
+    """
+    fills = []
+    if not orders:
+        return fills
+
+    symbol = orders[0]['symbol']
+    prices = np.asarray(window.prices(symbol), dtype=np.float64)
+
+    for direction in ('below', 'above'):
+        group = [order for order in orders if order['direction'] == direction]
+        if not group:
+            continue
+
+        thresholds = [float(order['trigger_price']) for order in group]
+        offsets = [max(0, int(order['created_at']) - window.start_timestamp) for order in group]
+        seconds = first_crossings(prices, thresholds, offsets, direction)
+
+        fills.extend((order, int(second)) for order, second in zip(group, seconds) if second >= 0)
+
+    return fills
+
+
+def _fill_order(users_table, trades_table, orders_table, window, order, second):
+    """Execute one triggered order. Returns 'filled', 'rejected' or 'skipped'."""
+    symbol = order['symbol']
+    price = Decimal(str(window.price_at(symbol, second)))
+    filled_at = window.start_timestamp + second
+    execute = execute_buy if order['action'] == 'buy' else execute_sell
+
+    try:
+        execute(
+            users_table, trades_table, order['user_id'], symbol, int(order['quantity']), price,
+            timestamp=filled_at,
+            journal_fields={'order_id': order['order_id'], 'order_type': order['order_type']},
+            extra_items=[close_order_item(orders_table, order['order_id'], STATUS_FILLED, {
+                'fill_price': price,
+                'filled_at': filled_at
+            })]
+        )
+        return 'filled'
+    except TradeRejected as e:
+        close_order(orders_table, order['order_id'], STATUS_REJECTED, {
+            'reason': str(e),
+            'closed_at': filled_at
+        })
+        return 'rejected'
+    except TradeConflict as e:
+        print(f"Order {order['order_id']} left open: {str(e)}")
+        return 'skipped'
+    except TradeAborted:
+        # The order was cancelled (or settled) while this fill was in flight
+        return 'skipped'
+
+
+def settle_window(window, users_table, trades_table, orders_table, max_workers=SETTLE_WORKERS):
+    """Fill every open order that triggers inside one window. Returns outcome counts."""
+    fills = []
+    for symbol in window.symbols:
+        if not window.has_prices(symbol):
+            continue
+        orders = load_open_orders(orders_table, symbol, created_before=window.end_timestamp)
+        fills.extend(find_fills(window, orders))
+
+    # One user's fills run in time order; different users run in parallel
+    by_user = {}
+    for order, second in sorted(fills, key=lambda fill: (fill[1], fill[0]['created_at'])):
+        by_user.setdefault(order['user_id'], []).append((order, second))
+
+    def settle_user(user_fills):
+        return [
+            _fill_order(users_table, trades_table, orders_table, window, order, second)
+            for order, second in user_fills
+        ]
+
+    counts = {'filled': 0, 'rejected': 0, 'skipped': 0}
+    if by_user:
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(by_user)))) as executor:
+            for outcomes in executor.map(settle_user, by_user.values()):
+                for outcome in outcomes:
+                    counts[outcome] += 1
+    return counts
+
+
+def _load_watermark(s3_client, bucket):
+    try:
+        response = s3_client.get_object(Bucket=bucket, Key=SETTLEMENT_KEY)
+    except s3_client.exceptions.NoSuchKey:
+        return None
+    return json.loads(response['Body'].read().decode('utf-8'))['settled_through']
+
+
+def _save_watermark(s3_client, bucket, settled_through):
+    s3_client.put_object(
+        Bucket=bucket,
+        Key=SETTLEMENT_KEY,
+        Body=json.dumps({
+            'settled_through': settled_through,
+            'updated_at': datetime.utcnow().isoformat()
+        }),
+        ContentType='application/json'
+    )
+
+
+def settle_elapsed_windows(s3_client, bucket, users_table, trades_table, orders_table, now):
+    """
+    Settle every ring window that has ended since the last settlement.
+    Windows that already left the ring are skipped; their orders stay open and
+    are checked against the next window instead.
+    """
+    manifest, _ = load_ring(s3_client, bucket)
+    elapsed = [entry for entry in (manifest or {}).get('windows', []) if entry['end_timestamp'] <= now]
+
+    settled_through = _load_watermark(s3_client, bucket)
+    if settled_through is None:
+        # First run: only settle the most recent elapsed window
+        elapsed = elapsed[-1:]
+    else:
+        elapsed = [entry for entry in elapsed if entry['end_timestamp'] > settled_through]
+
+    results = []
+    for entry in elapsed:
+        window = read_window(s3_client, bucket, entry['window_key'])
+        if window.start_timestamp != entry['start_timestamp']:
+            print(f"Slot {entry['slot']} was refilled, skipping settlement of {entry['start_timestamp']}")
+            continue
+
+        # Filled and rejected orders are closed, so another pass only retries the skipped ones
+        counts = {'filled': 0, 'rejected': 0, 'skipped': 0}
+        for _ in range(SETTLE_ROUNDS):
+            outcome = settle_window(window, users_table, trades_table, orders_table)
+            counts['filled'] += outcome['filled']
+            counts['rejected'] += outcome['rejected']
+            counts['skipped'] = outcome['skipped']
+            if not outcome['skipped']:
+                break
+
+        results.append({'start_timestamp': entry['start_timestamp'], **counts})
+        if counts['skipped']:
+            # Keep the watermark before this window; later windows wait for it
+            print(f"Window {entry['start_timestamp']} left {counts['skipped']} orders open, retrying next run")
+            break
+
+        _save_watermark(s3_client, bucket, entry['end_timestamp'])
+        print(f"Settled window {entry['start_timestamp']}: {counts}")
+
+    return results
@@ -0,0 +1,115 @@
+"""
+Parallel segmented scans for whole-table batch jobs.
+
+A DynamoDB scan can be split into TotalSegments disjoint segments that are read
+independently. Each segment is paged through on its own worker thread and pages
+are handed to the caller through a bounded queue, so items stream out as soon as
+they arrive and memory stays bounded by a few pages per worker.
+"""
+import os
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Segments (and worker threads) per scan
+SCAN_SEGMENTS = int(os.environ.get('SCAN_SEGMENTS', '16'))
+
+# Pages buffered per segment before the workers wait for the consumer
+PAGES_BUFFERED = 2
+
+_DONE = object()
+
+
+def _scan_request(projection, filter_expression, names, values, select):
+    request = {}
+    if projection:
+        # Attribute names are aliased so reserved words (e.g. "portfolio") are safe
+        if isinstance(projection, str):
+            projection = [name.strip() for name in projection.split(',')]
+        aliases = {f'#p{i}': name for i, name in enumerate(projection)}
+        request['ProjectionExpression'] = ', '.join(aliases)
+        names = {**aliases, **(names or {})}
+    if filter_expression:
+        request['FilterExpression'] = filter_expression
+    if names:
+        request['ExpressionAttributeNames'] = names
+    if values:
+        request['ExpressionAttributeValues'] = values
+    if select:
+        request['Select'] = select
+    return request
+
+
+def _put(pages, item, stop):
+    """Queue an item for the consumer; gives up once the consumer has stopped"""
+    while not stop.is_set():
+        try:
+            pages.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _scan_segment(table, request, segment, total_segments, pages, stop):
+    request = dict(request, Segment=segment, TotalSegments=total_segments)
+    try:
+        while not stop.is_set():
+            response = table.scan(**request)
+            if not _put(pages, response, stop):
+                return
+            if 'LastEvaluatedKey' not in response:
+                break
+            request['ExclusiveStartKey'] = response['LastEvaluatedKey']
+    except Exception as e:
+        _put(pages, e, stop)
+    _put(pages, _DONE, stop)
+
+
+def scan_pages(table, total_segments=None, projection=None, filter_expression=None,
+               expression_names=None, expression_values=None, select=None):
+    """
+    Yield every scan response page of a table, read by total_segments parallel
+    segments. Pages from different segments arrive interleaved.
+    """
+    total_segments = max(1, total_segments or SCAN_SEGMENTS)
+    request = _scan_request(projection, filter_expression, expression_names, expression_values, select)
+
+    pages = queue.Queue(maxsize=total_segments * PAGES_BUFFERED)
+    stop = threading.Event()
+
+    with ThreadPoolExecutor(max_workers=total_segments) as executor:
+        for segment in range(total_segments):
+            executor.submit(_scan_segment, table, request, segment, total_segments, pages, stop)
+
+        try:
+            remaining = total_segments
+            while remaining:
+                page = pages.get()
+                if page is _DONE:
+                    remaining -= 1
+                elif isinstance(page, Exception):
+                    raise page
+                else:
+                    yield page
+        finally:
+            # Consumer stopped early or a segment failed: let the other workers exit
+            stop.set()
+
+
+def parallel_scan(table, projection=None, filter_expression=None, expression_names=None,
+                  expression_values=None, total_segments=None):
+    """Yield every item of a table (optionally filtered and projected) using a parallel scan"""
+    for page in scan_pages(table, total_segments, projection, filter_expression,
+                           expression_names, expression_values):
+        yield from page.get('Items', [])
+
+
+def parallel_count(table, filter_expression=None, expression_names=None, expression_values=None,
+                   total_segments=None):
+    """Number of items matching a filter, counted server-side (no items are transferred)"""
+    return sum(
+        page.get('Count', 0)
+        for page in scan_pages(table, total_segments, None, filter_expression,
+                               expression_names, expression_values, select='COUNT')
+    )
@@ -0,0 +1,198 @@
+"""
+Segmented storage for the rolling collected-price history.
+
+    collected_prices/segments/<timestamp>-<id>.json   one small object per collector run
+    collected_prices/snapshots/<timestamp>.json       periodically compacted window
+    collected_prices/manifest.json                    points at the current snapshot
+
+Writers only add a segment, so concurrent or slow runs can never overwrite newer
+history. Readers rebuild the window from the snapshot plus the segments after it.
+Compaction folds the tail into a new snapshot and swaps the manifest with a
+conditional PUT, so only one compactor wins.
+"""
+import json
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from botocore.exceptions import ClientError
+
+HISTORY_PREFIX = 'collected_prices/'
+SEGMENT_PREFIX = HISTORY_PREFIX + 'segments/'
+SNAPSHOT_PREFIX = HISTORY_PREFIX + 'snapshots/'
+MANIFEST_KEY = HISTORY_PREFIX + 'manifest.json'
+
+# Pre-segmentation single-object history, used to seed the first snapshot
+LEGACY_HISTORY_KEY = HISTORY_PREFIX + 'rolling_history_60min.json'
+
+WINDOW_POINTS = 60  # 60 x 1min = 60 minutes = 1 hour
+READ_WORKERS = 8
+
+
+def _segment_key(timestamp):
+    # Zero-padded so keys list in time order; the suffix keeps same-second runs apart
+    return f"{SEGMENT_PREFIX}{int(timestamp):010d}-{uuid.uuid4().hex[:8]}.json"
+
+
+def _segment_timestamp(key):
+    return int(key[len(SEGMENT_PREFIX):].split('-', 1)[0])
+
+
+def _get_json(s3_client, bucket, key):
+    response = s3_client.get_object(Bucket=bucket, Key=key)
+    return json.loads(response['Body'].read().decode('utf-8')), response.get('ETag')
+
+
+def _put_json(s3_client, bucket, key, data, **conditions):
+    s3_client.put_object(
+        Bucket=bucket,
+        Key=key,
+        Body=json.dumps(data, separators=(',', ':')),
+        ContentType='application/json',
+        **conditions
+    )
+
+
+def append_segment(s3_client, bucket, timestamp, points):
+    """
+    Write one collector run as its own segment.
+    points: {symbol: data_point}. Returns the segment key.
+    """
+    key = _segment_key(timestamp)
+    _put_json(s3_client, bucket, key, {
+        'timestamp': int(timestamp),
+        'datetime': datetime.utcfromtimestamp(timestamp).isoformat(),
+        'points': points
+    })
+    return key
+
+
+def load_manifest(s3_client, bucket):
+    """Return (manifest, etag), or (None, None) if no snapshot has been compacted yet"""
+    try:
+        return _get_json(s3_client, bucket, MANIFEST_KEY)
+    except s3_client.exceptions.NoSuchKey:
+        return None, None
+
+
+def list_segments(s3_client, bucket, after_timestamp=None):
+    """Segment keys newer than after_timestamp, oldest first"""
+    request = {'Bucket': bucket, 'Prefix': SEGMENT_PREFIX}
+    if after_timestamp is not None:
+        # '~' sorts after the '-<id>' suffix, so every segment at after_timestamp is skipped
+        request['StartAfter'] = f"{SEGMENT_PREFIX}{int(after_timestamp):010d}~"
+
+    keys = []
+    paginator = s3_client.get_paginator('list_objects_v2')
+    for page in paginator.paginate(**request):
+        keys.extend(obj['Key'] for obj in page.get('Contents', []))
+    return keys
+
+
+def _load_snapshot(s3_client, bucket, manifest):
+    if manifest:
+        snapshot, _ = _get_json(s3_client, bucket, manifest['snapshot_key'])
+        return snapshot.get('assets', {}), manifest['through_timestamp']
+
+    # No manifest yet: start from the legacy single-object history if there is one
+    try:
+        legacy, _ = _get_json(s3_client, bucket, LEGACY_HISTORY_KEY)
+        return legacy.get('assets', {}), legacy.get('last_updated_timestamp')
+    except s3_client.exceptions.NoSuchKey:
+        return {}, None
+
+
+def _apply_segments(assets, segments, window_points):
+    for segment in segments:
+        for symbol, point in segment['points'].items():
+            if symbol not in assets or assets[symbol] is None:
+                assets[symbol] = {'symbol': symbol, 'data_points': []}
+            data_points = assets[symbol]['data_points']
+            if data_points and data_points[-1]['timestamp'] >= point['timestamp']:
+                continue
+            data_points.append(point)
+            if len(data_points) > window_points:
+                del data_points[:-window_points]
+    return assets
+
+
+def _read_window(s3_client, bucket, window_points):
+    manifest, etag = load_manifest(s3_client, bucket)
+    assets, through_timestamp = _load_snapshot(s3_client, bucket, manifest)
+
+    # Only the newest window_points segments can still contribute to the window
+    segment_keys = list_segments(s3_client, bucket, through_timestamp)[-window_points:]
+    with ThreadPoolExecutor(max_workers=READ_WORKERS) as executor:
+        segments = list(executor.map(lambda key: _get_json(s3_client, bucket, key)[0], segment_keys))
+
+    assets = _apply_segments(assets, segments, window_points)
+    return assets, manifest, etag, segment_keys
+
+
+def history_stats(assets, expected_assets=None, window_points=WINDOW_POINTS):
+    """Completeness stats in the shape the single-object history used to carry"""
+    assets_with_full_hour = sum(
+        1 for asset in assets.values()
+        if asset and len(asset['data_points']) >= window_points
+    )
+    total = expected_assets if expected_assets is not None else len(assets)
+    return {
+        'total_assets': len(assets),
+        'assets_with_full_hour': assets_with_full_hour,
+        'ready_for_simulation': assets_with_full_hour >= total * 0.8  # 80% threshold
+    }
+
+
+def load_history(s3_client, bucket, expected_assets=None, window_points=WINDOW_POINTS):
+    """
+    Rebuild the rolling window from snapshot + tail segments.
+    Returns {'assets': {symbol: {'symbol', 'data_points'}}, 'last_updated_timestamp', 'stats'}.
+    expected_assets (the number of tracked assets) sets the readiness threshold.
+    """
+    assets, _, _, _ = _read_window(s3_client, bucket, window_points)
+
+    last_updated = max(
+        (asset['data_points'][-1]['timestamp'] for asset in assets.values() if asset and asset['data_points']),
+        default=None
+    )
+    return {
+        'assets': assets,
+        'last_updated_timestamp': last_updated,
+        'stats': history_stats(assets, expected_assets, window_points)
+    }
+
+
+def compact(s3_client, bucket, expected_assets=None, window_points=WINDOW_POINTS):
+    """
+    Fold the tail segments into a new snapshot and point the manifest at it.
+    Returns the new manifest, or None if there was nothing to compact or another
+    run swapped the manifest first. expected_assets is passed on to history_stats.
+    """
+    assets, manifest, etag, segment_keys = _read_window(s3_client, bucket, window_points)
+    if not segment_keys:
+        return None
+
+    through_timestamp = _segment_timestamp(segment_keys[-1])
+    snapshot_key = f"{SNAPSHOT_PREFIX}{through_timestamp:010d}.json"
+    _put_json(s3_client, bucket, snapshot_key, {
+        'through_timestamp': through_timestamp,
+        'compacted_at': datetime.utcnow().isoformat(),
+        'assets': assets
+    })
+
+    new_manifest = {
+        'snapshot_key': snapshot_key,
+        'through_timestamp': through_timestamp,
+        'compacted_at': datetime.utcnow().isoformat(),
+        'stats': history_stats(assets, expected_assets, window_points)
+    }
+
+    # Only replace the manifest we read; a concurrent compactor may already have moved it
+    condition = {'IfMatch': etag} if etag else {'IfNoneMatch': '*'}
+    try:
+        _put_json(s3_client, bucket, MANIFEST_KEY, new_manifest, **condition)
+    except ClientError as e:
+        if e.response.get('Error', {}).get('Code') in ('PreconditionFailed', 'ConditionalRequestConflict'):
+            return None
+        raise
+
+    return new_manifest
@@ -0,0 +1,82 @@
+"""
+Stateless, counter-based price oracle for simulated windows.
+
+Every shock is a pure function of (seed, symbol, second): a splitmix64 hash of a
+counter, so any second of any path can be regenerated without stored arrays or
+process-dependent state such as hash(). The simulator publishes a handful of
+parameters per asset plus a checkpoint price every CHECKPOINT_INTERVAL seconds,
+and price_at() replays at most one interval of steps from the nearest checkpoint.
+
+Only additions, multiplications, sqrt and comparisons are used per step, so the
+vectorized simulator and this scalar replay produce bit-identical prices.
+"""
+import hashlib
+import math
+
+MASK64 = (1 << 64) - 1
+GOLDEN_GAMMA = 0x9E3779B97F4A7C15
+
+# Sum of 12 uniforms minus 6 is approximately N(0, 1) (Irwin-Hall) and needs no log/cos
+NORMAL_DRAWS = 12
+UNIFORM_SCALE = 2.0 ** -53
+
+# GBM step: 1 second in terms of days
+SQRT_DT = math.sqrt(1 / (24 * 60 * 60))
+
+# Per-second clamps applied to every simulated path
+MAX_CHANGE_PER_SECOND = 0.05  # Max 5% move per second
+MIN_FACTOR = 1.0 - MAX_CHANGE_PER_SECOND
+MAX_FACTOR = 1.0 + MAX_CHANGE_PER_SECOND
+PRICE_FLOOR_RATIO = 0.5  # Never drop below 50% of the start price
+
+CHECKPOINT_INTERVAL = 60
+PRICE_DECIMALS = 4
+
+
+def mix64(x):
+    """splitmix64 finalizer"""
+    x = (x ^ (x >> 30)) * 0xBF58476D1CE4E5B9 & MASK64
+    x = (x ^ (x >> 27)) * 0x94D049BB133111EB & MASK64
+    return x ^ (x >> 31)
+
+
+def stream_key(seed, symbol):
+    """64-bit stream key for one (window seed, symbol) pair, stable across processes"""
+    symbol_hash = int.from_bytes(hashlib.blake2b(symbol.encode('utf-8'), digest_size=8).digest(), 'little')
+    return mix64((int(seed) * GOLDEN_GAMMA ^ symbol_hash) & MASK64)
+
+
+def shock(key, second):
+    """Standard-normal shock for one second of one stream"""
+    counter = second * NORMAL_DRAWS
+    total = 0.0
+    for draw in range(NORMAL_DRAWS):
+        bits = mix64((key + (counter + draw + 1) * GOLDEN_GAMMA) & MASK64)
+        total += (bits >> 11) * UNIFORM_SCALE
+    return total - 6.0
+
+
+def step(price, drift, volatility, z, floor):
+    """Advance a price by one second: dS = μ S dt + σ S dW, clamped to ±5% and the floor"""
+    factor = 1.0 + drift + volatility * (z * SQRT_DT)
+    factor = min(max(factor, MIN_FACTOR), MAX_FACTOR)
+    return max(price * factor, floor)
+
+
+def price_at(window, symbol, second):
+    """
+    Price of a symbol at a given second of a published window (clamped to the window).
+    window is the published oracle document: seed, num_seconds, checkpoint_interval and
+    per-asset drift, volatility, floor and checkpoints.
+    """
+    params = window['assets'][symbol]
+    second = min(max(int(second), 0), window['num_seconds'] - 1)
+    interval = window.get('checkpoint_interval', CHECKPOINT_INTERVAL)
+    key = stream_key(window['seed'], symbol)
+
+    checkpoint = second // interval
+    price = params['checkpoints'][checkpoint]
+    for t in range(checkpoint * interval, second + 1):
+        price = step(price, params['drift'], params['volatility'], shock(key, t), params['floor'])
+
+    return round(price, PRICE_DECIMALS)
@@ -0,0 +1,103 @@
+"""
+Short-lived signed price quotes.
+
+api_get_prices signs each current-window price it returns for a user;
+api_execute_trade can then trade at that exact price by verifying the token
+locally, without touching S3. A token is
+
+    base64url(JSON payload) '.' base64url(HMAC-SHA256(key, payload))
+
+with the payload {id, user, symbol, price, window, second, exp}. The price is
+kept as a string so it round-trips to the same Decimal. A token only verifies
+for the user it was issued to, and trades at most once: the trade transaction
+puts a claim on its random id into the trades table (quote_claim_item), which
+fails if the id was claimed before. Claims expire with the trades table TTL.
+"""
+import base64
+import hashlib
+import hmac
+import json
+import os
+import secrets
+import time
+
+SIGNING_KEY = os.environ.get('QUOTE_SIGNING_KEY', '')
+
+# How long a quote can be traded on after it was issued (seconds)
+QUOTE_TTL_SECONDS = int(os.environ.get('QUOTE_TTL_SECONDS', '10'))
+
+
+def _b64encode(data):
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode('ascii')
+
+
+def _b64decode(text):
+    return base64.urlsafe_b64decode(text + '=' * (-len(text) % 4))
+
+
+def _signature(key, payload_bytes):
+    return hmac.new(key.encode('utf-8'), payload_bytes, hashlib.sha256).digest()
+
+
+def sign_quote(symbol, price, window_start, second, user_id, now=None, key=None, ttl=None):
+    """Quote token for one symbol's price, or None if no signing key is configured"""
+    key = SIGNING_KEY if key is None else key
+    if not key:
+        return None
+
+    now = int(time.time() if now is None else now)
+    payload = json.dumps({
+        'id': secrets.token_urlsafe(12),
+        'user': user_id,
+        'symbol': symbol,
+        'price': str(price),
+        'window': window_start,
+        'second': second,
+        'exp': now + (QUOTE_TTL_SECONDS if ttl is None else ttl)
+    }, separators=(',', ':')).encode('utf-8')
+
+    return f"{_b64encode(payload)}.{_b64encode(_signature(key, payload))}"
+
+
+def verify_quote(token, symbol, user_id, now=None, key=None):
+    """
+    Payload of a valid, unexpired token for symbol issued to user_id, or None.
+    Any malformed, forged, expired or mismatched token is simply not trusted.
+    """
+    key = SIGNING_KEY if key is None else key
+    if not key or not token or not isinstance(token, str):
+        return None
+
+    try:
+        payload_text, signature_text = token.split('.')
+        payload_bytes = _b64decode(payload_text)
+        signature = _b64decode(signature_text)
+    except ValueError:
+        return None
+
+    if not hmac.compare_digest(signature, _signature(key, payload_bytes)):
+        return None
+
+    payload = json.loads(payload_bytes)
+    now = int(time.time() if now is None else now)
+    if payload.get('symbol') != symbol or payload.get('user') != user_id or now > payload.get('exp', 0):
+        return None
+    if not payload.get('id'):
+        return None
+
+    return payload
+
+
+def quote_claim_item(trades_table, quote):
+    """Transact item claiming a verified quote; its condition fails if the quote was used"""
+    return {
+        'Put': {
+            'TableName': trades_table.name,
+            'Item': {
+                'trade_id': f"quote#{quote['id']}",
+                'timestamp': quote['exp'],
+                'expires_at': quote['exp']
+            },
+            'ConditionExpression': 'attribute_not_exists(trade_id)'
+        }
+    }
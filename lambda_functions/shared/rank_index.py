@@ -0,0 +1,297 @@
+"""
+Rank index of every ranked user, for "what is my rank" and "who is around me".
+
+The ranker writes one index object per leaderboard period. Readers never
+download it whole: they fetch the header, then byte ranges of fixed-width
+records, so a lookup costs three small S3 GETs whatever the number of users.
+
+Layout (little-endian):
+    magic     4 bytes  b'TQRI'
+    version   uint16
+    id_bytes  uint8    width of the user_id field (longest id in this index)
+    name_len  uint8    width of the username field
+    hdr_len   uint32   length of the JSON header that follows
+    header    JSON     period, version, totals, block_size and fences
+    padding            zero bytes up to the next 8-byte boundary
+    by_rank   total_users records (user_id, username, profit_loss, profit_loss_percent,
+              total_value), rank 1 first
+    by_id     total_users records (user_id, rank), sorted by user_id
+
+by_id is cut into blocks of block_size records; header['fences'] holds the
+first user_id of every block. Finding a user is a bisect over the fences, one
+range read of that block and a bisect inside it. Neighbours are one range read
+of consecutive by_rank records.
+
+cached_rank keeps looked-up standings per index ETag in the container, so
+endpoints polled every second (the portfolio) only send a HEAD request every
+RANK_REVALIDATE_SECONDS, and the range reads only after the ranker replaced
+the index.
+"""
+import bisect
+import json
+import os
+import struct
+import time
+from datetime import datetime
+
+from botocore.exceptions import ClientError
+
+FORMAT_MAGIC = b'TQRI'
+FORMAT_VERSION = 1
+PREAMBLE = struct.Struct('<4sHBBI')
+
+RANK_INDEX_PREFIX = 'leaderboard/rank_index/'
+CONTENT_TYPE = 'application/octet-stream'
+
+USERNAME_BYTES = 32
+BLOCK_SIZE = 2048
+
+# First read: preamble plus (usually) the whole header
+HEAD_BYTES = 64 * 1024
+
+# Largest number of neighbours returned on each side of a user
+MAX_NEIGHBOURS = 50
+
+# How long a cached standing is served without asking S3 (seconds)
+RANK_REVALIDATE_SECONDS = float(os.environ.get('RANK_REVALIDATE_SECONDS', '30'))
+
+# Standings cached per container, dropped wholesale beyond this many
+MAX_CACHED_STANDINGS = 10000
+
+# (bucket, period, user_id, neighbours) -> {'etag', 'value', 'checked_at'}
+_standings = {}
+
+
+def rank_index_key(period):
+    return f"{RANK_INDEX_PREFIX}{period}.bin"
+
+
+def _rank_struct(id_bytes):
+    return struct.Struct(f'<{id_bytes}s{USERNAME_BYTES}sddd')
+
+
+def _id_struct(id_bytes):
+    return struct.Struct(f'<{id_bytes}sI')
+
+
+def _truncate(text, size):
+    """UTF-8 bytes of text cut to at most size bytes without splitting a character"""
+    data = text.encode('utf-8')
+    if len(data) <= size:
+        return data
+    return data[:size].decode('utf-8', errors='ignore').encode('utf-8')
+
+
+def _text(field):
+    return field.rstrip(b'\0').decode('utf-8')
+
+
+def encode_rank_index(period, version, ranked, block_size=BLOCK_SIZE):
+    """
+    Encode a rank index.
+    ranked: (user_id, username, profit_loss, profit_loss_percent, total_value) tuples, best first
+    """
+    ids = [user_id.encode('utf-8') for user_id, *_ in ranked]
+    id_bytes = max((len(user_id) for user_id in ids), default=1)
+    if id_bytes > 255:
+        raise ValueError('user_id longer than 255 bytes')
+    rank_record = _rank_struct(id_bytes)
+    id_record = _id_struct(id_bytes)
+
+    # by_id order, and the fences that split it into blocks
+    by_id = sorted(range(len(ids)), key=ids.__getitem__)
+    fences = [ids[by_id[i]].decode('utf-8') for i in range(0, len(by_id), block_size)]
+
+    header = {
+        'period': period,
+        'version': version,
+        'total_users': len(ranked),
+        'block_size': block_size,
+        'fences': fences,
+        'generated_at': datetime.utcnow().isoformat()
+    }
+    header_bytes = json.dumps(header, separators=(',', ':')).encode('utf-8')
+
+    preamble = PREAMBLE.pack(FORMAT_MAGIC, FORMAT_VERSION, id_bytes, USERNAME_BYTES, len(header_bytes))
+    data_offset = len(preamble) + len(header_bytes)
+    data_offset += -data_offset % 8
+
+    body = bytearray(data_offset + len(ranked) * (rank_record.size + id_record.size))
+    body[:len(preamble)] = preamble
+    body[len(preamble):len(preamble) + len(header_bytes)] = header_bytes
+
+    offset = data_offset
+    for user_id, (_, username, profit_loss, percent, total_value) in zip(ids, ranked):
+        rank_record.pack_into(body, offset, user_id, _truncate(username, USERNAME_BYTES),
+                              profit_loss, percent, total_value)
+        offset += rank_record.size
+    for position in by_id:
+        id_record.pack_into(body, offset, ids[position], position + 1)
+        offset += id_record.size
+
+    return bytes(body)
+
+
+def write_rank_index(s3_client, bucket, period, version, ranked):
+    """Encode and upload the rank index of a period; returns its size in bytes"""
+    body = encode_rank_index(period, version, ranked)
+    s3_client.put_object(
+        Bucket=bucket,
+        Key=rank_index_key(period),
+        Body=body,
+        ContentType=CONTENT_TYPE
+    )
+    return len(body)
+
+
+class RankIndex:
+    """Range-reading view of one uploaded rank index"""
+
+    def __init__(self, s3_client, bucket, key):
+        self._s3 = s3_client
+        self._bucket = bucket
+        self._key = key
+
+        response = s3_client.get_object(Bucket=bucket, Key=key, Range=f'bytes=0-{HEAD_BYTES - 1}')
+        # Every later range must come from this same object, even if the ranker replaces it
+        self._etag = response['ETag']
+        head = response['Body'].read()
+
+        magic, version, id_bytes, name_bytes, header_len = PREAMBLE.unpack_from(head, 0)
+        if magic != FORMAT_MAGIC:
+            raise ValueError('Not a rank index file')
+        if version > FORMAT_VERSION:
+            raise ValueError(f'Unsupported rank index version {version}')
+        if name_bytes != USERNAME_BYTES:
+            raise ValueError(f'Unsupported username width {name_bytes}')
+
+        header_end = PREAMBLE.size + header_len
+        if header_end > len(head):
+            head += self._range(len(head), header_end)
+        self.header = json.loads(head[PREAMBLE.size:header_end].decode('utf-8'))
+
+        self.total_users = self.header['total_users']
+        self._rank_record = _rank_struct(id_bytes)
+        self._id_record = _id_struct(id_bytes)
+        self._by_rank_offset = header_end + (-header_end % 8)
+        self._by_id_offset = self._by_rank_offset + self.total_users * self._rank_record.size
+        self._fences = [fence.encode('utf-8') for fence in self.header['fences']]
+
+    def _range(self, start, end):
+        """Bytes [start, end) of the index"""
+        response = self._s3.get_object(
+            Bucket=self._bucket,
+            Key=self._key,
+            Range=f'bytes={start}-{end - 1}',
+            IfMatch=self._etag
+        )
+        return response['Body'].read()
+
+    def rank_of(self, user_id):
+        """1-based rank of a user, or None if the user is not ranked"""
+        target = user_id.encode('utf-8')
+        block = bisect.bisect_right(self._fences, target) - 1
+        if block < 0:
+            return None
+
+        block_size = self.header['block_size']
+        first = block * block_size
+        count = min(block_size, self.total_users - first)
+        size = self._id_record.size
+        start = self._by_id_offset + first * size
+        data = self._range(start, start + count * size)
+
+        ids = [self._id_record.unpack_from(data, i * size)[0].rstrip(b'\0') for i in range(count)]
+        position = bisect.bisect_left(ids, target)
+        if position == count or ids[position] != target:
+            return None
+        return self._id_record.unpack_from(data, position * size)[1]
+
+    def entries(self, first_rank, last_rank):
+        """Entries for ranks first_rank..last_rank (inclusive, clamped to the index)"""
+        first_rank = max(1, first_rank)
+        last_rank = min(self.total_users, last_rank)
+        if first_rank > last_rank:
+            return []
+
+        size = self._rank_record.size
+        start = self._by_rank_offset + (first_rank - 1) * size
+        data = self._range(start, start + (last_rank - first_rank + 1) * size)
+
+        entries = []
+        for i, rank in enumerate(range(first_rank, last_rank + 1)):
+            user_id, username, profit_loss, percent, total_value = self._rank_record.unpack_from(data, i * size)
+            entries.append({
+                'rank': rank,
+                'user_id': _text(user_id),
+                'username': _text(username),
+                'profit_loss': profit_loss,
+                'profit_loss_percent': percent,
+                'total_value': total_value
+            })
+        return entries
+
+
+def lookup_rank(s3_client, bucket, period, user_id, neighbours=0):
+    """
+    A user's standing in a period: {rank, total_users, generated_at, entry, around}
+    where around holds up to `neighbours` entries on each side. None if no index
+    exists yet or the user is not ranked.
+    """
+    for attempt in range(2):
+        try:
+            index = RankIndex(s3_client, bucket, rank_index_key(period))
+            rank = index.rank_of(user_id)
+            if rank is None:
+                return None
+
+            neighbours = max(0, min(int(neighbours), MAX_NEIGHBOURS))
+            around = index.entries(rank - neighbours, rank + neighbours)
+            break
+        except s3_client.exceptions.NoSuchKey:
+            return None
+        except ClientError as e:
+            # The ranker replaced the index between reads: start over on the new one
+            if e.response['Error']['Code'] != 'PreconditionFailed' or attempt:
+                raise
+
+    return {
+        'rank': rank,
+        'total_users': index.total_users,
+        'generated_at': index.header['generated_at'],
+        'entry': next(item for item in around if item['rank'] == rank),
+        'around': around
+    }
+
+
+def cached_rank(s3_client, bucket, period, user_id, neighbours=0, max_age=None):
+    """
+    lookup_rank, reused while the period's index keeps the same ETag. None if no
+    index exists yet or the user is not ranked.
+    """
+    if max_age is None:
+        max_age = RANK_REVALIDATE_SECONDS
+
+    cache_key = (bucket, period, user_id, neighbours)
+    entry = _standings.get(cache_key)
+    now = time.monotonic()
+    if entry and now - entry['checked_at'] < max_age:
+        return entry['value']
+
+    try:
+        etag = s3_client.head_object(Bucket=bucket, Key=rank_index_key(period))['ETag']
+    except ClientError as e:
+        if e.response['Error']['Code'] in ('404', 'NoSuchKey'):
+            return None
+        raise
+
+    if entry and entry['etag'] == etag:
+        entry['checked_at'] = now
+        return entry['value']
+
+    value = lookup_rank(s3_client, bucket, period, user_id, neighbours)
+    if len(_standings) >= MAX_CACHED_STANDINGS:
+        _standings.clear()
+    # Should the index have been replaced since the HEAD, the next check refreshes it
+    _standings[cache_key] = {'etag': etag, 'value': value, 'checked_at': now}
+    return value
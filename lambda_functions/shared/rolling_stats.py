@@ -0,0 +1,176 @@
+"""
+Running statistics over each symbol's rolling price window.
+
+The collector pushes one price per symbol per minute. Every push adds the new
+one-minute return and, once the window is full, evicts the oldest one, updating
+the mean and sum of squared deviations in O(1) with Welford's algorithm (and
+its inverse for removals). The result is published next to the history so the
+simulator reads ready-made mean return, volatility and trend instead of
+recomputing them from every data point.
+
+The ring of raw prices is kept only so the evicted return and the trend can be
+derived. Rounding drift from repeated add/remove is reset whenever the stats
+are rebuilt exactly from the history (see build_stats).
+"""
+import json
+import math
+from collections import deque
+from datetime import datetime
+from botocore.exceptions import ClientError
+from price_history import HISTORY_PREFIX, WINDOW_POINTS
+
+STATS_KEY = HISTORY_PREFIX + 'rolling_stats.json'
+
+# Same defaults calculate_statistics uses when there are too few points
+DEFAULT_VOLATILITY = 0.02
+
+
+class RollingStats:
+    """Welford mean/variance of one-minute returns over the last window_points prices"""
+
+    def __init__(self, window_points=WINDOW_POINTS):
+        self.window_points = window_points
+        self.timestamps = deque()
+        self.prices = deque()
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def _add(self, value):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+
+    def _remove(self, value):
+        if self.count <= 1:
+            self.count, self.mean, self.m2 = 0, 0.0, 0.0
+            return
+        self.count -= 1
+        delta = value - self.mean
+        self.mean -= delta / self.count
+        self.m2 = max(self.m2 - delta * (value - self.mean), 0.0)
+
+    def push(self, timestamp, price):
+        """Append a price; returns False (and ignores it) if it is not newer than the last one"""
+        if self.timestamps and timestamp <= self.timestamps[-1]:
+            return False
+
+        if self.prices:
+            self._add((price - self.prices[-1]) / self.prices[-1])
+        self.timestamps.append(timestamp)
+        self.prices.append(price)
+
+        while len(self.prices) > self.window_points:
+            oldest = self.prices.popleft()
+            self.timestamps.popleft()
+            self._remove((self.prices[0] - oldest) / oldest)
+        return True
+
+    @property
+    def last_price(self):
+        return self.prices[-1] if self.prices else None
+
+    @property
+    def last_timestamp(self):
+        return self.timestamps[-1] if self.timestamps else None
+
+    def statistics(self):
+        """(mean_return, volatility, trend), matching price_simulator.calculate_statistics"""
+        if len(self.prices) < 2:
+            return 0, DEFAULT_VOLATILITY, 0
+
+        volatility = math.sqrt(self.m2 / (self.count - 1)) if self.count > 1 else DEFAULT_VOLATILITY
+        trend = (self.prices[-1] - self.prices[0]) / self.prices[0]
+        return self.mean, volatility, trend
+
+    def to_dict(self):
+        mean_return, volatility, trend = self.statistics()
+        return {
+            'count': self.count,
+            'mean': self.mean,
+            'm2': self.m2,
+            'timestamps': list(self.timestamps),
+            'prices': list(self.prices),
+            'mean_return': mean_return,
+            'volatility': volatility,
+            'trend': trend
+        }
+
+    @classmethod
+    def from_dict(cls, data, window_points=WINDOW_POINTS):
+        stats = cls(window_points)
+        stats.timestamps = deque(data['timestamps'])
+        stats.prices = deque(data['prices'])
+        stats.count = data['count']
+        stats.mean = data['mean']
+        stats.m2 = data['m2']
+        # A shorter configured window trims (and adjusts) the stored ring
+        while len(stats.prices) > window_points:
+            oldest = stats.prices.popleft()
+            stats.timestamps.popleft()
+            stats._remove((stats.prices[0] - oldest) / oldest)
+        return stats
+
+
+def build_stats(assets, window_points=WINDOW_POINTS):
+    """Exact stats for every symbol from a history window ({symbol: {'data_points': [...]}})"""
+    stats = {}
+    for symbol, asset in assets.items():
+        if not asset or not asset.get('data_points'):
+            continue
+        stats[symbol] = RollingStats(window_points)
+        for point in asset['data_points']:
+            stats[symbol].push(point['timestamp'], point['price'])
+    return stats
+
+
+def load_stats(s3_client, bucket, window_points=WINDOW_POINTS):
+    """Return ({symbol: RollingStats}, etag), or (None, None) if nothing is published yet"""
+    try:
+        response = s3_client.get_object(Bucket=bucket, Key=STATS_KEY)
+    except s3_client.exceptions.NoSuchKey:
+        return None, None
+
+    document = json.loads(response['Body'].read().decode('utf-8'))
+    stats = {
+        symbol: RollingStats.from_dict(data, window_points)
+        for symbol, data in document['symbols'].items()
+    }
+    return stats, response.get('ETag')
+
+
+def save_stats(s3_client, bucket, stats, etag=None):
+    """
+    Publish stats, replacing only the version that was read (etag) or creating it.
+    Returns False if another writer got there first.
+    """
+    document = {
+        'updated_at': datetime.utcnow().isoformat(),
+        'symbols': {symbol: s.to_dict() for symbol, s in stats.items()}
+    }
+    condition = {'IfMatch': etag} if etag else {'IfNoneMatch': '*'}
+    try:
+        s3_client.put_object(
+            Bucket=bucket,
+            Key=STATS_KEY,
+            Body=json.dumps(document, separators=(',', ':')),
+            ContentType='application/json',
+            **condition
+        )
+    except ClientError as e:
+        if e.response.get('Error', {}).get('Code') in ('PreconditionFailed', 'ConditionalRequestConflict'):
+            return False
+        raise
+    return True
+
+
+def window_stats(stats, expected_assets=None, window_points=WINDOW_POINTS):
+    """Completeness stats in the same shape as price_history.history_stats"""
+    assets_with_full_hour = sum(1 for s in stats.values() if len(s.prices) >= window_points)
+    total = expected_assets if expected_assets is not None else len(stats)
+    return {
+        'total_assets': len(stats),
+        'assets_with_full_hour': assets_with_full_hour,
+        'ready_for_simulation': assets_with_full_hour >= total * 0.8  # 80% threshold
+    }
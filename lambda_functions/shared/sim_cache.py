@@ -0,0 +1,132 @@
+"""
+Warm-container cache for S3 objects that change rarely but are read on every request.
+
+Entries live at module level, so they survive across invocations of a warm Lambda
+container. An entry is trusted for a short revalidation interval; after that it is
+revalidated with a conditional GET (IfNoneMatch) and only re-parsed when S3 returns
+a new ETag.
+"""
+import json
+import os
+import time
+from botocore.exceptions import ClientError
+from sim_format import decode_window
+from sim_ring import RING_MANIFEST_KEY, find_window, latest_entry
+
+# How long a cached object is served without asking S3 (seconds)
+REVALIDATE_SECONDS = float(os.environ.get('SIM_CACHE_REVALIDATE_SECONDS', '1'))
+
+# How long after the newest window ends trades may still price at its last second
+ORACLE_GRACE_SECONDS = int(os.environ.get('ORACLE_GRACE_SECONDS', '300'))
+
+_cache = {}
+
+
+class WindowUnavailable(Exception):
+    """No published simulation window can serve the requested time"""
+
+
+def _not_modified(error):
+    """True if a ClientError is S3's 304 response to IfNoneMatch"""
+    code = error.response.get('Error', {}).get('Code')
+    status = error.response.get('ResponseMetadata', {}).get('HTTPStatusCode')
+    return code in ('304', 'NotModified') or status == 304
+
+
+def get_cached_object(s3_client, bucket, key, parse, max_age=None):
+    """
+    Return parse(body) for an S3 object, reusing the parsed value while its ETag is unchanged.
+    Raises the underlying S3 error if the object cannot be fetched and nothing is cached.
+    """
+    if max_age is None:
+        max_age = REVALIDATE_SECONDS
+
+    cache_key = (bucket, key)
+    entry = _cache.get(cache_key)
+    now = time.monotonic()
+
+    if entry and now - entry['checked_at'] < max_age:
+        return entry['value']
+
+    request = {'Bucket': bucket, 'Key': key}
+    if entry:
+        request['IfNoneMatch'] = entry['etag']
+
+    try:
+        response = s3_client.get_object(**request)
+    except ClientError as e:
+        if entry and _not_modified(e):
+            entry['checked_at'] = now
+            return entry['value']
+        raise
+
+    value = parse(response['Body'].read())
+    _cache[cache_key] = {
+        'etag': response.get('ETag'),
+        'value': value,
+        'checked_at': now
+    }
+    return value
+
+
+def get_window(s3_client, bucket, key, max_age=None):
+    """Cached SimulationWindow stored at key"""
+    return get_cached_object(s3_client, bucket, key, decode_window, max_age=max_age)
+
+
+def get_oracle(s3_client, bucket, key, max_age=None):
+    """Cached oracle parameters stored at key (see price_oracle.price_at)"""
+    return get_cached_object(s3_client, bucket, key, json.loads, max_age=max_age)
+
+
+def get_ring(s3_client, bucket, max_age=None):
+    """Cached ring manifest, or None if no windows have been published to the ring yet"""
+    try:
+        return get_cached_object(s3_client, bucket, RING_MANIFEST_KEY, json.loads, max_age=max_age)
+    except ClientError as e:
+        if e.response.get('Error', {}).get('Code') in ('NoSuchKey', '404'):
+            return None
+        raise
+
+
+def get_current_window(s3_client, bucket, now=None):
+    """
+    (SimulationWindow, current_second) for the window containing now.
+    When the ring has no window for now (e.g. the simulator was paused), falls back to
+    the newest published window that has already started; current_second is then past
+    its end and readers clamp it. Raises WindowUnavailable if there is none.
+    """
+    now = int(time.time() if now is None else now)
+    manifest = get_ring(s3_client, bucket)
+    entry = find_window(manifest, now)
+    if entry is None:
+        entry = latest_entry(manifest)
+        if entry is None or entry['start_timestamp'] > now:
+            raise WindowUnavailable('No simulation window has been published yet')
+
+    window = get_window(s3_client, bucket, entry['window_key'])
+    # The slot may have been refilled since the manifest was cached
+    if window.start_timestamp != entry['start_timestamp']:
+        raise WindowUnavailable('Simulation window is being replaced, try again')
+    return window, now - window.start_timestamp
+
+
+def get_current_oracle(s3_client, bucket, now=None):
+    """
+    (oracle parameters, current_second) for the window containing now. If the
+    simulator is late, trades keep pricing at the last second of the newest window
+    for up to ORACLE_GRACE_SECONDS after it ended.
+    Raises WindowUnavailable beyond that, or if nothing is published.
+    """
+    now = int(time.time() if now is None else now)
+    manifest = get_ring(s3_client, bucket)
+    entry = find_window(manifest, now)
+    if entry is None:
+        entry = latest_entry(manifest)
+        if entry is None or not entry['end_timestamp'] <= now <= entry['end_timestamp'] + ORACLE_GRACE_SECONDS:
+            raise WindowUnavailable('No simulation window covers the current time')
+
+    oracle = get_oracle(s3_client, bucket, entry['oracle_key'])
+    if oracle['start_timestamp'] != entry['start_timestamp']:
+        raise WindowUnavailable('Simulation window is being replaced, try again')
+    return oracle, min(now - oracle['start_timestamp'], oracle['num_seconds'] - 1)
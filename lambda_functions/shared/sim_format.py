@@ -0,0 +1,168 @@
+"""
+Compact columnar format for simulated price windows.
+
+Layout (little-endian):
+    magic     4 bytes  b'TQSW'
+    version   uint16
+    itemsize  uint8    4 (float32) or 8 (float64)
+    reserved  uint8
+    hdr_len   uint32   length of the JSON header that follows
+    header    JSON     window metadata, symbol order and per-asset summaries
+    padding            zero bytes up to the next 8-byte boundary
+    prices             one num_seconds array per symbol in header['symbols'] order
+
+Everything a reader used to get from the per-second dicts (second, timestamp,
+datetime) is derived from start_timestamp, so only the prices are stored.
+"""
+import json
+import struct
+import sys
+from array import array
+from datetime import datetime
+
+FORMAT_MAGIC = b'TQSW'
+FORMAT_VERSION = 1
+PREAMBLE = struct.Struct('<4sHBBI')
+
+CONTENT_TYPE = 'application/octet-stream'
+
+_TYPECODES = {4: 'f', 8: 'd'}
+
+# Simulated prices are rounded to 4 decimals; float32 reads are re-rounded to match
+PRICE_DECIMALS = 4
+
+
+class SimulationWindow:
+    """
+    Read-only view over an encoded simulation window.
+    Single prices are unpacked straight from the buffer without decoding the whole file.
+    """
+
+    def __init__(self, header, buffer, data_offset, itemsize):
+        self.header = header
+        self.num_seconds = header['num_seconds']
+        self.start_timestamp = header['start_timestamp']
+        self.end_timestamp = header['end_timestamp']
+        self._buffer = buffer
+        self._itemsize = itemsize
+        self._price_struct = struct.Struct('<' + _TYPECODES[itemsize])
+        self._offsets = {}
+
+        offset = data_offset
+        for symbol in header['symbols']:
+            self._offsets[symbol] = offset
+            offset += self.num_seconds * itemsize
+
+    @property
+    def symbols(self):
+        """All symbols in the window, including ones that failed to simulate"""
+        return list(self.header['assets'].keys())
+
+    @property
+    def assets(self):
+        """Per-asset summary metadata (None for assets without data)"""
+        return self.header['assets']
+
+    def asset(self, symbol):
+        """Summary metadata for one asset, or None if unavailable"""
+        return self.header['assets'].get(symbol)
+
+    def has_prices(self, symbol):
+        return symbol in self._offsets
+
+    def price_at(self, symbol, second):
+        """Price of a symbol at a given second (clamped to the last available second)"""
+        second = min(max(int(second), 0), self.num_seconds - 1)
+        offset = self._offsets[symbol] + second * self._itemsize
+        price = self._price_struct.unpack_from(self._buffer, offset)[0]
+        return round(price, PRICE_DECIMALS) if self._itemsize == 4 else price
+
+    def prices(self, symbol):
+        """Full price array for one symbol"""
+        offset = self._offsets[symbol]
+        values = array(_TYPECODES[self._itemsize])
+        values.frombytes(self._buffer[offset:offset + self.num_seconds * self._itemsize])
+        if sys.byteorder == 'big':
+            values.byteswap()
+        return values
+
+    def point(self, symbol, second):
+        """Per-second record in the shape the old JSON format stored it"""
+        second = min(max(int(second), 0), self.num_seconds - 1)
+        second_timestamp = self.start_timestamp + second
+        return {
+            'second': second,
+            'timestamp': second_timestamp,
+            'datetime': datetime.fromtimestamp(second_timestamp).isoformat(),
+            'price': self.price_at(symbol, second)
+        }
+
+
+def encode_window(metadata, assets, prices, itemsize=8):
+    """
+    Encode a simulation window.
+    metadata: window-level fields (timestamp, start_timestamp, end_timestamp, ...)
+    assets: {symbol: summary dict or None}
+    prices: {symbol: sequence of num_seconds prices} for every symbol with data
+    """
+    typecode = _TYPECODES[itemsize]
+    symbols = [symbol for symbol in assets if symbol in prices]
+    num_seconds = len(prices[symbols[0]]) if symbols else 0
+
+    header = dict(metadata)
+    header['num_seconds'] = num_seconds
+    header['symbols'] = symbols
+    header['assets'] = assets
+    header_bytes = json.dumps(header, separators=(',', ':')).encode('utf-8')
+
+    preamble = PREAMBLE.pack(FORMAT_MAGIC, FORMAT_VERSION, itemsize, 0, len(header_bytes))
+    padding = b'\0' * (-(len(preamble) + len(header_bytes)) % 8)
+
+    chunks = [preamble, header_bytes, padding]
+    for symbol in symbols:
+        if len(prices[symbol]) != num_seconds:
+            raise ValueError(f"{symbol} has {len(prices[symbol])} prices, expected {num_seconds}")
+        values = array(typecode, prices[symbol])
+        if sys.byteorder == 'big':
+            values.byteswap()
+        chunks.append(values.tobytes())
+
+    return b''.join(chunks)
+
+
+def decode_window(blob):
+    """Decode an encoded simulation window into a SimulationWindow"""
+    buffer = memoryview(blob)
+    magic, version, itemsize, _, header_len = PREAMBLE.unpack_from(buffer, 0)
+
+    if magic != FORMAT_MAGIC:
+        raise ValueError('Not a simulation window file')
+    if version > FORMAT_VERSION:
+        raise ValueError(f'Unsupported simulation window version {version}')
+    if itemsize not in _TYPECODES:
+        raise ValueError(f'Unsupported price item size {itemsize}')
+
+    header_start = PREAMBLE.size
+    header = json.loads(bytes(buffer[header_start:header_start + header_len]).decode('utf-8'))
+    data_offset = header_start + header_len
+    data_offset += -data_offset % 8
+
+    return SimulationWindow(header, buffer, data_offset, itemsize)
+
+
+def read_window(s3_client, bucket, key):
+    """Download and decode a simulation window from S3"""
+    response = s3_client.get_object(Bucket=bucket, Key=key)
+    return decode_window(response['Body'].read())
+
+
+def write_window(s3_client, bucket, key, metadata, assets, prices, itemsize=8):
+    """Encode and upload a simulation window to S3"""
+    body = encode_window(metadata, assets, prices, itemsize=itemsize)
+    s3_client.put_object(
+        Bucket=bucket,
+        Key=key,
+        Body=body,
+        ContentType=CONTENT_TYPE
+    )
+    return len(body)
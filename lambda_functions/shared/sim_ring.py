@@ -0,0 +1,96 @@
+"""
+Ring of pre-published simulation windows.
+
+Windows are aligned to the wall clock ([k * 600, (k + 1) * 600)) and the
+simulator publishes the next few ahead of time, each into a fixed slot:
+
+    simulated_data/slots/<slot>.bin            encoded window (see sim_format)
+    simulated_data/slots/<slot>_oracle.json    oracle parameters (see price_oracle)
+    simulated_data/ring.json                   which window currently lives in which slot
+
+A slot is only reused once its window is well in the past, so readers pick the
+manifest entry whose [start_timestamp, end_timestamp) contains now and compute
+the current second as now - start_timestamp; nothing changes under them at a
+window boundary.
+"""
+import json
+from datetime import datetime
+from botocore.exceptions import ClientError
+
+WINDOW_SECONDS = 600
+RING_PREFIX = 'simulated_data/slots/'
+RING_MANIFEST_KEY = 'simulated_data/ring.json'
+
+MANIFEST_RETRIES = 3
+
+
+def window_start(timestamp):
+    """Start of the aligned window containing timestamp"""
+    return int(timestamp) // WINDOW_SECONDS * WINDOW_SECONDS
+
+
+def slot_for(start_timestamp, slots):
+    return (int(start_timestamp) // WINDOW_SECONDS) % slots
+
+
+def slot_keys(slot):
+    """(window_key, oracle_key) for a ring slot"""
+    return f"{RING_PREFIX}{slot}.bin", f"{RING_PREFIX}{slot}_oracle.json"
+
+
+def find_window(manifest, timestamp):
+    """Manifest entry whose [start_timestamp, end_timestamp) contains timestamp, or None"""
+    for entry in (manifest or {}).get('windows', []):
+        if entry['start_timestamp'] <= timestamp < entry['end_timestamp']:
+            return entry
+    return None
+
+
+def latest_entry(manifest):
+    """Entry for the furthest-ahead published window, or None"""
+    windows = (manifest or {}).get('windows', [])
+    return windows[-1] if windows else None
+
+
+def load_ring(s3_client, bucket):
+    """Return (manifest, etag), or (None, None) if nothing has been published yet"""
+    try:
+        response = s3_client.get_object(Bucket=bucket, Key=RING_MANIFEST_KEY)
+    except s3_client.exceptions.NoSuchKey:
+        return None, None
+    return json.loads(response['Body'].read().decode('utf-8')), response.get('ETag')
+
+
+def publish_entries(s3_client, bucket, entries, slots):
+    """
+    Add window entries to the ring manifest (replacing any with the same start)
+    and keep only the newest `slots` windows, which are the ones still in a slot.
+    The manifest is swapped with a conditional PUT and re-read on conflict.
+    """
+    for _ in range(MANIFEST_RETRIES):
+        manifest, etag = load_ring(s3_client, bucket)
+        windows = {entry['start_timestamp']: entry for entry in (manifest or {}).get('windows', [])}
+        for entry in entries:
+            windows[entry['start_timestamp']] = entry
+
+        new_manifest = {
+            'updated_at': datetime.utcnow().isoformat(),
+            'window_seconds': WINDOW_SECONDS,
+            'windows': [windows[start] for start in sorted(windows)][-slots:]
+        }
+
+        condition = {'IfMatch': etag} if etag else {'IfNoneMatch': '*'}
+        try:
+            s3_client.put_object(
+                Bucket=bucket,
+                Key=RING_MANIFEST_KEY,
+                Body=json.dumps(new_manifest, separators=(',', ':')),
+                ContentType='application/json',
+                **condition
+            )
+            return new_manifest
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') not in ('PreconditionFailed', 'ConditionalRequestConflict'):
+                raise
+
+    raise RuntimeError('Ring manifest kept changing; giving up after retries')
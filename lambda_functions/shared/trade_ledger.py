@@ -0,0 +1,378 @@
+"""
+Atomic trade execution against the users and trades tables.
+
+Each trade is one TransactWriteItems call: a conditional UpdateItem on the user
+(the balance and share checks are condition expressions, so they hold under
+concurrency) plus the trade-journal Put, which only lands if the update does.
+
+    sell  blind update: balance += value, quantity -= qty if quantity > qty; selling
+          the whole position removes it instead (quantity = qty), which is chosen
+          after a blind partial sell fails and the position is read
+    buy   optimistic: the new average price depends on the current position, so the
+          user is read once and the update is conditioned on the balance and
+          quantity that were read; on a conflict it re-reads and retries
+    batch one read, then a single update carrying every leg's net effect, conditioned
+          on the balance and every touched position that were read, plus one
+          journal Put per leg
+
+A condition failing on any item other than the user update (the journal Put, or
+an extra item such as a resting order's status change) aborts the trade with
+TradeAborted. Positions emptied by older code may still sit at quantity 0;
+readers skip those.
+"""
+import os
+import random
+import time
+import uuid
+from decimal import Decimal
+
+# Cash every new user starts with (and the all-time P/L baseline)
+INITIAL_BALANCE = Decimal(os.environ.get('INITIAL_BALANCE', '100000'))
+
+# A transaction holds at most 100 items: one user update plus one journal Put and
+# at most one extra item (a quote claim) per leg
+MAX_BATCH_ORDERS = 25
+
+MAX_ATTEMPTS = 5
+RETRY_BACKOFF = 0.02  # seconds, doubled on every retry (plus jitter)
+
+
+class TradeRejected(Exception):
+    """The trade is not allowed (insufficient balance or shares)"""
+
+
+class TradeConflict(Exception):
+    """The user kept changing underneath the trade; the client may retry"""
+
+
+class TradeAborted(Exception):
+    """A condition on an item other than the user failed (e.g. an order already closed)"""
+
+
+def trade_record(user_id, symbol, action, quantity, price, timestamp=None):
+    """Trade-journal item in the shape the trades table stores"""
+    return {
+        'trade_id': str(uuid.uuid4()),
+        'user_id': user_id,
+        'timestamp': int(time.time() if timestamp is None else timestamp),
+        'symbol': symbol,
+        'action': action,
+        'quantity': quantity,
+        'price': price,
+        'total_value': price * Decimal(str(quantity))
+    }
+
+
+def new_user(user_id, username=None):
+    return {
+        'user_id': user_id,
+        'username': username if username else user_id[:8],  # Use extracted username or truncated ID
+        'balance': INITIAL_BALANCE,
+        'portfolio': {},
+        'total_trades': 0,
+        'total_profit_loss': Decimal('0')
+    }
+
+
+def ensure_user(users_table, user_id, username=None):
+    """Create the user with the initial balance unless it already exists"""
+    client = users_table.meta.client
+    try:
+        users_table.put_item(
+            Item=new_user(user_id, username),
+            ConditionExpression='attribute_not_exists(user_id)'
+        )
+    except client.exceptions.ConditionalCheckFailedException:
+        pass
+
+
+def get_user(users_table, user_id, username=None):
+    """Strongly consistent read of the user, creating it first if needed"""
+    response = users_table.get_item(Key={'user_id': user_id}, ConsistentRead=True)
+    if 'Item' in response:
+        return response['Item']
+
+    ensure_user(users_table, user_id, username)
+    return users_table.get_item(Key={'user_id': user_id}, ConsistentRead=True)['Item']
+
+
+def _read_balance(users_table, user_id):
+    response = users_table.get_item(
+        Key={'user_id': user_id},
+        ProjectionExpression='balance',
+        ConsistentRead=True
+    )
+    return response['Item']['balance']
+
+
+def _position(user, symbol):
+    return user.get('portfolio', {}).get(symbol)
+
+
+def _user_update(users_table, user_id, assignments, condition, names, values, username, removals=()):
+    """Transact item for the user: SET assignments, REMOVE removals, one more trade"""
+    if username:
+        assignments += ', username = if_not_exists(username, :username)'
+        values[':username'] = username
+    update = 'SET ' + assignments
+    if removals:
+        update += ' REMOVE ' + ', '.join(removals)
+    return {
+        'Update': {
+            'TableName': users_table.name,
+            'Key': {'user_id': user_id},
+            'UpdateExpression': update + ' ADD total_trades :one',
+            'ConditionExpression': condition,
+            'ExpressionAttributeNames': names,
+            'ExpressionAttributeValues': {**values, ':one': 1}
+        }
+    }
+
+
+def _journal_put(trades_table, record):
+    return {
+        'Put': {
+            'TableName': trades_table.name,
+            'Item': record,
+            'ConditionExpression': 'attribute_not_exists(trade_id)'
+        }
+    }
+
+
+def _transact(users_table, items):
+    """
+    Run the transaction (items[0] is the user update). Returns True on success, False
+    if only the user update's condition failed or an item was busy in another
+    transaction. Raises TradeAborted if the condition of any other item failed.
+    """
+    client = users_table.meta.client
+    try:
+        client.transact_write_items(TransactItems=items)
+        return True
+    except client.exceptions.TransactionCanceledException as e:
+        codes = [reason.get('Code') for reason in e.response.get('CancellationReasons', [])]
+        failed = [index for index, code in enumerate(codes) if code == 'ConditionalCheckFailed']
+        if any(index > 0 for index in failed):
+            raise TradeAborted(f'Trade aborted: condition failed on transaction item {max(failed)}')
+        if failed or 'TransactionConflict' in codes:
+            return False
+        raise
+
+
+def _backoff(attempt):
+    time.sleep(RETRY_BACKOFF * (2 ** attempt) * (0.5 + random.random()))
+
+
+def buy_update(users_table, user, symbol, quantity, price, username=None):
+    """
+    Transact item for a buy, conditioned on the balance and position that were read.
+    Returns (update_item, new_balance).
+    """
+    cost = price * Decimal(str(quantity))
+    position = _position(user, symbol)
+    held = int(position['quantity']) if position else 0
+    avg_price = Decimal(str(position['avg_price'])) if position else Decimal('0')
+
+    new_quantity = held + quantity
+    new_avg_price = (avg_price * Decimal(held) + cost) / Decimal(new_quantity)
+
+    names = {'#sym': symbol}
+    values = {
+        ':cost': cost,
+        ':balance': user['balance'],
+        ':position': {'quantity': new_quantity, 'avg_price': new_avg_price}
+    }
+    condition = 'balance = :balance AND balance >= :cost AND '
+    if position:
+        condition += 'portfolio.#sym.quantity = :held'
+        values[':held'] = held
+    else:
+        condition += 'attribute_not_exists(portfolio.#sym)'
+
+    update = _user_update(
+        users_table, user['user_id'],
+        'balance = balance - :cost, portfolio.#sym = :position',
+        condition, names, values, username
+    )
+    return update, user['balance'] - cost
+
+
+def sell_update(users_table, user_id, symbol, quantity, price, username=None, closes=False):
+    """
+    Blind transact item for a sell. A partial sell requires more than quantity shares
+    at write time; a closing sell (closes=True) requires exactly quantity and removes
+    the position.
+    """
+    names = {'#sym': symbol}
+    values = {':value': price * Decimal(str(quantity)), ':qty': quantity}
+    if closes:
+        return _user_update(
+            users_table, user_id, 'balance = balance + :value',
+            'portfolio.#sym.quantity = :qty', names, values, username,
+            removals=['portfolio.#sym']
+        )
+    return _user_update(
+        users_table, user_id,
+        'balance = balance + :value, portfolio.#sym.quantity = portfolio.#sym.quantity - :qty',
+        'portfolio.#sym.quantity > :qty', names, values, username
+    )
+
+
+def execute_buy(users_table, trades_table, user_id, symbol, quantity, price, username=None,
+                 timestamp=None, journal_fields=None, extra_items=()):
+    """
+    Buy atomically. Returns (trade_record, new_balance).
+    Raises TradeRejected on insufficient balance, TradeConflict if retries run out.
+    extra_items are added to the same transaction (e.g. marking a resting order filled).
+    """
+    record = trade_record(user_id, symbol, 'buy', quantity, price, timestamp)
+    record.update(journal_fields or {})
+
+    for attempt in range(MAX_ATTEMPTS):
+        user = get_user(users_table, user_id, username)
+        if user['balance'] < record['total_value']:
+            raise TradeRejected(
+                f'Insufficient balance. Required: ${float(record["total_value"]):.2f}, '
+                f'Available: ${float(user["balance"]):.2f}'
+            )
+
+        update, new_balance = buy_update(users_table, user, symbol, quantity, price, username)
+        if _transact(users_table, [update, _journal_put(trades_table, record), *extra_items]):
+            return record, new_balance
+        _backoff(attempt)
+
+    raise TradeConflict('Account changed during the trade, please retry')
+
+
+def execute_sell(users_table, trades_table, user_id, symbol, quantity, price, username=None,
+                  timestamp=None, journal_fields=None, extra_items=()):
+    """
+    Sell atomically. Returns (trade_record, new_balance); the blind update cannot return
+    the balance, so it is read right after the commit (later trades may be included).
+    Raises TradeRejected on insufficient shares, TradeConflict if retries run out.
+    extra_items are added to the same transaction, as for execute_buy.
+    """
+    record = trade_record(user_id, symbol, 'sell', quantity, price, timestamp)
+    record.update(journal_fields or {})
+
+    closes = False
+    for attempt in range(MAX_ATTEMPTS):
+        update = sell_update(users_table, user_id, symbol, quantity, price, username, closes)
+        if _transact(users_table, [update, _journal_put(trades_table, record), *extra_items]):
+            return record, _read_balance(users_table, user_id)
+
+        # Only read on failure, to tell a real shortfall or a closing sell from a busy item
+        position = _position(get_user(users_table, user_id, username), symbol)
+        available = int(position['quantity']) if position else 0
+        if available < quantity:
+            raise TradeRejected(f'Insufficient shares. Required: {quantity}, Available: {available}')
+
+        if closes == (available == quantity):
+            _backoff(attempt)
+        closes = available == quantity
+
+    raise TradeConflict('Account changed during the trade, please retry')
+
+
+def apply_orders(user, orders, prices):
+    """
+    Apply orders [(symbol, action, quantity)] in sequence to a copy of the user's balance
+    and positions, so later legs can spend what earlier legs sold.
+    Returns (balance, {symbol: position}) for the touched symbols; raises TradeRejected.
+    """
+    balance = user['balance']
+    positions = {}
+    for index, (symbol, action, quantity) in enumerate(orders, start=1):
+        if symbol not in positions:
+            current = _position(user, symbol)
+            positions[symbol] = {
+                'quantity': int(current['quantity']) if current else 0,
+                'avg_price': Decimal(str(current['avg_price'])) if current else Decimal('0')
+            }
+        position = positions[symbol]
+        value = prices[symbol] * Decimal(str(quantity))
+
+        if action == 'buy':
+            if balance < value:
+                raise TradeRejected(
+                    f'Order {index} ({symbol}): Insufficient balance. '
+                    f'Required: ${float(value):.2f}, Available: ${float(balance):.2f}'
+                )
+            balance -= value
+            held = position['quantity']
+            position['avg_price'] = (position['avg_price'] * Decimal(held) + value) / Decimal(held + quantity)
+            position['quantity'] = held + quantity
+        else:
+            if position['quantity'] < quantity:
+                raise TradeRejected(
+                    f'Order {index} ({symbol}): Insufficient shares. '
+                    f'Required: {quantity}, Available: {position["quantity"]}'
+                )
+            balance += value
+            position['quantity'] -= quantity
+
+    return balance, positions
+
+
+def batch_update(users_table, user, orders, prices, username=None):
+    """
+    Transact item applying every order at once, conditioned on the balance and
+    positions that were read. Returns (update_item, new_balance).
+    """
+    new_balance, positions = apply_orders(user, orders, prices)
+
+    names, values = {}, {':balance': user['balance'], ':new_balance': new_balance}
+    assignments = ['balance = :new_balance']
+    removals = []
+    conditions = ['balance = :balance']
+    for i, (symbol, position) in enumerate(positions.items()):
+        names[f'#s{i}'] = symbol
+        if position['quantity'] > 0:
+            values[f':p{i}'] = position
+            assignments.append(f'portfolio.#s{i} = :p{i}')
+        else:
+            # Sold out: drop the position rather than keep it at quantity 0
+            removals.append(f'portfolio.#s{i}')
+
+        current = _position(user, symbol)
+        if current:
+            values[f':h{i}'] = int(current['quantity'])
+            conditions.append(f'portfolio.#s{i}.quantity = :h{i}')
+        else:
+            conditions.append(f'attribute_not_exists(portfolio.#s{i})')
+
+    update = _user_update(
+        users_table, user['user_id'],
+        ', '.join(assignments),
+        ' AND '.join(conditions), names, values, username, removals
+    )
+    # One trade per leg, not per batch
+    update['Update']['ExpressionAttributeValues'][':one'] = len(orders)
+    return update, new_balance
+
+
+def execute_batch(users_table, trades_table, user_id, orders, prices, username=None, extra_items=()):
+    """
+    Execute orders [(symbol, action, quantity)] for one user atomically: either every
+    leg is applied and journaled or none is. prices: {symbol: Decimal} from one snapshot.
+    extra_items are added to the same transaction, as for execute_buy.
+    Returns (trade_records, new_balance).
+    """
+    if not orders or len(orders) > MAX_BATCH_ORDERS:
+        raise TradeRejected(f'A batch must contain between 1 and {MAX_BATCH_ORDERS} orders')
+
+    now = int(time.time())
+    records = [
+        trade_record(user_id, symbol, action, quantity, prices[symbol], timestamp=now)
+        for symbol, action, quantity in orders
+    ]
+
+    for attempt in range(MAX_ATTEMPTS):
+        user = get_user(users_table, user_id, username)
+        update, new_balance = batch_update(users_table, user, orders, prices, username)
+        puts = [_journal_put(trades_table, record) for record in records]
+        if _transact(users_table, [update, *puts, *extra_items]):
+            return records, new_balance
+        _backoff(attempt)
+
+    raise TradeConflict('Account changed during the trade, please retry')
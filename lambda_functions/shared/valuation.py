@@ -0,0 +1,84 @@
+"""
+Bulk portfolio valuation over a sparse users x symbols holdings matrix.
+
+Holdings are stored row-compressed (CSR): for user i, the symbol columns and
+share quantities are indices[indptr[i]:indptr[i+1]] and
+quantities[indptr[i]:indptr[i+1]]. Most users hold a handful of symbols, so the
+matrix costs a few bytes per position rather than per (user, symbol) cell.
+
+Valuing every user at one price per symbol is then a gather plus a per-row sum
+(holdings @ prices), without densifying the matrix.
+"""
+import numpy as np
+
+
+class HoldingsMatrix:
+    """Cash balances and share holdings of many users, one row per user"""
+
+    def __init__(self, user_ids, balances, indptr, indices, quantities, symbols):
+        self.user_ids = user_ids
+        self.balances = balances
+        self.indptr = indptr
+        self.indices = indices
+        self.quantities = quantities
+        self.symbols = symbols
+
+    @classmethod
+    def from_users(cls, users, symbols, default_balance=0):
+        """
+        Build the matrix from user items ({user_id, balance, portfolio}).
+        Positions in symbols outside `symbols`, and emptied positions, are left out.
+        """
+        columns = {symbol: column for column, symbol in enumerate(symbols)}
+        user_ids, balances, indptr, indices, quantities = [], [], [0], [], []
+
+        for user in users:
+            user_ids.append(user['user_id'])
+            balances.append(float(user.get('balance', default_balance)))
+            for symbol, holding in user.get('portfolio', {}).items():
+                quantity = int(holding.get('quantity', 0))
+                if quantity > 0 and symbol in columns:
+                    indices.append(columns[symbol])
+                    quantities.append(quantity)
+            indptr.append(len(indices))
+
+        return cls(
+            user_ids,
+            np.asarray(balances, dtype=np.float64),
+            np.asarray(indptr, dtype=np.int64),
+            np.asarray(indices, dtype=np.int64),
+            np.asarray(quantities, dtype=np.float64),
+            list(symbols)
+        )
+
+    def __len__(self):
+        return len(self.user_ids)
+
+    def _rows(self):
+        """Row number of every stored position"""
+        return np.repeat(np.arange(len(self)), np.diff(self.indptr))
+
+    def portfolio_values(self, prices):
+        """Market value of every user's holdings at one price per symbol"""
+        prices = np.asarray(prices, dtype=np.float64)
+        weights = self.quantities * prices[self.indices]
+        return np.bincount(self._rows(), weights=weights, minlength=len(self))
+
+    def equity(self, prices):
+        """Cash plus holdings for every user at one price per symbol"""
+        return self.balances + self.portfolio_values(prices)
+
+
+def window_prices(window, symbols, second):
+    """Price vector for `symbols` at one second of a simulation window (0 if unpriced)"""
+    return np.array([
+        window.price_at(symbol, second) if window.has_prices(symbol) else 0.0
+        for symbol in symbols
+    ], dtype=np.float64)
+
+
+def priced_symbols(window):
+    """Symbols of a window that have a simulated price path"""
+    if not window:
+        return []
+    return [symbol for symbol in window.symbols if window.asset(symbol) and window.has_prices(symbol)]
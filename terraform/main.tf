@@ -14,6 +14,109 @@ resource "aws_s3_bucket_versioning" "market_data" {
   }
 }
 
+# Collected price history is written as one small segment per minute and
+# periodically compacted into snapshots; old pieces are no longer read.
+# Simulation ring slots are rewritten in place, so only old versions expire.
+resource "aws_s3_bucket_lifecycle_configuration" "market_data" {
+  bucket = aws_s3_bucket.market_data.id
+
+  rule {
+    id     = "expire-history-segments"
+    status = "Enabled"
+
+    filter {
+      prefix = "collected_prices/segments/"
+    }
+
+    expiration {
+      days = 1
+    }
+
+    noncurrent_version_expiration {
+      noncurrent_days = 1
+    }
+  }
+
+  rule {
+    id     = "expire-history-snapshots"
+    status = "Enabled"
+
+    filter {
+      prefix = "collected_prices/snapshots/"
+    }
+
+    expiration {
+      days = 7
+    }
+
+    noncurrent_version_expiration {
+      noncurrent_days = 1
+    }
+  }
+
+  # Ring slots and the ring manifest are overwritten every window
+  rule {
+    id     = "expire-overwritten-sim-slots"
+    status = "Enabled"
+
+    filter {
+      prefix = "simulated_data/slots/"
+    }
+
+    noncurrent_version_expiration {
+      noncurrent_days = 1
+    }
+  }
+
+  # Period-start equity snapshots are only read during their own day
+  rule {
+    id     = "expire-leaderboard-equity"
+    status = "Enabled"
+
+    filter {
+      prefix = "leaderboard/equity/"
+    }
+
+    expiration {
+      days = 2
+    }
+
+    noncurrent_version_expiration {
+      noncurrent_days = 1
+    }
+  }
+
+  # The activity signal is rewritten by every heartbeat and session check
+  rule {
+    id     = "expire-overwritten-activity"
+    status = "Enabled"
+
+    filter {
+      prefix = "activity/"
+    }
+
+    noncurrent_version_expiration {
+      noncurrent_days = 1
+    }
+  }
+
+  # Rank indexes and equity snapshots live here; rank indexes are overwritten on every re-mark
+  rule {
+    id     = "expire-overwritten-leaderboard-objects"
+    status = "Enabled"
+
+    filter {
+      prefix = "leaderboard/"
+    }
+
+    noncurrent_version_expiration {
+      noncurrent_days = 1
+    }
+  }
+
+  depends_on = [aws_s3_bucket_versioning.market_data]
+}
+
 # Bucket for AI-generated news
 resource "aws_s3_bucket" "news_data" {
   bucket = "${var.project_name}-news-${var.environment}"
@@ -26,6 +129,26 @@ resource "aws_s3_bucket_versioning" "news_data" {
   }
 }
 
+resource "aws_s3_bucket_lifecycle_configuration" "news_data" {
+  bucket = aws_s3_bucket.news_data.id
+
+  # The article pool is rewritten on every news run and refill
+  rule {
+    id     = "expire-overwritten-article-pool"
+    status = "Enabled"
+
+    filter {
+      prefix = "cache/"
+    }
+
+    noncurrent_version_expiration {
+      noncurrent_days = 1
+    }
+  }
+
+  depends_on = [aws_s3_bucket_versioning.news_data]
+}
+
 # Bucket for Lambda deployment packages
 resource "aws_s3_bucket" "lambda_artifacts" {
   bucket = "${var.project_name}-lambda-artifacts-${var.environment}"
@@ -41,6 +164,10 @@ resource "aws_dynamodb_table" "users" {
   billing_mode   = "PAY_PER_REQUEST"
   hash_key       = "user_id"
 
+  # Balance/holdings changes feed the incremental leaderboard updater
+  stream_enabled   = true
+  stream_view_type = "NEW_IMAGE"
+
   attribute {
     name = "user_id"
     type = "S"
@@ -119,6 +246,54 @@ resource "aws_dynamodb_table" "trades" {
     range_key       = "timestamp"
     projection_type = "ALL"
   }
+
+  # Only quote claims (quote#<id>, see quote_signing) expire; trades never do
+  ttl {
+    attribute_name = "expires_at"
+    enabled        = true
+  }
+}
+
+# Orders table - resting limit/stop orders until they fill or are cancelled
+resource "aws_dynamodb_table" "orders" {
+  name           = "${var.project_name}-orders-${var.environment}"
+  billing_mode   = "PAY_PER_REQUEST"
+  hash_key       = "order_id"
+
+  attribute {
+    name = "order_id"
+    type = "S"
+  }
+
+  attribute {
+    name = "user_id"
+    type = "S"
+  }
+
+  attribute {
+    name = "open_symbol"
+    type = "S"
+  }
+
+  attribute {
+    name = "created_at"
+    type = "N"
+  }
+
+  # Sparse: only open orders carry open_symbol
+  global_secondary_index {
+    name            = "OpenOrdersIndex"
+    hash_key        = "open_symbol"
+    range_key       = "created_at"
+    projection_type = "ALL"
+  }
+
+  global_secondary_index {
+    name            = "UserIdIndex"
+    hash_key        = "user_id"
+    range_key       = "created_at"
+    projection_type = "ALL"
+  }
 }
 
 # Leaderboard table - stores user rankings
@@ -149,6 +324,12 @@ resource "aws_dynamodb_table" "leaderboard" {
     range_key       = "total_profit"
     projection_type = "ALL"
   }
+
+  # Superseded ranking snapshots expire on their own
+  ttl {
+    attribute_name = "ttl"
+    enabled        = true
+  }
 }
 
 # ============================================================================
@@ -200,6 +381,7 @@ resource "aws_iam_role_policy" "lambda_policy" {
           "dynamodb:PutItem",
           "dynamodb:UpdateItem",
           "dynamodb:DeleteItem",
+          "dynamodb:BatchWriteItem",
           "dynamodb:Query",
           "dynamodb:Scan"
         ]
@@ -211,7 +393,9 @@ resource "aws_iam_role_policy" "lambda_policy" {
           aws_dynamodb_table.trades.arn,
           "${aws_dynamodb_table.trades.arn}/index/*",
           aws_dynamodb_table.leaderboard.arn,
-          "${aws_dynamodb_table.leaderboard.arn}/index/*"
+          "${aws_dynamodb_table.leaderboard.arn}/index/*",
+          aws_dynamodb_table.orders.arn,
+          "${aws_dynamodb_table.orders.arn}/index/*"
         ]
       },
       {
@@ -222,6 +406,27 @@ resource "aws_iam_role_policy" "lambda_policy" {
           "logs:PutLogEvents"
         ]
         Resource = "arn:aws:logs:*:*:*"
+      },
+      {
+        Effect = "Allow"
+        Action = [
+          "dynamodb:DescribeStream",
+          "dynamodb:GetRecords",
+          "dynamodb:GetShardIterator",
+          "dynamodb:ListStreams"
+        ]
+        Resource = "${aws_dynamodb_table.users.arn}/stream/*"
+      },
+      {
+        Effect = "Allow"
+        Action = [
+          "lambda:InvokeFunction"
+        ]
+        # api_get_prices wakes the idle pipeline up (see PIPELINE_WAKE_FUNCTIONS)
+        Resource = [
+          aws_lambda_function.price_simulator.arn,
+          aws_lambda_function.news_generator.arn
+        ]
       }
     ]
   })
@@ -323,6 +528,7 @@ resource "aws_lambda_function" "price_collector" {
     variables = {
       MARKET_DATA_BUCKET = aws_s3_bucket.market_data.id
       ASSETS_TO_TRACK    = jsonencode(var.assets_to_track)
+      IDLE_AFTER_SECONDS = var.idle_after_seconds
     }
   }
 }
@@ -361,6 +567,12 @@ resource "aws_lambda_function" "price_simulator" {
   environment {
     variables = {
       MARKET_DATA_BUCKET = aws_s3_bucket.market_data.id
+      USERS_TABLE        = aws_dynamodb_table.users.name
+      TRADES_TABLE       = aws_dynamodb_table.trades.name
+      ORDERS_TABLE       = aws_dynamodb_table.orders.name
+      INITIAL_BALANCE    = var.initial_balance
+      IDLE_AFTER_SECONDS = var.idle_after_seconds
+      ASSETS_TO_TRACK    = jsonencode(var.assets_to_track)
     }
   }
 }
@@ -381,10 +593,17 @@ resource "aws_lambda_function" "news_generator" {
       HUGGINGFACE_API_KEY = var.huggingface_api_key
       MARKET_DATA_BUCKET  = aws_s3_bucket.market_data.id
       NEWS_BUCKET         = aws_s3_bucket.news_data.id
+      IDLE_AFTER_SECONDS  = var.idle_after_seconds
     }
   }
 }
 
+# Shared secret api_get_prices signs price quotes with and api_execute_trade verifies
+resource "random_password" "quote_signing_key" {
+  length  = 48
+  special = false
+}
+
 # API handler - Get prices
 resource "aws_lambda_function" "api_get_prices" {
   filename         = "${path.module}/../lambda_packages/api_get_prices.zip"
@@ -399,6 +618,13 @@ resource "aws_lambda_function" "api_get_prices" {
   environment {
     variables = {
       MARKET_DATA_BUCKET = aws_s3_bucket.market_data.id
+      QUOTE_SIGNING_KEY  = random_password.quote_signing_key.result
+      IDLE_AFTER_SECONDS = var.idle_after_seconds
+      # Started right away when the first player shows up after an idle spell
+      PIPELINE_WAKE_FUNCTIONS = join(",", [
+        aws_lambda_function.price_simulator.function_name,
+        aws_lambda_function.news_generator.function_name
+      ])
     }
   }
 }
@@ -434,9 +660,12 @@ resource "aws_lambda_function" "api_execute_trade" {
 
   environment {
     variables = {
-      USERS_TABLE  = aws_dynamodb_table.users.name
-      TRADES_TABLE = aws_dynamodb_table.trades.name
+      USERS_TABLE        = aws_dynamodb_table.users.name
+      TRADES_TABLE       = aws_dynamodb_table.trades.name
       MARKET_DATA_BUCKET = aws_s3_bucket.market_data.id
+      QUOTE_SIGNING_KEY  = random_password.quote_signing_key.result
+      ORDERS_TABLE       = aws_dynamodb_table.orders.name
+      INITIAL_BALANCE    = var.initial_balance
     }
   }
 }
@@ -454,9 +683,10 @@ resource "aws_lambda_function" "api_get_portfolio" {
 
   environment {
     variables = {
-      USERS_TABLE  = aws_dynamodb_table.users.name
-      TRADES_TABLE = aws_dynamodb_table.trades.name
+      USERS_TABLE        = aws_dynamodb_table.users.name
+      TRADES_TABLE       = aws_dynamodb_table.trades.name
       MARKET_DATA_BUCKET = aws_s3_bucket.market_data.id
+      INITIAL_BALANCE    = var.initial_balance
     }
   }
 }
@@ -472,15 +702,65 @@ resource "aws_lambda_function" "api_get_leaderboard" {
   timeout         = 30
   memory_size     = 256
 
+  environment {
+    variables = {
+      LEADERBOARD_TABLE  = aws_dynamodb_table.leaderboard.name
+      MARKET_DATA_BUCKET = aws_s3_bucket.market_data.id
+    }
+  }
+}
+
+# Leaderboard ranker - ranks every user and publishes the snapshot api_get_leaderboard reads
+resource "aws_lambda_function" "leaderboard_ranker" {
+  filename         = "${path.module}/../lambda_packages/leaderboard_ranker.zip"
+  function_name    = "${var.project_name}-leaderboard-ranker-${var.environment}"
+  role            = aws_iam_role.lambda_execution_role.arn
+  handler         = "leaderboard_ranker.lambda_handler"
+  source_code_hash = fileexists("${path.module}/../lambda_packages/leaderboard_ranker.zip") ? filebase64sha256("${path.module}/../lambda_packages/leaderboard_ranker.zip") : null
+  runtime         = "python3.11"
+  timeout         = 300
+  memory_size     = 1024
+
   environment {
     variables = {
       LEADERBOARD_TABLE  = aws_dynamodb_table.leaderboard.name
       USERS_TABLE        = aws_dynamodb_table.users.name
       MARKET_DATA_BUCKET = aws_s3_bucket.market_data.id
+      INITIAL_BALANCE    = var.initial_balance
+      IDLE_AFTER_SECONDS = var.idle_after_seconds
+    }
+  }
+}
+
+# Leaderboard updater - applies user changes from the users table stream between full re-marks
+resource "aws_lambda_function" "leaderboard_updater" {
+  filename         = "${path.module}/../lambda_packages/leaderboard_updater.zip"
+  function_name    = "${var.project_name}-leaderboard-updater-${var.environment}"
+  role            = aws_iam_role.lambda_execution_role.arn
+  handler         = "leaderboard_updater.lambda_handler"
+  source_code_hash = fileexists("${path.module}/../lambda_packages/leaderboard_updater.zip") ? filebase64sha256("${path.module}/../lambda_packages/leaderboard_updater.zip") : null
+  runtime         = "python3.11"
+  timeout         = 60
+  memory_size     = 256
+
+  environment {
+    variables = {
+      LEADERBOARD_TABLE  = aws_dynamodb_table.leaderboard.name
+      MARKET_DATA_BUCKET = aws_s3_bucket.market_data.id
+      INITIAL_BALANCE    = var.initial_balance
     }
   }
 }
 
+resource "aws_lambda_event_source_mapping" "leaderboard_updater_users_stream" {
+  event_source_arn                   = aws_dynamodb_table.users.stream_arn
+  function_name                      = aws_lambda_function.leaderboard_updater.arn
+  starting_position                  = "LATEST"
+  batch_size                         = 100
+  maximum_batching_window_in_seconds = 1
+  maximum_retry_attempts             = 3
+}
+
 # Session checker Lambda (for news release)
 resource "aws_lambda_function" "session_checker" {
   filename         = "${path.module}/../lambda_packages/session_checker.zip"
@@ -494,7 +774,8 @@ resource "aws_lambda_function" "session_checker" {
 
   environment {
     variables = {
-      SESSIONS_TABLE = aws_dynamodb_table.sessions.name
+      SESSIONS_TABLE     = aws_dynamodb_table.sessions.name
+      MARKET_DATA_BUCKET = aws_s3_bucket.market_data.id
     }
   }
 }
@@ -574,12 +855,15 @@ resource "aws_lambda_permission" "allow_eventbridge_price_collection" {
   source_arn    = aws_cloudwatch_event_rule.price_collection.arn
 }
 
-# 10-minute rule for price simulation (PAUSED to conserve AWS Free Tier credits)
+# 10-minute rule for price simulation. Must stay enabled: prices, trades, order
+# settlement and the ranker all read the window ring, which reaches only
+# SIMULATION_WINDOWS_AHEAD windows past the last run. While nobody is online the
+# simulator skips its heavy work itself (see activity.py).
 resource "aws_cloudwatch_event_rule" "hourly_simulation" {
   name                = "${var.project_name}-simulation-${var.environment}"
   description         = "Trigger simulation pipeline every 10 minutes"
   schedule_expression = var.simulation_schedule
-  is_enabled          = false  # PAUSED - Set to true to re-enable
+  is_enabled          = true
 }
 
 resource "aws_cloudwatch_event_target" "hourly_simulation_target" {
@@ -608,6 +892,67 @@ resource "aws_lambda_permission" "allow_eventbridge_news" {
   source_arn    = aws_cloudwatch_event_rule.news_release.arn
 }
 
+# Article pool refill - pre-generates articles so news runs rarely call the model
+resource "aws_cloudwatch_event_rule" "news_pool_refill" {
+  name                = "${var.project_name}-news-pool-refill-${var.environment}"
+  description         = "Top up the pre-generated news article pool"
+  schedule_expression = var.news_pool_refill_schedule
+}
+
+resource "aws_cloudwatch_event_target" "news_pool_refill_target" {
+  rule     = aws_cloudwatch_event_rule.news_pool_refill.name
+  arn      = aws_lambda_function.news_generator.arn
+  input    = jsonencode({ mode = "refill" })
+}
+
+resource "aws_lambda_permission" "allow_eventbridge_news_pool_refill" {
+  statement_id  = "AllowExecutionFromEventBridgeNewsPoolRefill"
+  action        = "lambda:InvokeFunction"
+  function_name = aws_lambda_function.news_generator.function_name
+  principal     = "events.amazonaws.com"
+  source_arn    = aws_cloudwatch_event_rule.news_pool_refill.arn
+}
+
+# Session check rule - publishes the active session count to the activity signal
+resource "aws_cloudwatch_event_rule" "session_check" {
+  name                = "${var.project_name}-session-check-${var.environment}"
+  description         = "Count active sessions for the activity signal"
+  schedule_expression = var.session_check_schedule
+}
+
+resource "aws_cloudwatch_event_target" "session_check_target" {
+  rule     = aws_cloudwatch_event_rule.session_check.name
+  arn      = aws_lambda_function.session_checker.arn
+}
+
+resource "aws_lambda_permission" "allow_eventbridge_session_check" {
+  statement_id  = "AllowExecutionFromEventBridge"
+  action        = "lambda:InvokeFunction"
+  function_name = aws_lambda_function.session_checker.function_name
+  principal     = "events.amazonaws.com"
+  source_arn    = aws_cloudwatch_event_rule.session_check.arn
+}
+
+# Leaderboard re-mark rule - every user is revalued when a new simulation window starts
+resource "aws_cloudwatch_event_rule" "leaderboard_ranking" {
+  name                = "${var.project_name}-leaderboard-ranking-${var.environment}"
+  description         = "Re-mark every user and publish the leaderboard snapshot"
+  schedule_expression = var.leaderboard_ranking_schedule
+}
+
+resource "aws_cloudwatch_event_target" "leaderboard_ranking_target" {
+  rule     = aws_cloudwatch_event_rule.leaderboard_ranking.name
+  arn      = aws_lambda_function.leaderboard_ranker.arn
+}
+
+resource "aws_lambda_permission" "allow_eventbridge_leaderboard_ranking" {
+  statement_id  = "AllowExecutionFromEventBridge"
+  action        = "lambda:InvokeFunction"
+  function_name = aws_lambda_function.leaderboard_ranker.function_name
+  principal     = "events.amazonaws.com"
+  source_arn    = aws_cloudwatch_event_rule.leaderboard_ranking.arn
+}
+
 # ============================================================================
 # API GATEWAY
 # ============================================================================
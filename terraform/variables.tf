@@ -67,3 +67,33 @@ variable "news_release_schedule" {
   type        = string
   default     = "rate(5 minutes)"
 }
+
+variable "news_pool_refill_schedule" {
+  description = "Rate expression for topping up the pre-generated news article pool (default: every 30 minutes)"
+  type        = string
+  default     = "rate(30 minutes)"
+}
+
+variable "session_check_schedule" {
+  description = "Rate expression for counting active sessions (default: every 5 minutes)"
+  type        = string
+  default     = "rate(5 minutes)"
+}
+
+variable "idle_after_seconds" {
+  description = "Seconds without any player activity after which simulation, news and leaderboard re-marks pause"
+  type        = string
+  default     = "900"
+}
+
+variable "leaderboard_ranking_schedule" {
+  description = "Cron expression for the full leaderboard re-mark (default: at every 10-minute simulation window boundary)"
+  type        = string
+  default     = "cron(0/10 * * * ? *)"
+}
+
+variable "initial_balance" {
+  description = "Cash balance every new account starts with (also the all-time P/L baseline)"
+  type        = string
+  default     = "100000"
+}
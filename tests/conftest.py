@@ -0,0 +1,9 @@
+import os
+import sys
+
+# Lambda packages import the shared modules flat, as deploy copies them in
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'lambda_functions', 'shared'))
+
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+os.environ.setdefault('AWS_ACCESS_KEY_ID', 'testing')
+os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'testing')
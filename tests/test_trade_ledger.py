@@ -0,0 +1,115 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+import boto3
+import botocore.client
+import pytest
+from moto import mock_aws
+
+import trade_ledger
+from trade_ledger import (
+    INITIAL_BALANCE, TradeAborted, TradeRejected, execute_batch, execute_buy, execute_sell, get_user
+)
+
+PRICE = Decimal('10')
+
+
+@pytest.fixture
+def tables(monkeypatch):
+    # moto's backend is not thread-safe; serialize single API calls, which still
+    # lets reads and transactions of different threads interleave
+    lock = threading.Lock()
+    make_api_call = botocore.client.BaseClient._make_api_call
+
+    def locked(self, *args, **kwargs):
+        with lock:
+            return make_api_call(self, *args, **kwargs)
+
+    monkeypatch.setattr(botocore.client.BaseClient, '_make_api_call', locked)
+    monkeypatch.setattr(trade_ledger, 'MAX_ATTEMPTS', 50)
+
+    with mock_aws():
+        dynamodb = boto3.resource('dynamodb')
+        users = dynamodb.create_table(
+            TableName='users',
+            KeySchema=[{'AttributeName': 'user_id', 'KeyType': 'HASH'}],
+            AttributeDefinitions=[{'AttributeName': 'user_id', 'AttributeType': 'S'}],
+            BillingMode='PAY_PER_REQUEST'
+        )
+        trades = dynamodb.create_table(
+            TableName='trades',
+            KeySchema=[
+                {'AttributeName': 'trade_id', 'KeyType': 'HASH'},
+                {'AttributeName': 'timestamp', 'KeyType': 'RANGE'}
+            ],
+            AttributeDefinitions=[
+                {'AttributeName': 'trade_id', 'AttributeType': 'S'},
+                {'AttributeName': 'timestamp', 'AttributeType': 'N'}
+            ],
+            BillingMode='PAY_PER_REQUEST'
+        )
+        yield users, trades
+
+
+def test_concurrent_buys_and_sells_keep_balance_and_position(tables):
+    users, trades = tables
+    execute_buy(users, trades, 'u1', 'EURUSD', 100, PRICE)
+
+    def trade(action):
+        execute = execute_buy if action == 'buy' else execute_sell
+        try:
+            execute(users, trades, 'u1', 'EURUSD', 10, PRICE)
+            return action
+        except TradeRejected:
+            return None
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        done = list(pool.map(trade, ['buy', 'sell'] * 20))
+
+    net = 100 + 10 * (done.count('buy') - done.count('sell'))
+    user = get_user(users, 'u1')
+    assert user['balance'] == INITIAL_BALANCE - PRICE * net
+    assert int(user['portfolio']['EURUSD']['quantity']) == net
+    assert user['total_trades'] == 1 + done.count('buy') + done.count('sell')
+    assert trades.scan()['Count'] == user['total_trades']
+
+
+def test_selling_everything_removes_the_position(tables):
+    users, trades = tables
+    execute_buy(users, trades, 'u1', 'EURUSD', 5, PRICE)
+    execute_buy(users, trades, 'u1', 'GBPUSD', 5, PRICE)
+
+    execute_sell(users, trades, 'u1', 'EURUSD', 5, PRICE)
+    execute_batch(users, trades, 'u1', [('GBPUSD', 'sell', 5)], {'GBPUSD': PRICE})
+
+    user = get_user(users, 'u1')
+    assert user['portfolio'] == {}
+    assert user['balance'] == INITIAL_BALANCE
+
+
+def test_failed_condition_on_another_item_aborts_the_trade(tables):
+    users, trades = tables
+    blocked = {
+        'ConditionCheck': {
+            'TableName': users.name,
+            'Key': {'user_id': 'nobody'},
+            'ConditionExpression': 'attribute_exists(user_id)'
+        }
+    }
+
+    with pytest.raises(TradeAborted):
+        execute_buy(users, trades, 'u1', 'EURUSD', 5, PRICE, extra_items=[blocked])
+
+    user = get_user(users, 'u1')
+    assert user['balance'] == INITIAL_BALANCE
+    assert user['portfolio'] == {}
+
+
+def test_sell_returns_the_new_balance(tables):
+    users, trades = tables
+    execute_buy(users, trades, 'u1', 'EURUSD', 5, PRICE)
+
+    _, new_balance = execute_sell(users, trades, 'u1', 'EURUSD', 2, PRICE)
+
+    assert new_balance == INITIAL_BALANCE - 3 * PRICE